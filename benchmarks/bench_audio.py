@@ -0,0 +1,116 @@
+"""
+Whisper latency and billed audio for long voice notes, sent whole or trimmed and split.
+
+    python benchmarks/bench_audio.py --durations 60 300 600
+
+Voice notes are synthesized as bursts of noise-like "speech" separated by pauses, with
+silence at both ends (the recorder keeps running after the meeting ends). AudioService.analyze
+finds the speech bounds and the cut points. The segments then go through
+AudioService.transcribe against a fake Whisper whose latency grows with upload size
+(--bytes-per-second of Opus audio, --whisper-ms-per-kb).
+
+Decoding and Opus encoding (pydub/ffmpeg) are not part of the measurement. Only the
+analysis and the transcription stage are.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeOpenAIClient, FaultInjector, InMemoryIndex
+from harness import install_fakes, prepare_environment, quiet_logging, save_results
+
+FRAME_RATE = 16000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--durations", type=float, nargs="+", default=[60, 300, 600], help="note lengths in seconds")
+    parser.add_argument("--leading-silence", type=float, default=3.0)
+    parser.add_argument("--trailing-silence", type=float, default=10.0)
+    parser.add_argument("--bytes-per-second", type=int, default=4000, help="Opus voice note bitrate")
+    parser.add_argument("--whisper-ms-per-kb", type=float, default=20.0, help="fake Whisper time per KB uploaded")
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="base latency of fake OpenAI calls")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    return parser.parse_args()
+
+
+def synthesize(duration: float, args, rng):
+    """16-bit mono samples: speech bursts of 1-6 s with 0.2-1.5 s pauses, silence at both ends"""
+    import numpy as np
+
+    speech_seconds = duration - args.leading_silence - args.trailing_silence
+    parts = [np.zeros(int(args.leading_silence * FRAME_RATE))]
+    spoken = 0.0
+    while spoken < speech_seconds:
+        burst = min(rng.uniform(1, 6), speech_seconds - spoken)
+        envelope = 0.5 + 0.5 * np.sin(np.linspace(0, burst * 4 * np.pi, int(burst * FRAME_RATE))) ** 2
+        parts.append(rng.standard_normal(len(envelope)) * 6000 * envelope)
+        pause = rng.uniform(0.2, 1.5)
+        parts.append(rng.standard_normal(int(pause * FRAME_RATE)) * 30)
+        spoken += burst + pause
+    parts.append(np.zeros(int(args.trailing_silence * FRAME_RATE)))
+    return np.clip(np.concatenate(parts), -32768, 32767).astype(np.int16)
+
+
+async def transcribe_seconds(lengths, args) -> float:
+    from services.audio_service import audio_service
+
+    segments = [io.BytesIO(b"\0" * int(length * args.bytes_per_second)) for length in lengths]
+    started = time.perf_counter()
+    await audio_service.transcribe(segments)
+    return time.perf_counter() - started
+
+
+async def run(args) -> list:
+    import numpy as np
+    from services.audio_service import audio_service
+
+    openai_client = FakeOpenAIClient(faults=FaultInjector(latency_ms=args.latency_ms, seed=args.seed),
+                                     whisper_scale=1.0, whisper_ms_per_kb=args.whisper_ms_per_kb)
+    install_fakes(openai_client, InMemoryIndex())
+    rng = np.random.default_rng(args.seed)
+
+    results = []
+    for duration in args.durations:
+        samples = synthesize(duration, args, rng)
+        started = time.perf_counter()
+        (first, last), segments = audio_service.analyze(samples, FRAME_RATE, 32768.0)
+        analysis = time.perf_counter() - started
+
+        lengths = [(end - start) / 1000 for start, end in segments]
+        whole = await transcribe_seconds([len(samples) / FRAME_RATE], args)
+        split = await transcribe_seconds(lengths, args)
+        result = {
+            "duration_s": duration,
+            "billed_whole_s": round(len(samples) / FRAME_RATE, 1),
+            "billed_trimmed_s": round((last - first) / 1000, 1),
+            "segments": len(segments),
+            "segment_lengths_s": [round(length, 1) for length in lengths],
+            "analysis_ms": round(analysis * 1000, 1),
+            "whisper_whole_ms": round(whole * 1000, 1),
+            "whisper_split_ms": round(split * 1000, 1),
+        }
+        print(json.dumps(result))
+        results.append(result)
+    return results
+
+
+def main():
+    args = parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    prepare_environment()
+    quiet_logging()
+    results = asyncio.run(run(args))
+    path = save_results("audio", vars(args), results, output)
+    print(f"Saved results to {path}")
+
+
+if __name__ == "__main__":
+    main()
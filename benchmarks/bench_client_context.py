@@ -0,0 +1,216 @@
+"""
+Follow-up meetings with and without the per-client context cache.
+
+    python benchmarks/bench_client_context.py --clients 30 --follow-ups 3 --meetings 200000
+
+Each client has a product topic. Their first voice note describes it in detail; later
+notes only name the client ("Зустріч з Іваном Петренком"), as advisors do at a follow-up.
+After every answer the client is saved, which records a meeting and invalidates the
+cached profile; the bot then prewarms it. Runs RAGService.process_audio_query with CLIENT_CONTEXT_ENABLED off and
+on and reports, for follow-ups: context precision (share of passages in the prompt from
+the client's topic), follow-ups answered with no passage at all, passages scored by the
+reranker, profile cache hits and latency.
+
+It also times get_client_meetings on a database with --meetings rows, with and without
+the (client_id, meeting_date) index.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeOpenAIClient, FaultInjector, InMemoryIndex
+from harness import install_fakes, prepare_environment, quiet_logging, save_results, summarize_latencies
+
+TOPICS = {
+    "пенсія": ["пенсія", "накопичення", "внесок", "фонд", "виплата", "старість", "державна", "щомісячно"],
+    "здоров'я": ["медицина", "лікування", "страховка", "клініка", "операція", "діагностика", "лікар", "ліміт"],
+    "діти": ["освіта", "діти", "університет", "навчання", "капітал", "донька", "син", "стипендія"],
+    "інвестиції": ["інвестиції", "дохідність", "акції", "облігації", "портфель", "ризик", "прибуток", "валюта"],
+    "життя": ["життя", "захист", "сім'я", "нещасний", "випадок", "виплата", "спадок", "покриття"],
+}
+# (nominative, instrumental) forms, as a name appears in "зустріч з ..."
+FIRST_NAMES = [("Іван", "Іваном"), ("Олена", "Оленою"), ("Петро", "Петром"), ("Марія", "Марією"),
+               ("Андрій", "Андрієм"), ("Ірина", "Іриною"), ("Тарас", "Тарасом"), ("Наталія", "Наталією")]
+SURNAMES = [("Петренко", "Петренком"), ("Коваленко", "Коваленком"), ("Шевчук", "Шевчуком"),
+            ("Бондар", "Бондарем"), ("Мельник", "Мельником"), ("Ткачук", "Ткачуком")]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=30)
+    parser.add_argument("--follow-ups", type=int, default=3, help="follow-up notes per client")
+    parser.add_argument("--documents", type=int, default=150)
+    parser.add_argument("--words", type=int, default=300, help="words per document")
+    parser.add_argument("--meetings", type=int, default=200000, help="meetings in the index lookup test")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="base latency of fake OpenAI/Pinecone calls")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    return parser.parse_args()
+
+
+def make_clients(args, rng: random.Random) -> list:
+    names = [(first, last) for first in FIRST_NAMES for last in SURNAMES]
+    rng.shuffle(names)
+    clients = []
+    for (first, last) in names[:args.clients]:
+        topic = rng.choice(list(TOPICS))
+        clients.append({
+            "full_name": f"{first[0]} {last[0]}",
+            "mention": f"{first[1]} {last[1]}",
+            "topic": topic,
+            "age": rng.randint(25, 60),
+            # The goal is a short phrase in the topic's words, as GPT extracts it
+            "goal": " ".join(rng.sample(TOPICS[topic], 4)),
+        })
+    return clients
+
+
+async def index_corpus(args, rag_service, rng: random.Random) -> dict:
+    """Chunk text -> topic of the document it came from"""
+    from services.pinecone_service import pinecone_service
+
+    for i in range(args.documents):
+        topic = list(TOPICS)[i % len(TOPICS)]
+        await rag_service.process_document(" ".join(rng.choice(TOPICS[topic]) for _ in range(args.words)), f"doc-{i}")
+    topics = {}
+    for namespace in pinecone_service.index.namespaces.values():
+        for vector in namespace.values():
+            document = int(vector["metadata"]["document_id"].split("-")[1])
+            topics[vector["metadata"]["text"]] = list(TOPICS)[document % len(TOPICS)]
+    return topics
+
+
+async def run_mode(enabled: bool, args, openai_client, topics: dict, clients: list) -> dict:
+    from services.client_context import client_context
+    from services.database_service import database_service
+    from services.metrics_service import metrics_service
+    from services.rag_service import rag_service
+
+    client_context.enabled = enabled
+    metrics_service.counters.pop("rerank_cache_misses_total", None)
+    metrics_service.counters.pop("client_context_requests_total", None)
+    latencies, passages, relevant, empty = [], 0, 0, 0
+    rerank_misses_before = 0
+
+    for meeting in range(args.follow_ups + 1):
+        for client in clients:
+            if meeting == 0:
+                words = " ".join(random.Random(client["full_name"]).sample(TOPICS[client["topic"]], 6))
+                openai_client.transcription = f"Клієнт {client['full_name']}, {client['age']} років, цікавить {words}"
+            else:
+                openai_client.transcription = f"Зустріч з {client['mention']}"
+            calls_before = len(openai_client.chat_calls)
+            started = time.perf_counter()
+            result = await rag_service.process_audio_query(io.BytesIO(b"voice"))
+            elapsed = time.perf_counter() - started
+
+            # The advisor saves the client after every meeting, confirming the recognised one, and the bot prewarms their profile
+            client_id = await database_service.save_client({
+                "full_name": client["full_name"], "age": client["age"], "product_type": client["topic"],
+                "goal": client["goal"], "description": result["transcription"], "client_id": result["client_id"],
+            })
+            if enabled:
+                await client_context.prewarm(client_id)
+            if meeting == 0:
+                rerank_misses_before = sum(metrics_service.get_counter("rerank_cache_misses_total").values())
+                continue
+
+            latencies.append(elapsed)
+            # The answer call is the one whose prompt carries the context; rerank calls may use the same model
+            prompt = [call["messages"][-1]["content"] for call in openai_client.chat_calls[calls_before:]
+                      if call["messages"][-1]["content"].startswith("Context: ")][-1]
+            context = prompt.split("\n\nQuery:")[0][len("Context: "):]
+            found = [topics[passage] for passage in context.split("\n\n") if passage in topics]
+            passages += len(found)
+            relevant += sum(1 for topic in found if topic == client["topic"])
+            empty += not found
+
+    follow_ups = args.follow_ups * len(clients)
+    misses = sum(metrics_service.get_counter("rerank_cache_misses_total").values()) - rerank_misses_before
+    cache = metrics_service.get_counter("client_context_requests_total")
+    hits = sum(value for labels, value in cache.items() if dict(labels)["result"] == "hit")
+    return {
+        "client_context": enabled,
+        "follow_up_latency": summarize_latencies(latencies),
+        "context_precision": round(relevant / passages, 3) if passages else None,
+        "follow_ups_without_passages": empty,
+        "passages_reranked_per_follow_up": round(misses / follow_ups, 2),
+        "profile_cache_hit_rate": round(hits / sum(cache.values()), 3) if cache else None,
+    }
+
+
+def time_meeting_lookups(args) -> dict:
+    """get_client_meetings(limit=3) on a large meetings table, with and without its index"""
+    from services.database_service import database_service
+
+    rng = random.Random(args.seed)
+    with sqlite3.connect(database_service.db_path) as conn:
+        conn.executemany(
+            "INSERT INTO meetings (client_id, meeting_date, meeting_type, notes) VALUES (?, ?, ?, ?)",
+            ((rng.randint(1, 5000), f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}", "Follow-up", "нотатки")
+             for _ in range(args.meetings))
+        )
+    client_ids = [rng.randint(1, 5000) for _ in range(200)]
+
+    def lookups() -> float:
+        started = time.perf_counter()
+        for client_id in client_ids:
+            asyncio.run(database_service.get_client_meetings(client_id, limit=3))
+        return (time.perf_counter() - started) / len(client_ids)
+
+    indexed = lookups()
+    with sqlite3.connect(database_service.db_path) as conn:
+        conn.execute("DROP INDEX idx_meetings_client_date")
+    unindexed = lookups()
+    with sqlite3.connect(database_service.db_path) as conn:
+        conn.execute("CREATE INDEX idx_meetings_client_date ON meetings (client_id, meeting_date DESC, id DESC)")
+    return {
+        "meetings": args.meetings,
+        "lookup_ms_indexed": round(indexed * 1000, 3),
+        "lookup_ms_unindexed": round(unindexed * 1000, 3),
+    }
+
+
+async def run(args) -> list:
+    from services.database_service import database_service
+    from services.rag_service import rag_service
+
+    rng = random.Random(args.seed)
+    openai_client = FakeOpenAIClient(faults=FaultInjector(latency_ms=args.latency_ms, seed=args.seed))
+    install_fakes(openai_client, InMemoryIndex(faults=FaultInjector(latency_ms=args.latency_ms / 2, seed=args.seed + 1)))
+    topics = await index_corpus(args, rag_service, rng)
+
+    results = []
+    for enabled in (False, True):
+        # Each mode starts from an empty client database
+        with sqlite3.connect(database_service.db_path) as conn:
+            conn.execute("DELETE FROM meetings")
+            conn.execute("DELETE FROM clients")
+        result = await run_mode(enabled, args, openai_client, topics, make_clients(args, random.Random(args.seed)))
+        print(json.dumps(result))
+        results.append(result)
+    return results
+
+
+def main():
+    args = parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    prepare_environment()
+    quiet_logging()
+    results = asyncio.run(run(args))
+    lookups = time_meeting_lookups(args)
+    print(json.dumps(lookups))
+    path = save_results("client_context", vars(args), results + [lookups], output)
+    print(f"Saved results to {path}")
+
+
+if __name__ == "__main__":
+    main()
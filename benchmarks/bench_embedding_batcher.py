@@ -0,0 +1,105 @@
+"""
+Query embedding latency and API calls with and without the embedding coalescer.
+
+    python benchmarks/bench_embedding_batcher.py --queries 300 --rate 150 --documents 10
+
+Voice queries arrive as a Poisson stream (--rate per second) and each embeds one
+transcription, while --documents documents are ingested concurrently. The fake
+embeddings endpoint takes --latency-ms per call plus 1% more per input, so one call
+with many inputs is far cheaper than many single-input calls. The SDK calls run in
+the default thread pool, as in production.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeOpenAIClient, FaultInjector, InMemoryIndex, UpdateGenerator, FakeBot
+from harness import install_fakes, prepare_environment, quiet_logging, save_results, summarize_latencies
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--rate", type=float, default=150.0, help="query arrivals per second")
+    parser.add_argument("--documents", type=int, default=10, help="documents ingested during the run")
+    parser.add_argument("--words", type=int, default=20000, help="words per document")
+    parser.add_argument("--latency-ms", type=float, default=80.0, help="fake embeddings call latency")
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    return parser.parse_args()
+
+
+async def run_mode(coalesce: bool, args, openai_client, updates) -> dict:
+    from services.embedding_batcher import embedding_batcher
+    from services.rag_service import rag_service
+
+    embedding_batcher.enabled = coalesce
+    rng = random.Random(args.seed)
+    calls_before = openai_client.embedding_calls
+    query_latencies = []
+
+    async def query(i: int):
+        started = time.perf_counter()
+        await embedding_batcher.embed([f"{updates.text(30)} {i}"])
+        query_latencies.append(time.perf_counter() - started)
+
+    async def queries():
+        tasks = []
+        for i in range(args.queries):
+            tasks.append(asyncio.create_task(query(i)))
+            await asyncio.sleep(rng.expovariate(args.rate))
+        await asyncio.gather(*tasks)
+
+    async def ingest(i: int):
+        await rag_service.process_document(updates.text(args.words), f"doc-{coalesce}-{i}")
+
+    started = time.perf_counter()
+    queries_task = asyncio.create_task(queries())
+    ingest_started = time.perf_counter()
+    await asyncio.gather(*(ingest(i) for i in range(args.documents)))
+    ingest_seconds = time.perf_counter() - ingest_started
+    await queries_task
+    elapsed = time.perf_counter() - started
+
+    return {
+        "coalesce": coalesce,
+        "query_embedding_latency": summarize_latencies(query_latencies),
+        "embedding_api_calls": openai_client.embedding_calls - calls_before,
+        "ingest_seconds": round(ingest_seconds, 3),
+        "elapsed_seconds": round(elapsed, 3),
+    }
+
+
+async def run(args) -> list:
+    faults = FaultInjector(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=args.seed)
+    openai_client = FakeOpenAIClient(faults=faults)
+    install_fakes(openai_client, InMemoryIndex())
+    updates = UpdateGenerator(FakeBot(), seed=args.seed)
+
+    results = []
+    for coalesce in (False, True):
+        result = await run_mode(coalesce, args, openai_client, updates)
+        print(json.dumps(result))
+        results.append(result)
+    return results
+
+
+def main():
+    args = parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    prepare_environment()
+    quiet_logging()
+    results = asyncio.run(run(args))
+    path = save_results("embedding_batcher", vars(args), results, output)
+    print(f"Saved results to {path}")
+
+
+if __name__ == "__main__":
+    main()
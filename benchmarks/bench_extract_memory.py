@@ -0,0 +1,136 @@
+"""
+Compare peak memory of full-workbook extraction with the streaming extractors.
+
+    python benchmarks/bench_extract_memory.py --rows 20000 50000 100000
+
+For every size a spreadsheet is generated once, then each mode runs in a fresh
+interpreter so the peak RSS belongs to that mode alone:
+
+  full       openpyxl.load_workbook() with the whole sheet joined into one string
+             (how the bot extracted spreadsheets before)
+  streaming  bot.iter_text_from_xlsx() fed through RAGService._iter_chunks()
+  ingest     bot.iter_text_from_xlsx() fed through IngestBatch.add(), with embedding
+             and upserts replaced by a no-op so only the ingest pipeline is measured
+
+Streaming and ingest peak RSS should stay flat as the row count grows.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import FAKE_ENV, SRC_DIR, save_results
+
+FULL_SCRIPT = """
+import json, sys, resource
+import openpyxl
+wb = openpyxl.load_workbook(sys.argv[1])
+text = ""
+for ws in wb.worksheets:
+    for row in ws.rows:
+        text += " ".join(str(cell.value) for cell in row if cell.value is not None) + "\\n"
+words = len(text.split())
+print(json.dumps({"words": words, "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+"""
+
+STREAMING_SCRIPT = """
+import json, sys, resource
+import bot
+from services.rag_service import rag_service
+chunks = 0
+with open(sys.argv[1], "rb") as file:
+    for chunk, _ in rag_service._iter_chunks(bot.iter_text_from_xlsx(file)):
+        chunks += 1
+print(json.dumps({"chunks": chunks, "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+"""
+
+INGEST_SCRIPT = """
+import asyncio, json, sys, resource
+import bot
+from services.rag_service import rag_service
+
+async def store_chunks(chunks):
+    pass
+
+async def main():
+    rag_service._store_chunks = store_chunks
+    with open(sys.argv[1], "rb") as file:
+        async with rag_service.ingest_batch() as batch:
+            return await batch.add(bot.iter_text_from_xlsx(file), "sheet")
+
+chunks = asyncio.run(main())
+print(json.dumps({"chunks": chunks, "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+"""
+
+BASELINE_SCRIPT = """
+import json, resource
+import bot, openpyxl
+from services.rag_service import rag_service
+print(json.dumps({"peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+"""
+
+
+def generate_workbook(path: str, rows: int, columns: int):
+    import openpyxl
+
+    # write_only keeps generation itself from needing the whole sheet in memory
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet("Clients")
+    ws.append([f"Column {column}" for column in range(columns)])
+    for row in range(rows):
+        ws.append([f"client-{row}-{column} value" if column % 2 else row * column for column in range(columns)])
+    wb.save(path)
+
+
+def _run(script: str, *args: str) -> dict:
+    env = dict(os.environ)
+    env.update(FAKE_ENV)
+    env["PYTHONPATH"] = SRC_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    with tempfile.TemporaryDirectory() as workdir:
+        result = subprocess.run(
+            [sys.executable, "-c", script, *args], cwd=workdir, env=env,
+            capture_output=True, text=True, check=True,
+        )
+    sample = json.loads(result.stdout.strip().splitlines()[-1])
+    sample["peak_rss_mb"] = round(sample.pop("peak_rss_kib") / 1024, 2)
+    return sample
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[20000, 50000, 100000])
+    parser.add_argument("--columns", type=int, default=8)
+    parser.add_argument("--output")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    baseline = _run(BASELINE_SCRIPT)
+    print(json.dumps({"baseline_peak_rss_mb": baseline["peak_rss_mb"]}))
+
+    results = {"baseline_peak_rss_mb": baseline["peak_rss_mb"], "runs": []}
+    with tempfile.TemporaryDirectory() as workdir:
+        for rows in args.rows:
+            path = os.path.join(workdir, f"sheet-{rows}.xlsx")
+            generate_workbook(path, rows, args.columns)
+            run = {
+                "rows": rows,
+                "file_mb": round(os.path.getsize(path) / (1024 * 1024), 2),
+                "full": _run(FULL_SCRIPT, path),
+                "streaming": _run(STREAMING_SCRIPT, path),
+                "ingest": _run(INGEST_SCRIPT, path),
+            }
+            print(json.dumps(run))
+            results["runs"].append(run)
+
+    path = save_results("extract_memory", vars(args), results, os.path.abspath(args.output) if args.output else None)
+    print(f"Saved results to {path}")
+
+
+if __name__ == "__main__":
+    main()
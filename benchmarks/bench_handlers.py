@@ -0,0 +1,98 @@
+"""
+Drive bot.handle_voice and bot.handle_document against local fakes.
+
+    python benchmarks/bench_handlers.py --scenario voice --requests 200 --concurrency 20
+    python benchmarks/bench_handlers.py --scenario document --words 20000 --latency-ms 50
+
+Reports throughput, latency percentiles, event-loop lag and peak RSS, and saves
+the results as JSON under benchmarks/results/ for comparison across changes.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeBot, FakeOpenAIClient, FaultInjector, InMemoryIndex, UpdateGenerator
+from harness import install_fakes, prepare_environment, quiet_logging, run_concurrently, save_results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=["voice", "document", "mixed"], default="voice")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--users", type=int, default=50, help="distinct advisors sending updates")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="base latency of fake OpenAI/Pinecone calls")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--token-latency-ms", type=float, default=0.5, help="fake GPT time per output token")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake upstream calls that fail")
+    parser.add_argument("--telegram-latency-ms", type=float, default=5.0)
+    parser.add_argument("--dimensions", type=int, default=256, help="fake embedding size")
+    parser.add_argument("--words", type=int, default=5000, help="words per generated document")
+    parser.add_argument("--voice-duration", type=int, default=30)
+    parser.add_argument("--seed-documents", type=int, default=20, help="documents indexed before the run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<name>-<time>.json)")
+    return parser.parse_args()
+
+
+async def run(args) -> dict:
+    import bot
+    from services.rag_service import rag_service
+
+    faults = FaultInjector(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                           error_rate=args.error_rate, seed=args.seed)
+    openai_client = FakeOpenAIClient(faults=faults, dimensions=args.dimensions,
+                                     token_latency_ms=args.token_latency_ms)
+    index = InMemoryIndex(faults=FaultInjector(latency_ms=args.latency_ms / 2, seed=args.seed + 1))
+    install_fakes(openai_client, index)
+
+    telegram = FakeBot(download_latency_ms=args.telegram_latency_ms, api_latency_ms=args.telegram_latency_ms)
+    updates = UpdateGenerator(telegram, users=args.users, seed=args.seed)
+
+    # Give voice queries something to retrieve
+    for i in range(args.seed_documents):
+        await rag_service.process_document(updates.text(args.words), f"seed-{i}")
+
+    async def voice_call(i: int):
+        update = updates.voice_update(duration=args.voice_duration)
+        await bot.handle_voice(update, updates.context_for(update))
+
+    async def document_call(i: int):
+        update = updates.document_update(words=args.words)
+        await bot.handle_document(update, updates.context_for(update))
+
+    async def mixed_call(i: int):
+        await (document_call(i) if i % 5 == 0 else voice_call(i))
+
+    call = {"voice": voice_call, "document": document_call, "mixed": mixed_call}[args.scenario]
+    results = await run_concurrently(call, args.requests, args.concurrency)
+    results["upstream"] = {
+        "openai_calls": faults.calls,
+        "injected_failures": faults.failures,
+        "embedding_calls": openai_client.embedding_calls,
+        "chat_calls": len(openai_client.chat_calls),
+    }
+    results["telegram"] = {
+        "messages_sent": telegram.sent_messages,
+        "failure_replies": telegram.failure_replies,
+    }
+    return results
+
+
+def main():
+    args = parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    prepare_environment()
+    quiet_logging()
+    results = asyncio.run(run(args))
+    path = save_results(f"handlers-{args.scenario}", vars(args), results, output)
+    print(json.dumps(results, ensure_ascii=False, indent=2))
+    print(f"Saved results to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Logging overhead per voice request.
+
+    python benchmarks/bench_logging.py --requests 200 --transcription-words 700
+
+Runs bot.handle_voice sequentially against zero-latency fakes under each logging setup:
+
+    off          no sinks, the baseline
+    legacy       the previous setup: loguru's default stderr sink plus synchronous
+                 logs/app.log and bot.log files
+    structured   services.logging_setup: JSON lines via a background writer, payloads truncated
+    sampled      structured, keeping 10% of payload records
+
+The difference to "off" is the time logging adds to a request on the event loop.
+Long transcriptions (a 5-minute note is ~700 words) make the payload cost visible.
+Terminal output goes to /dev/null so only the logging path itself is measured.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeBot, FakeOpenAIClient, InMemoryIndex, UpdateGenerator
+from harness import install_fakes, prepare_environment, save_results
+
+MODES = ("off", "legacy", "structured", "sampled")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--transcription-words", type=int, default=700)
+    parser.add_argument("--rounds", type=int, default=3, help="runs per mode, interleaved; the median is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    return parser.parse_args()
+
+
+def configure(mode: str, devnull):
+    from loguru import logger
+    from services.logging_setup import setup_logging
+
+    logger.remove()
+    if mode == "legacy":
+        logger.configure(patcher=None)
+        logger.add(devnull)
+        logger.add("logs/app.log", level="INFO", rotation="500 MB", compression="zip")
+        logger.add("bot.log", rotation="500 MB")
+    elif mode in ("structured", "sampled"):
+        # Same records as the legacy app.log (the harness defaults LOG_LEVEL to WARNING)
+        os.environ["LOG_LEVEL"] = "INFO"
+        os.environ["LOG_PAYLOAD_SAMPLE_RATE"] = "0.1" if mode == "sampled" else "1.0"
+        stderr, sys.stderr = sys.stderr, devnull
+        try:
+            setup_logging()
+        finally:
+            sys.stderr = stderr
+
+
+def log_bytes() -> int:
+    return sum(os.path.getsize(path) for path in glob.glob("logs/*") + glob.glob("bot.log*"))
+
+
+async def run_mode(mode: str, args, updates, devnull) -> dict:
+    import bot
+    from loguru import logger
+
+    for path in glob.glob("logs/*") + glob.glob("bot.log*"):
+        os.remove(path)
+    configure(mode, devnull)
+    latencies = []
+    for _ in range(args.requests):
+        update = updates.voice_update()
+        started = time.perf_counter()
+        await bot.handle_voice(update, updates.context_for(update))
+        latencies.append(time.perf_counter() - started)
+    # Flush queued records before measuring the files
+    logger.remove()
+    return {"mean_ms": statistics.mean(latencies) * 1000, "log_bytes": log_bytes()}
+
+
+async def run(args) -> list:
+    from services.rag_service import rag_service
+
+    openai_client = FakeOpenAIClient()
+    install_fakes(openai_client, InMemoryIndex())
+    updates = UpdateGenerator(FakeBot(), seed=args.seed)
+    openai_client.transcription = updates.text(args.transcription_words)
+    for i in range(5):
+        await rag_service.process_document(updates.text(2000), f"seed-{i}")
+
+    runs = {mode: [] for mode in MODES}
+    with open(os.devnull, "w") as devnull:
+        for _ in range(args.rounds):
+            for mode in MODES:
+                runs[mode].append(await run_mode(mode, args, updates, devnull))
+
+    baseline = statistics.median(run["mean_ms"] for run in runs["off"])
+    results = []
+    for mode in MODES:
+        mean_ms = statistics.median(run["mean_ms"] for run in runs[mode])
+        result = {
+            "mode": mode,
+            "request_mean_ms": round(mean_ms, 3),
+            "logging_overhead_ms": round(mean_ms - baseline, 3),
+            "log_bytes_per_request": round(statistics.median(run["log_bytes"] for run in runs[mode]) / args.requests),
+        }
+        print(json.dumps(result))
+        results.append(result)
+    return results
+
+
+def main():
+    args = parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    prepare_environment()
+    results = asyncio.run(run(args))
+    path = save_results("logging", vars(args), results, output)
+    print(f"Saved results to {path}")
+
+
+if __name__ == "__main__":
+    main()
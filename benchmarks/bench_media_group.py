@@ -0,0 +1,109 @@
+"""
+Compare album (media group) ingestion with handling the same files one by one.
+
+    python benchmarks/bench_media_group.py --albums 10 --album-size 10 --latency-ms 50
+
+one_by_one  every file is a separate update, handled sequentially as python-telegram-bot
+            does by default: one status message, embeddings call and upsert per file
+album       files share a media_group_id and are ingested as one batch: parallel
+            download/extraction, chunks embedded and upserted in full-size batches,
+            one status message per album
+
+Documents get a random size between --min-words and --max-words, so most of them
+are smaller than one embedding batch.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeBot, FakeOpenAIClient, FaultInjector, InMemoryIndex, UpdateGenerator
+from harness import install_fakes, prepare_environment, quiet_logging, save_results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--albums", type=int, default=10)
+    parser.add_argument("--album-size", type=int, default=10, help="documents per album (Telegram allows up to 10)")
+    parser.add_argument("--min-words", type=int, default=300)
+    parser.add_argument("--max-words", type=int, default=3000)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="base latency of fake OpenAI/Pinecone calls")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--telegram-latency-ms", type=float, default=20.0)
+    parser.add_argument("--group-wait", type=float, default=0.2, help="MEDIA_GROUP_WAIT used by the bot")
+    parser.add_argument("--dimensions", type=int, default=256, help="fake embedding size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    return parser.parse_args()
+
+
+async def run_mode(mode: str, args) -> dict:
+    import bot
+
+    faults = FaultInjector(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=args.seed)
+    openai_client = FakeOpenAIClient(faults=faults, dimensions=args.dimensions)
+    index = InMemoryIndex(faults=FaultInjector(latency_ms=args.latency_ms / 2, seed=args.seed + 1))
+    install_fakes(openai_client, index)
+
+    telegram = FakeBot(download_latency_ms=args.telegram_latency_ms, api_latency_ms=args.telegram_latency_ms)
+    updates = UpdateGenerator(telegram, seed=args.seed)
+    # Same seed in both modes, so both ingest identical documents
+    albums = []
+    for album in range(args.albums):
+        user = updates.user()
+        albums.append([
+            updates.document_update(
+                words=updates._random.randint(args.min_words, args.max_words),
+                media_group_id=f"album-{album}" if mode == "album" else None,
+                user=user,
+            )
+            for _ in range(args.album_size)
+        ])
+
+    started = time.perf_counter()
+    for album in albums:
+        # Updates arrive back to back and are processed sequentially
+        for update in album:
+            await bot.handle_document(update, updates.context_for(update))
+    await updates.application.wait_for_tasks()
+    elapsed = time.perf_counter() - started
+
+    documents = args.albums * args.album_size
+    vectors = sum(len(namespace) for namespace in index.namespaces.values())
+    return {
+        "mode": mode,
+        "documents": documents,
+        "elapsed_s": round(elapsed, 4),
+        "throughput_docs_per_s": round(documents / elapsed, 2),
+        "vectors_stored": vectors,
+        "embedding_calls": openai_client.embedding_calls,
+        "mean_chunks_per_embedding_call": round(vectors / max(1, openai_client.embedding_calls), 2),
+        "status_messages": telegram.sent_messages,
+        "failure_replies": telegram.failure_replies,
+    }
+
+
+def main():
+    args = parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    prepare_environment()
+    os.environ["MEDIA_GROUP_WAIT"] = str(args.group_wait)
+    quiet_logging()
+
+    results = []
+    for mode in ("one_by_one", "album"):
+        result = asyncio.run(run_mode(mode, args))
+        print(json.dumps(result))
+        results.append(result)
+    results[1]["speedup"] = round(results[1]["throughput_docs_per_s"] / results[0]["throughput_docs_per_s"], 2)
+
+    path = save_results("media_group", vars(args), results, output)
+    print(f"Saved results to {path}")
+
+
+if __name__ == "__main__":
+    main()
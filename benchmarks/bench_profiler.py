@@ -0,0 +1,159 @@
+"""
+Cost of running the sampling profiler under load, and what it reports.
+
+    python benchmarks/bench_profiler.py --seconds 5 --concurrency 10
+
+For --seconds, --concurrency workers send a mix of voice notes, documents and client
+list requests (bot.handle_voice, handle_document, handle_clients) against the fakes:
+
+    off         no profiler, the baseline
+    profiler    services.profiler at the default PROFILER_INTERVAL_MS (100 ms)
+    fast        a 20 ms interval
+    aggressive  a 0.1 ms interval, so only the overhead cap limits the sampling rate
+
+Modes are interleaved over --rounds and the medians are reported, since state built up
+during a run (clients, metrics, caches) slows later runs. Throughput is compared to "off";
+overhead is the samplers' own time as a share of the run. The last profile taken at the
+default interval is saved next to the results as a .collapsed file for flamegraph.pl or speedscope.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeBot, FakeOpenAIClient, FaultInjector, InMemoryIndex, UpdateGenerator
+from harness import RESULTS_DIR, install_fakes, prepare_environment, quiet_logging, save_results, summarize_latencies
+
+MODES = {"off": None, "profiler": 100.0, "fast": 20.0, "aggressive": 0.1}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5.0, help="load duration per run")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="base latency of fake OpenAI/Pinecone calls")
+    parser.add_argument("--words", type=int, default=3000, help="words per generated document")
+    parser.add_argument("--clients", type=int, default=200, help="clients in the database for the client list")
+    parser.add_argument("--rounds", type=int, default=3, help="runs per mode, interleaved; the median is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    return parser.parse_args()
+
+
+async def run_load(args, updates) -> dict:
+    import bot
+
+    latencies = []
+    deadline = time.perf_counter() + args.seconds
+
+    async def worker(worker_id: int):
+        i = worker_id
+        while time.perf_counter() < deadline:
+            if i % 10 == 0:
+                update = updates.document_update(words=args.words)
+                handler = bot.handle_document
+            elif i % 10 in (1, 2):
+                update = updates.callback_update("clients")
+                handler = bot.handle_clients
+            else:
+                update = updates.voice_update()
+                handler = bot.handle_voice
+            started = time.perf_counter()
+            await handler(update, updates.context_for(update))
+            latencies.append(time.perf_counter() - started)
+            i += args.concurrency
+
+    started, cpu_started = time.perf_counter(), time.process_time()
+    await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "throughput_rps": len(latencies) / elapsed,
+        "cpu_ms_per_request": (time.process_time() - cpu_started) * 1000 / len(latencies),
+        "cpu_utilization": (time.process_time() - cpu_started) / elapsed,
+        "latency": summarize_latencies(latencies),
+    }
+
+
+async def run(args) -> list:
+    from services.database_service import database_service
+    from services.profiler import profiler
+    from services.rag_service import rag_service
+
+    faults = FaultInjector(latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 2, seed=args.seed)
+    openai_client = FakeOpenAIClient(faults=faults)
+    telegram = FakeBot(download_latency_ms=5, api_latency_ms=5)
+    updates = UpdateGenerator(telegram, seed=args.seed)
+    for i in range(args.clients):
+        await database_service.save_client({
+            "full_name": f"Клієнт {i}", "age": 30 + i % 40, "product_type": "поліс",
+            "goal": "накопичення", "description": updates.text(40),
+        })
+
+    runs = {mode: [] for mode in MODES}
+    reports = {}
+    for _ in range(args.rounds):
+        for mode, interval_ms in MODES.items():
+            # Ingested documents grow the index, so every run starts from the same one
+            install_fakes(openai_client, InMemoryIndex(faults=FaultInjector(latency_ms=args.latency_ms / 2)))
+            for i in range(10):
+                await rag_service.process_document(updates.text(2000), f"seed-{i}")
+            profile_task = None
+            if interval_ms is not None:
+                profiler.interval = interval_ms / 1000
+                profile_task = asyncio.create_task(profiler.profile(args.seconds))
+            load = await run_load(args, updates)
+            if profile_task is not None:
+                reports[mode] = await profile_task
+                load["overhead"] = reports[mode]["overhead"]
+            runs[mode].append(load)
+
+    baseline = statistics.median(run["throughput_rps"] for run in runs["off"])
+    results = []
+    for mode in MODES:
+        throughput = statistics.median(run["throughput_rps"] for run in runs[mode])
+        result = {
+            "mode": mode,
+            "throughput_rps": round(throughput, 2),
+            "throughput_vs_off": round(throughput / baseline, 3),
+            "cpu_ms_per_request": round(statistics.median(run["cpu_ms_per_request"] for run in runs[mode]), 3),
+            "cpu_utilization": round(statistics.median(run["cpu_utilization"] for run in runs[mode]), 3),
+            "latency_p50_ms": round(statistics.median(run["latency"]["p50_ms"] for run in runs[mode]), 3),
+            "latency_p95_ms": round(statistics.median(run["latency"]["p95_ms"] for run in runs[mode]), 3),
+        }
+        if mode in reports:
+            report = reports[mode]
+            result.update({
+                "overhead": round(statistics.median(run["overhead"] for run in runs[mode]), 4),
+                "cpu_samples": report["cpu_samples"],
+                "wall_samples": report["wall_samples"],
+                "handlers": report["handlers"],
+            })
+        print(json.dumps(result))
+        results.append(result)
+
+    report = reports["profiler"]
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"profile-{report['started_at']}.collapsed")
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(report["collapsed"])
+    print(f"Saved profile to {path}")
+    return results
+
+
+def main():
+    args = parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    prepare_environment()
+    quiet_logging()
+    results = asyncio.run(run(args))
+    path = save_results("profiler", vars(args), results, output)
+    print(f"Saved results to {path}")
+
+
+if __name__ == "__main__":
+    main()
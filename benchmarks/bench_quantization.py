@@ -0,0 +1,140 @@
+"""
+Recall, memory and latency of reduced-dimension and quantized embeddings.
+
+    python benchmarks/bench_quantization.py --vectors 20000 --dimensions 1536 512 256
+    python benchmarks/bench_quantization.py --embeddings corpus.npy   # real embeddings, one per row
+
+Every combination of embedding size and LOCAL_VECTOR_QUANTIZATION (float32, int8)
+is loaded into the local vector index and queried.
+Recall@k is measured against exact float32 search over the full-size vectors.
+
+Without --embeddings the corpus is synthetic: clustered vectors whose variance
+decays along the dimensions, mimicking how text-embedding-3 vectors keep most of
+their information in the leading dimensions. Queries are noisy copies of corpus
+vectors, like paraphrases of indexed text. Real embeddings give the
+trustworthy numbers; the synthetic ones show the shape of the trade-off.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import prepare_environment, quiet_logging, save_results, summarize_latencies
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--full-dimensions", type=int, default=1536)
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[1536, 512, 256])
+    parser.add_argument("--quantization", nargs="+", default=["float32", "int8"])
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.5, help="query noise relative to the vector norm")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--embeddings", help=".npy file with real embeddings (rows), overrides --vectors")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    return parser.parse_args()
+
+
+def build_corpus(args):
+    import numpy as np
+
+    rng = np.random.default_rng(args.seed)
+    if args.embeddings:
+        corpus = np.load(args.embeddings).astype(np.float32)
+        decay = np.ones(corpus.shape[1], dtype=np.float32)
+    else:
+        decay = np.exp(-np.arange(args.full_dimensions) / (args.full_dimensions / 4)).astype(np.float32)
+        centers = rng.standard_normal((args.clusters, args.full_dimensions), dtype=np.float32)
+        members = rng.integers(args.clusters, size=args.vectors)
+        spread = rng.standard_normal((args.vectors, args.full_dimensions), dtype=np.float32)
+        corpus = (centers[members] + 0.6 * spread) * decay
+    corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+
+    picked = rng.choice(len(corpus), size=args.queries, replace=False)
+    # Noise follows the same per-dimension profile as the signal
+    noise = rng.standard_normal((args.queries, corpus.shape[1]), dtype=np.float32) * decay
+    noise *= args.noise / np.linalg.norm(noise, axis=1, keepdims=True)
+    queries = corpus[picked] + noise
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return corpus, queries
+
+
+def exact_top_k(corpus, queries, k: int):
+    import numpy as np
+
+    scores = queries @ corpus.T
+    return [set(np.argsort(-row)[:k]) for row in scores]
+
+
+def truncate(vectors, dimensions: int):
+    """
+    Shorten embeddings to their first `dimensions` values and renormalize them, as the
+    API does for text-embedding-3 models when EMBEDDING_DIMENSIONS is set.
+    """
+    import numpy as np
+
+    shortened = np.asarray(vectors, dtype=np.float32)[..., :dimensions]
+    norms = np.linalg.norm(shortened, axis=-1, keepdims=True)
+    return shortened / np.where(norms > 0, norms, 1)
+
+
+def run_config(corpus, queries, truth, dimensions: int, quantization: str, args) -> dict:
+    import numpy as np
+    from services.local_vector_store import LocalVectorIndex
+
+    vectors = truncate(corpus, dimensions)
+    shortened_queries = truncate(queries, dimensions)
+    with tempfile.TemporaryDirectory() as path:
+        index = LocalVectorIndex(path, quantization=quantization)
+        index.upsert([{"id": str(i), "values": vector} for i, vector in enumerate(vectors)])
+        stats = index.describe_index_stats()
+
+        latencies, hits = [], 0
+        for query, expected in zip(shortened_queries, truth):
+            started = time.perf_counter()
+            matches = index.query(query, top_k=args.top_k).matches
+            latencies.append(time.perf_counter() - started)
+            hits += len({int(match.id) for match in matches} & expected)
+
+    memory = stats["namespaces"][""]["memory_bytes"]
+    # What a Pinecone upsert carries per vector: values serialized as JSON floats
+    payload = len(json.dumps(np.round(vectors[0], 8).tolist()))
+    return {
+        "dimensions": dimensions,
+        "quantization": quantization,
+        f"recall_at_{args.top_k}": round(hits / (len(truth) * args.top_k), 4),
+        "bytes_per_vector": round(memory / len(corpus), 1),
+        "index_mb": round(memory / (1024 * 1024), 2),
+        "upsert_payload_bytes_per_vector": payload,
+        "latency": summarize_latencies(latencies),
+    }
+
+
+def main():
+    args = parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    prepare_environment()
+    quiet_logging()
+
+    corpus, queries = build_corpus(args)
+    truth = exact_top_k(corpus, queries, args.top_k)
+    results = []
+    for dimensions in args.dimensions:
+        for quantization in args.quantization:
+            result = run_config(corpus, queries, truth, min(dimensions, corpus.shape[1]), quantization, args)
+            print(json.dumps(result))
+            results.append(result)
+
+    path = save_results("quantization", vars(args), results, output)
+    print(f"Saved results to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Prompt size, answer latency and context precision with and without reranking.
+
+    python benchmarks/bench_rerank.py --queries 50 --relevant-share 0.2
+
+Runs RAGService.process_audio_query against the fakes, first with RERANK_BACKEND=none
+(top 3 vector matches go straight into the prompt) and then with the LLM reranker.
+The fake reranker scores passages by word overlap with the query, and the fake GPT
+spends --prompt-token-latency-ms per prompt token, so a shorter prompt answers faster.
+
+Documents are labelled relevant or not when generated, which gives the share of
+relevant passages in the prompt (context precision). Queries cycle through
+--distinct-queries variants, so repeated questions exercise the score cache.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FAKE_TRANSCRIPTION, FakeOpenAIClient, FaultInjector, InMemoryIndex
+from harness import install_fakes, prepare_environment, quiet_logging, save_results, summarize_latencies
+
+OFF_TOPIC_WORDS = ["автомобіль", "каско", "майно", "квартира", "пожежа", "подорож", "віза", "валюта", "кредит", "ризик"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--words", type=int, default=600, help="words per document")
+    parser.add_argument("--relevant-share", type=float, default=0.2, help="documents about the queried topic")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--distinct-queries", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="base latency of fake OpenAI/Pinecone calls")
+    parser.add_argument("--prompt-token-latency-ms", type=float, default=0.3, help="fake GPT time per prompt token")
+    parser.add_argument("--token-latency-ms", type=float, default=5.0, help="fake GPT time per output token")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    return parser.parse_args()
+
+
+async def index_corpus(args, rag_service) -> set:
+    rng = random.Random(args.seed)
+    topic_words = FAKE_TRANSCRIPTION.replace(",", "").split()
+    relevant = set()
+    for i in range(args.documents):
+        document_id = f"doc-{i}"
+        if rng.random() < args.relevant_share:
+            relevant.add(document_id)
+            words = [rng.choice(topic_words) for _ in range(args.words)]
+        else:
+            words = [rng.choice(OFF_TOPIC_WORDS) for _ in range(args.words)]
+        await rag_service.process_document(" ".join(words), document_id)
+    return relevant
+
+
+def passage_documents(index) -> dict:
+    """Chunk text -> document id, to tell which documents a prompt drew on"""
+    return {
+        vector["metadata"]["text"]: vector["metadata"]["document_id"]
+        for namespace in index.namespaces.values() for vector in namespace.values()
+    }
+
+
+async def run_mode(mode: str, args, openai_client, documents: dict, relevant: set) -> dict:
+    from services.metrics_service import metrics_service
+    from services.openai_service import openai_service
+    from services.rag_service import rag_service
+    from services.rerank_service import rerank_service
+
+    rerank_service.backend = mode
+    rerank_service._cache.clear()
+    metrics_service.counters.pop("rerank_cache_hits_total", None)
+    metrics_service.counters.pop("rerank_cache_misses_total", None)
+
+    latencies, prompt_tokens, passages, relevant_passages, rerank_calls = [], [], 0, 0, 0
+    for i in range(args.queries):
+        openai_client.transcription = f"{FAKE_TRANSCRIPTION} {i % args.distinct_queries}"
+        calls_before = len(openai_client.chat_calls)
+        started = time.perf_counter()
+        await rag_service.process_audio_query(io.BytesIO(b"voice"))
+        latencies.append(time.perf_counter() - started)
+
+        calls = openai_client.chat_calls[calls_before:]
+        rerank_calls += sum(1 for call in calls if call["model"] == openai_service.rerank_model)
+        answer = calls[-1]
+        prompt_tokens.append(answer["prompt_tokens"])
+        context = answer["messages"][-1]["content"].split("\n\nQuery:")[0][len("Context: "):]
+        context_documents = [documents[passage] for passage in context.split("\n\n") if passage]
+        passages += len(context_documents)
+        relevant_passages += sum(1 for document_id in context_documents if document_id in relevant)
+
+    hits = sum(metrics_service.get_counter("rerank_cache_hits_total").values())
+    misses = sum(metrics_service.get_counter("rerank_cache_misses_total").values())
+    return {
+        "mode": mode,
+        "latency": summarize_latencies(latencies),
+        "mean_prompt_tokens": round(sum(prompt_tokens) / len(prompt_tokens), 1),
+        "mean_passages_in_prompt": round(passages / args.queries, 2),
+        "context_precision": round(relevant_passages / passages, 3) if passages else None,
+        "rerank_calls": rerank_calls,
+        "rerank_cache_hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+    }
+
+
+async def run(args) -> list:
+    from services.client_context import client_context
+    from services.rag_service import rag_service
+
+    # Every query names the client the fake answer saves; their history would differ between modes
+    client_context.enabled = False
+    faults = FaultInjector(latency_ms=args.latency_ms, seed=args.seed)
+    openai_client = FakeOpenAIClient(faults=faults, token_latency_ms=args.token_latency_ms,
+                                     prompt_token_latency_ms=args.prompt_token_latency_ms)
+    index = InMemoryIndex(faults=FaultInjector(latency_ms=args.latency_ms / 2, seed=args.seed + 1))
+    install_fakes(openai_client, index)
+    relevant = await index_corpus(args, rag_service)
+    documents = passage_documents(index)
+
+    results = []
+    for mode in ("none", "llm"):
+        result = await run_mode(mode, args, openai_client, documents, relevant)
+        print(json.dumps(result))
+        results.append(result)
+    return results
+
+
+def main():
+    args = parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    prepare_environment()
+    quiet_logging()
+    results = asyncio.run(run(args))
+    path = save_results("rerank", vars(args), results, output)
+    print(f"Saved results to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Cost and latency of answer generation per model route.
+
+    python benchmarks/bench_routing.py --requests 100 --complex-share 0.3
+    python benchmarks/bench_routing.py --cache-min-tokens 0   # let the fake cache any repeated prefix
+
+Calls OpenAIService.generate_response with a mix of short follow-up style queries and
+long or analytical ones over one to three retrieved passages, first with MODEL_ROUTING
+off (every answer from the full model) and then with routing on. The fake GPT answers
+--light-speed times faster on the light model and, like the real API, serves a repeated
+prompt prefix from its cache once it reaches --cache-min-tokens.
+
+Costs use the prices in services.metrics_service.MODEL_PRICES.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FAKE_TRANSCRIPTION, FakeOpenAIClient, FaultInjector, InMemoryIndex
+from harness import install_fakes, prepare_environment, quiet_logging, save_results, summarize_latencies
+
+COMPLEX_QUERY = (
+    "Порівняй пенсійні програми партнерів для клієнта сорока п'яти років з доходом вісімдесят тисяч на місяць, "
+    "розрахуй різницю в накопиченнях за двадцять років і поясни податкові переваги кожної програми"
+)
+
+PASSAGE_WORDS = ["програма", "накопичення", "внесок", "страхування", "виплата", "термін", "дохід", "ризик",
+                 "партнер", "гарантія", "пенсія", "освіта", "дитина", "відсоток", "поліс", "рік"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--complex-share", type=float, default=0.3, help="share of long/analytical queries")
+    parser.add_argument("--passage-words", type=int, default=250, help="words per retrieved passage")
+    parser.add_argument("--latency-ms", type=float, default=30.0, help="base latency of fake OpenAI calls")
+    parser.add_argument("--prompt-token-latency-ms", type=float, default=0.3, help="fake GPT time per prompt token")
+    parser.add_argument("--token-latency-ms", type=float, default=5.0, help="fake GPT time per output token")
+    parser.add_argument("--light-speed", type=float, default=2.5, help="how much faster the light model is")
+    parser.add_argument("--cache-min-tokens", type=int, default=1024, help="shortest prefix the fake API caches")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    return parser.parse_args()
+
+
+def build_requests(args) -> list:
+    rng = random.Random(args.seed)
+    requests = []
+    for i in range(args.requests):
+        query = COMPLEX_QUERY if rng.random() < args.complex_share else f"{FAKE_TRANSCRIPTION} {i}"
+        passages = [" ".join(rng.choice(PASSAGE_WORDS) for _ in range(args.passage_words))
+                    for _ in range(rng.randint(1, 3))]
+        requests.append((query, "\n\n".join(passages)))
+    return requests
+
+
+def route_costs(metrics_service) -> dict:
+    return {dict(labels)["route"]: value for labels, value in metrics_service.get_counter("openai_route_cost_usd_total").items()}
+
+
+async def run_mode(routing: bool, requests: list, openai_client) -> dict:
+    from services.metrics_service import metrics_service
+    from services.model_router import model_router
+    from services.openai_service import openai_service
+
+    model_router.enabled = routing
+    routes = {route.model: route.name for route in (model_router.full, model_router.light)}
+    costs_before = route_costs(metrics_service)
+    calls_before = len(openai_client.chat_calls)
+    latencies = {}
+    for query, context in requests:
+        started = time.perf_counter()
+        await openai_service.generate_response(query, context)
+        route = routes[openai_client.chat_calls[-1]["model"]]
+        latencies.setdefault(route, []).append(time.perf_counter() - started)
+
+    calls = openai_client.chat_calls[calls_before:]
+    costs = {route: cost - costs_before.get(route, 0.0) for route, cost in route_costs(metrics_service).items()}
+    summary = {}
+    for route, values in sorted(latencies.items()):
+        route_calls = [call for call in calls if routes[call["model"]] == route]
+        summary[route] = {
+            "answers": len(values),
+            "latency": summarize_latencies(values),
+            "mean_prompt_tokens": round(sum(call["prompt_tokens"] for call in route_calls) / len(route_calls), 1),
+            "cost_usd_per_answer": round(costs[route] / len(values), 6),
+        }
+    return {
+        "routing": routing,
+        "latency": summarize_latencies([value for values in latencies.values() for value in values]),
+        "cost_usd_per_answer": round(sum(costs.values()) / len(requests), 6),
+        "cached_prompt_share": round(
+            sum(call["cached_tokens"] for call in calls) / sum(call["prompt_tokens"] for call in calls), 3
+        ),
+        "routes": summary,
+    }
+
+
+async def run(args) -> list:
+    from services.model_router import model_router
+
+    openai_client = FakeOpenAIClient(
+        faults=FaultInjector(latency_ms=args.latency_ms, seed=args.seed),
+        token_latency_ms=args.token_latency_ms,
+        prompt_token_latency_ms=args.prompt_token_latency_ms,
+        model_speed={model_router.light.model: args.light_speed},
+        prompt_cache_min_tokens=args.cache_min_tokens,
+    )
+    install_fakes(openai_client, InMemoryIndex())
+    requests = build_requests(args)
+
+    results = []
+    for routing in (False, True):
+        # Both modes answer the same requests, so each starts with a cold prompt cache
+        openai_client.prompt_prefixes.clear()
+        result = await run_mode(routing, requests, openai_client)
+        print(json.dumps(result))
+        results.append(result)
+    return results
+
+
+def main():
+    args = parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    prepare_environment()
+    quiet_logging()
+    results = asyncio.run(run(args))
+    path = save_results("routing", vars(args), results, output)
+    print(f"Saved results to {path}")
+
+
+if __name__ == "__main__":
+    main()
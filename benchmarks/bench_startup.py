@@ -0,0 +1,108 @@
+"""
+Measure cold-start time and the import-time breakdown of the bot.
+
+    python benchmarks/bench_startup.py --runs 5
+
+Every run is a fresh interpreter. Three phases are timed: importing bot.py,
+building the Application, and constructing and starting all services (what
+post_init does). `python -X importtime` provides the per-package breakdown.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import FAKE_ENV, SRC_DIR, save_results
+
+COLD_START_SCRIPT = """
+import asyncio, json, time
+started = time.perf_counter()
+import bot
+imported = time.perf_counter()
+application = bot.build_application()
+built = time.perf_counter()
+from services.lifecycle import start_services, stop_services
+asyncio.run(start_services())
+services_started = time.perf_counter()
+print(json.dumps({
+    "import_s": imported - started,
+    "build_application_s": built - imported,
+    "start_services_s": services_started - built,
+    "total_s": services_started - started,
+}))
+"""
+
+
+def _child_env() -> dict:
+    env = dict(os.environ)
+    env.update(FAKE_ENV)
+    env["PYTHONPATH"] = SRC_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def measure_cold_start(runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as workdir:
+            result = subprocess.run(
+                [sys.executable, "-c", COLD_START_SCRIPT], cwd=workdir, env=_child_env(),
+                capture_output=True, text=True, check=True,
+            )
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    return {
+        phase: {
+            "median_ms": round(statistics.median(sample[phase] for sample in samples) * 1000, 2),
+            "min_ms": round(min(sample[phase] for sample in samples) * 1000, 2),
+        }
+        for phase in samples[0]
+    }
+
+
+def measure_import_breakdown(top: int) -> list:
+    """Cumulative import time of each package root pulled in by importing bot.py"""
+    with tempfile.TemporaryDirectory() as workdir:
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import bot"], cwd=workdir, env=_child_env(),
+            capture_output=True, text=True, check=True,
+        )
+
+    packages = {}
+    for line in result.stderr.splitlines():
+        fields = line[len("import time:"):].split("|")
+        if not line.startswith("import time:") or len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        name = fields[2].strip()
+        # A package root's cumulative time covers everything imported on its behalf
+        if "." not in name and name not in packages:
+            packages[name] = int(fields[1])
+
+    ordered = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return [{"package": package, "cumulative_ms": round(us / 1000, 2)} for package, us in ordered]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="packages to list in the import breakdown")
+    parser.add_argument("--output")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = {
+        "cold_start": measure_cold_start(args.runs),
+        "import_breakdown": measure_import_breakdown(args.top),
+    }
+    path = save_results("startup", vars(args), results, os.path.abspath(args.output) if args.output else None)
+    print(json.dumps(results, indent=2))
+    print(f"Saved results to {path}")
+
+
+if __name__ == "__main__":
+    main()
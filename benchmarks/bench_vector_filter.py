@@ -0,0 +1,161 @@
+"""
+Measure query latency of the local vector backend with and without partitioning.
+
+    python benchmarks/bench_vector_filter.py --vectors 100000 --advisors 20 --queries 300
+
+The same corpus is loaded twice:
+
+  global     every vector in the shared namespace, as before namespaces existed;
+             queries scan everything and return other advisors' material
+  namespace  every advisor's vectors in their own namespace; queries search the
+             advisor's namespace plus the shared one
+  filtered   namespace queries with a product category filter pushed down to the index
+
+Reports latency percentiles, the share of returned matches that belong to other
+advisors, and checks filtered results against a brute-force scan.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import prepare_environment, quiet_logging, save_results, summarize_latencies
+
+CATEGORIES = ["пенсія", "життя", "здоров'я", "накопичення", "діти", "інвестиції", "авто", "майно"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=100000)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--advisors", type=int, default=20)
+    parser.add_argument("--shared-fraction", type=float, default=0.1, help="vectors in the shared namespace")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    return parser.parse_args()
+
+
+def build_corpus(args):
+    import numpy as np
+
+    rng = random.Random(args.seed)
+    values = np.random.default_rng(args.seed).standard_normal((args.vectors, args.dimensions), dtype=np.float32)
+    entries = []
+    for i in range(args.vectors):
+        owner = None if rng.random() < args.shared_fraction else rng.randrange(args.advisors)
+        entries.append({
+            "id": f"doc-{i // 20}_chunk_{i % 20}",
+            "owner": owner,
+            "metadata": {"document_id": f"doc-{i // 20}", "category": rng.choice(CATEGORIES), "page": i % 20 + 1},
+        })
+    return values, entries
+
+
+def load(index, values, entries, partitioned: bool):
+    batch = []
+    for (entry, vector) in zip(entries, values):
+        namespace = f"advisor-{entry['owner']}" if partitioned and entry["owner"] is not None else ""
+        batch.append((namespace, {"id": entry["id"], "values": vector, "metadata": entry["metadata"]}))
+    by_namespace = {}
+    for namespace, vector in batch:
+        by_namespace.setdefault(namespace, []).append(vector)
+    for namespace, vectors in by_namespace.items():
+        index.upsert(vectors, namespace=namespace)
+
+
+async def run_queries(service, args, entries, mode: str, queries) -> dict:
+    owners = {entry["id"]: entry["owner"] for entry in entries}
+    latencies, foreign, returned = [], 0, 0
+    for advisor, category, vector in queries:
+        started = time.perf_counter()
+        if mode == "global":
+            matches = await service.query_vectors(vector, top_k=args.top_k)
+        else:
+            matches = await service.query_namespaces(
+                vector, [f"advisor-{advisor}", ""], top_k=args.top_k,
+                filter={"category": {"$eq": category}} if mode == "filtered" else None,
+            )
+        latencies.append(time.perf_counter() - started)
+        returned += len(matches)
+        foreign += sum(1 for match in matches if owners[match.id] not in (None, advisor))
+    return {
+        "mode": mode,
+        "latency": summarize_latencies(latencies),
+        "foreign_match_share": round(foreign / max(1, returned), 4),
+    }
+
+
+def brute_force_check(index, values, entries, queries, top_k: int) -> bool:
+    """Filtered namespace queries must return exactly the best-scoring matching vectors"""
+    import numpy as np
+
+    normalized = values / np.linalg.norm(values, axis=1, keepdims=True)
+    for advisor, category, vector in queries[:20]:
+        candidates = [
+            i for i, entry in enumerate(entries)
+            if entry["owner"] in (advisor, None) and entry["metadata"]["category"] == category
+        ]
+        query = np.asarray(vector, dtype=np.float32)
+        query /= np.linalg.norm(query)
+        scores = normalized[candidates] @ query
+        expected = [entries[candidates[i]]["id"] for i in np.argsort(-scores)[:top_k]]
+        merged = []
+        for namespace in (f"advisor-{advisor}", ""):
+            merged += index.query(vector, top_k=top_k, namespace=namespace,
+                                  filter={"category": category}).matches
+        actual = [match.id for match in sorted(merged, key=lambda match: match.score, reverse=True)[:top_k]]
+        if actual != expected:
+            return False
+    return True
+
+
+async def run(args) -> dict:
+    import numpy as np
+    from services.local_vector_store import LocalVectorIndex
+    from services.pinecone_service import pinecone_service
+
+    values, entries = build_corpus(args)
+    rng = random.Random(args.seed + 1)
+    queries = [
+        (rng.randrange(args.advisors), rng.choice(CATEGORIES), np.random.default_rng(i).standard_normal(args.dimensions).tolist())
+        for i in range(args.queries)
+    ]
+
+    results = []
+    for mode in ("global", "namespace", "filtered"):
+        with tempfile.TemporaryDirectory() as path:
+            index = LocalVectorIndex(path)
+            started = time.perf_counter()
+            load(index, values, entries, partitioned=mode != "global")
+            load_s = time.perf_counter() - started
+            pinecone_service.index = index
+            result = await run_queries(pinecone_service, args, entries, mode, queries)
+            result["load_s"] = round(load_s, 3)
+            if mode == "filtered":
+                result["matches_brute_force"] = brute_force_check(index, values, entries, queries, args.top_k)
+        print(json.dumps(result, ensure_ascii=False))
+        results.append(result)
+    return results
+
+
+def main():
+    args = parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    prepare_environment()
+    os.environ["VECTOR_BACKEND"] = "local"
+    quiet_logging()
+    results = asyncio.run(run(args))
+    path = save_results("vector_filter", vars(args), results, output)
+    print(f"Saved results to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Restart-to-first-answer time with a local vector index and rerank cache on disk.
+
+    python benchmarks/bench_warm_start.py --vectors 50000 --runs 5
+
+Builds a local index of --vectors chunks (VECTOR_BACKEND=local), answers a voice query
+and saves the index and the rerank score cache. Then every run restarts the bot in a
+fresh interpreter: it imports bot.py, builds the Application, starts all services and
+answers the same query again. The fake OpenAI client adds --latency-ms to every call.
+
+    vectors    the memory-mapped index snapshot, with an empty rerank cache
+    snapshot   the memory-mapped index snapshot and the saved rerank cache
+
+By default the data files are dropped from the page cache before every
+run with posix_fadvise, as after a deploy to a fresh machine. Reported per mode: time
+until services are started and until the first answer, and peak RSS.
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import BENCHMARKS_DIR, FAKE_ENV, SRC_DIR, prepare_environment, quiet_logging, save_results
+
+QUERY = "Клієнт цікавиться накопичувальним страхуванням життя, що порадити?"
+
+RESTART_SCRIPT = """
+import asyncio, io, json, sys, time
+started = time.perf_counter()
+import bot
+application = bot.build_application()
+from services.lifecycle import start_services, stop_services
+from fakes import FakeOpenAIClient, FaultInjector
+from services.openai_service import openai_service
+from services.rag_service import rag_service
+
+async def main():
+    await start_services()
+    ready = time.perf_counter()
+    openai_service.client = FakeOpenAIClient(
+        faults=FaultInjector(latency_ms=float(sys.argv[1])), transcription=sys.argv[2]
+    )
+    await rag_service.process_audio_query(io.BytesIO(b"voice"))
+    answered = time.perf_counter()
+    print(json.dumps({
+        "services_started_s": ready - started,
+        "first_answer_s": answered - started,
+        # ru_maxrss would include the parent's peak, which survives exec
+        "peak_rss_mb": next(int(line.split()[1]) for line in open("/proc/self/status") if line.startswith("VmHWM")) / 1024,
+    }))
+
+asyncio.run(main())
+"""
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--chunk-chars", type=int, default=800, help="text stored in the metadata of each chunk")
+    parser.add_argument("--runs", type=int, default=5, help="restarts per mode, interleaved; medians are reported")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="base latency of fake OpenAI calls")
+    parser.add_argument("--warm", action="store_true", help="keep the data files in the page cache")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    return parser.parse_args()
+
+
+def _env(workdir: str, rerank_cache: bool) -> dict:
+    env = dict(os.environ)
+    env.update(FAKE_ENV)
+    env.update({
+        "PYTHONPATH": os.pathsep.join([SRC_DIR, BENCHMARKS_DIR, env.get("PYTHONPATH", "")]),
+        "VECTOR_BACKEND": "local",
+        "LOCAL_VECTOR_PATH": os.path.join(workdir, "vectors"),
+        "RERANK_CACHE_PATH": os.path.join(workdir, "rerank_cache") if rerank_cache else "",
+    })
+    return env
+
+
+async def build_data(args, workdir: str):
+    """Index random chunks, answer QUERY once and save the index and rerank cache"""
+    import numpy as np
+    from fakes import FakeOpenAIClient, FaultInjector
+    from services.openai_service import openai_service
+    from services.pinecone_service import pinecone_service
+    from services.rag_service import rag_service
+    from services.rerank_service import rerank_service
+
+    rng = np.random.default_rng(args.seed)
+    words = ["поліс", "накопичення", "страхування", "життя", "внесок", "виплата", "клієнт", "ризик", "фонд"]
+    text = " ".join(words[i % len(words)] for i in range(args.chunk_chars // 8))
+    for start in range(0, args.vectors, 1000):
+        pinecone_service.index.upsert([
+            {
+                "id": f"doc-{i // 50}_chunk_{i % 50}",
+                "values": rng.standard_normal(args.dimensions).astype(np.float32),
+                "metadata": {"document_id": f"doc-{i // 50}", "chunk_index": i % 50, "text": f"{i} {text}"},
+            }
+            for i in range(start, min(start + 1000, args.vectors))
+        ])
+    openai_service.client = FakeOpenAIClient(faults=FaultInjector(), transcription=QUERY)
+    await rag_service.process_audio_query(io.BytesIO(b"voice"))
+    await rerank_service.save_cache()
+    pinecone_service.index.save()
+
+
+def evict(directory: str):
+    """Drop a directory's files from the page cache"""
+    for root, _, files in os.walk(directory):
+        for file_name in files:
+            fd = os.open(os.path.join(root, file_name), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+
+
+def restart(args, workdir: str, data_dir: str, rerank_cache: bool) -> dict:
+    # Every restart gets its own copy, so a save by one run does not change the next
+    run_dir = tempfile.mkdtemp(prefix="restart-", dir=workdir)
+    for name in ("vectors", "rerank_cache"):
+        if os.path.isdir(os.path.join(data_dir, name)):
+            shutil.copytree(os.path.join(data_dir, name), os.path.join(run_dir, name))
+    if not args.warm:
+        evict(run_dir)
+    result = subprocess.run(
+        [sys.executable, "-c", RESTART_SCRIPT, str(args.latency_ms), QUERY],
+        cwd=run_dir, env=_env(run_dir, rerank_cache), capture_output=True, text=True, check=True,
+    )
+    shutil.rmtree(run_dir)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    args = parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    workdir = tempfile.mkdtemp(prefix="tg-ai-agent-warm-start-")
+    os.environ.update({"VECTOR_BACKEND": "local", "LOCAL_VECTOR_PATH": os.path.join(workdir, "vectors"),
+                       "RERANK_CACHE_PATH": os.path.join(workdir, "rerank_cache"),
+                       "EMBEDDING_DIMENSIONS": str(args.dimensions)})
+    prepare_environment(workdir)
+    quiet_logging()
+    started = time.perf_counter()
+    asyncio.run(build_data(args, workdir))
+    print(f"Built {args.vectors} vectors in {time.perf_counter() - started:.1f} s")
+
+    modes = {
+        "vectors": (workdir, False),
+        "snapshot": (workdir, True),
+    }
+    runs = {mode: [] for mode in modes}
+    for _ in range(args.runs):
+        for mode, (data_dir, rerank_cache) in modes.items():
+            runs[mode].append(restart(args, workdir, data_dir, rerank_cache))
+
+    results = []
+    for mode, samples in runs.items():
+        result = {"mode": mode}
+        for key in ("services_started_s", "first_answer_s"):
+            result[key[:-len("_s")] + "_ms"] = round(statistics.median(s[key] for s in samples) * 1000, 1)
+        result["peak_rss_mb"] = round(statistics.median(s["peak_rss_mb"] for s in samples), 1)
+        print(json.dumps(result))
+        results.append(result)
+    path = save_results("warm_start", vars(args), results, output)
+    print(f"Saved results to {path}")
+    shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Load-test the webhook dispatcher with 1..N worker processes.
+
+    python benchmarks/bench_webhook.py --workers 1 2 4 --updates 2000 --work-ms 5
+
+Each worker stands in for a bot process and spends --work-ms of CPU per update
+(handler overhead, parsing, serialization) plus --io-ms of waiting. Throughput is
+measured from the first webhook POST until every update has been handled, so the
+numbers show how dispatch scales with the worker count.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from harness import prepare_environment, quiet_logging, save_results, summarize_latencies
+
+# Set by the parent before workers are spawned; spawn copies the environment
+WORK_MS_ENV = "BENCH_WEBHOOK_WORK_MS"
+IO_MS_ENV = "BENCH_WEBHOOK_IO_MS"
+
+
+def synthetic_worker(index: int, updates: multiprocessing.Queue, done: multiprocessing.Queue):
+    work = float(os.environ[WORK_MS_ENV]) / 1000
+    io_wait = float(os.environ[IO_MS_ENV]) / 1000
+    while True:
+        update = updates.get()
+        if update is None:
+            break
+        deadline = time.perf_counter() + work
+        while time.perf_counter() < deadline:
+            pass
+        if io_wait:
+            time.sleep(io_wait)
+        done.put((index, update["update_id"], update["message"]["chat"]["id"], time.time() - update["sent_at"]))
+
+
+class _WorkerWithAck:
+    """Picklable worker target that reports completions back to the benchmark"""
+
+    def __init__(self, done: multiprocessing.Queue):
+        self.done = done
+
+    def __call__(self, index: int, updates: multiprocessing.Queue):
+        synthetic_worker(index, updates, self.done)
+
+
+def make_update(update_id: int, chat_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "sent_at": time.time(),
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Advisor"},
+            "text": "benchmark",
+        },
+    }
+
+
+async def run_once(workers: int, args) -> dict:
+    import aiohttp
+    from aiohttp import web
+    from webhook import WebhookDispatcher
+
+    context = multiprocessing.get_context("spawn")
+    done = context.Queue()
+    dispatcher = WebhookDispatcher(workers, worker_target=_WorkerWithAck(done), queue_size=args.updates)
+    dispatcher.start()
+
+    runner = web.AppRunner(dispatcher.create_app("/telegram"))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+    await site.start()
+
+    rng = random.Random(args.seed)
+    chat_ids = [1000 + rng.randrange(args.chats) for _ in range(args.updates)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    url = f"http://127.0.0.1:{args.port}/telegram"
+
+    async with aiohttp.ClientSession() as session:
+        async def post(update_id: int):
+            async with semaphore:
+                async with session.post(url, json=make_update(update_id, chat_ids[update_id])) as response:
+                    assert response.status == 200, response.status
+
+        started = time.perf_counter()
+        await asyncio.gather(*(post(i) for i in range(args.updates)))
+        completions = [await asyncio.to_thread(done.get) for _ in range(args.updates)]
+        elapsed = time.perf_counter() - started
+
+    # Sticky routing: every chat must have been served by exactly one worker
+    workers_per_chat = {}
+    for worker, _, chat_id, _ in completions:
+        workers_per_chat.setdefault(chat_id, set()).add(worker)
+
+    await runner.cleanup()
+    await asyncio.to_thread(dispatcher.stop)
+    return {
+        "workers": workers,
+        "elapsed_s": round(elapsed, 4),
+        "throughput_ups": round(args.updates / elapsed, 2),
+        "end_to_end_latency": summarize_latencies([completion[3] for completion in completions]),
+        "sticky_routing_ok": all(len(served) == 1 for served in workers_per_chat.values()),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--chats", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50, help="in-flight webhook POSTs")
+    parser.add_argument("--work-ms", type=float, default=5.0, help="CPU time per update in a worker")
+    parser.add_argument("--io-ms", type=float, default=0.0, help="blocking wait per update in a worker")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    prepare_environment()
+    quiet_logging()
+    os.environ[WORK_MS_ENV] = str(args.work_ms)
+    os.environ[IO_MS_ENV] = str(args.io_ms)
+
+    results = []
+    for workers in args.workers:
+        result = asyncio.run(run_once(workers, args))
+        print(json.dumps(result))
+        results.append(result)
+
+    baseline = results[0]["throughput_ups"]
+    for result in results:
+        result["speedup"] = round(result["throughput_ups"] / baseline, 2)
+    path = save_results("webhook", vars(args), results, output)
+    print(f"Saved results to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,506 @@
+"""Deterministic local fakes for Telegram, OpenAI and Pinecone used by the benchmarks"""
+import asyncio
+import hashlib
+import io
+import json
+import math
+import random
+import re
+import threading
+import time
+from itertools import count
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+FAKE_RESPONSE = """1. Інформація про клієнта
+Клієнт: Олена Коваленко
+Вік: 34 років
+Дата: 01.03.2024
+Тип зустрічі: Initial
+Продукт: Накопичувальне страхування
+Ціль: Накопичення на освіту дитини
+
+Опис клієнта:
+Клієнтка працює менеджером, має одну дитину та хоче почати відкладати кошти.
+
+2. Пропозиції продукту
+### Найкращі пропозиції на ринку:
+
+#### 1. Програма накопичення:
+- **Мета**: накопичення на освіту
+- **Переваги**:
+  - *гнучкі внески*
+  - *страховий захист*"""
+
+# Handlers report failures to the user instead of raising
+FAILURE_REPLY_PREFIXES = ("😕", "⏳", "❌")
+
+FAKE_TRANSCRIPTION = (
+    "Сьогодні зустрівся з Оленою Коваленко, їй тридцять чотири роки, "
+    "вона хоче накопичити на освіту дитини"
+)
+
+
+class FakeAPIError(Exception):
+    """Injected upstream failure shaped like OpenAI/Pinecone HTTP errors"""
+
+    def __init__(self, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(f"Injected upstream error {status_code}")
+        self.status_code = status_code
+        self.headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+
+
+class FaultInjector:
+    """Adds latency and random failures to fake upstream calls"""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 slow_rate: float = 0.0, slow_ms: float = 0.0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.calls = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __call__(self, scale: float = 1.0):
+        with self._lock:
+            self.calls += 1
+            delay = self.latency_ms + self._random.uniform(0, self.jitter_ms)
+            if self._random.random() < self.slow_rate:
+                delay += self.slow_ms
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.failures += 1
+        time.sleep(delay * scale / 1000)
+        if fail:
+            raise FakeAPIError(self._random.choice([429, 500, 503]), retry_after=0.05)
+
+
+def fake_embedding(text: str, dimensions: int) -> List[float]:
+    """Deterministic unit vector derived from the text"""
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+    return [value / norm for value in vector]
+
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+def _count_tokens(text: str) -> int:
+    # Close enough to tiktoken for Ukrainian text to keep cost numbers realistic
+    return max(1, len(text) // 3)
+
+
+class _FakeEmbeddings:
+    def __init__(self, owner: "FakeOpenAIClient"):
+        self.owner = owner
+
+    def create(self, model: str, input: List[str], dimensions: Optional[int] = None, **kwargs):
+        self.owner.faults(scale=1 + len(input) / 100)
+        dimensions = dimensions or self.owner.dimensions
+        data = [
+            SimpleNamespace(index=i, embedding=fake_embedding(text, dimensions))
+            for i, text in enumerate(input)
+        ]
+        tokens = sum(_count_tokens(text) for text in input)
+        self.owner.embedding_calls += 1
+        return SimpleNamespace(data=data, model=model, usage=SimpleNamespace(prompt_tokens=tokens, total_tokens=tokens))
+
+
+class _FakeTranscriptions:
+    def __init__(self, owner: "FakeOpenAIClient"):
+        self.owner = owner
+
+    def create(self, model: str, file: Any, **kwargs):
+        # The SDK accepts a file object or a (file_name, file object) tuple
+        data = (file[1] if isinstance(file, tuple) else file).read()
+        self.owner.faults(scale=self.owner.whisper_scale)
+        # Longer recordings take longer to transcribe
+        time.sleep(len(data) / 1024 * self.owner.whisper_ms_per_kb / 1000)
+        return SimpleNamespace(text=self.owner.transcription)
+
+
+class _FakeChatCompletions:
+    def __init__(self, owner: "FakeOpenAIClient"):
+        self.owner = owner
+
+    @staticmethod
+    def _rerank_answer(prompt: str) -> str:
+        """Score numbered passages by word overlap with the query, like a reranker would"""
+        query_match = re.search(r"^Запит: (.*)$", prompt, re.MULTILINE)
+        query_words = set(_words(query_match.group(1))) if query_match else set()
+        scores = []
+        for passage in re.findall(r"^\[\d+\] (.*)$", prompt, re.MULTILINE):
+            overlap = len(query_words & set(_words(passage))) / max(1, len(query_words))
+            scores.append(round(10 * overlap))
+        return json.dumps({"scores": scores})
+
+    def _cached_prefix_tokens(self, model: str, messages: List[Dict[str, str]]) -> int:
+        """
+        Prompt caching like the real API: a prefix of whole messages seen before is reused
+        once it reaches prompt_cache_min_tokens, counted in 128-token increments
+        """
+        prefix, cached = (model,), 0
+        for message in messages:
+            prefix += (message["role"], message["content"])
+            if prefix not in self.owner.prompt_prefixes:
+                self.owner.prompt_prefixes.add(prefix)
+                break
+            cached += _count_tokens(message["content"])
+        if cached < self.owner.prompt_cache_min_tokens:
+            return 0
+        return cached - cached % 128
+
+    def create(self, model: str, messages: List[Dict[str, str]], max_tokens: int = 600, stream: bool = False, **kwargs):
+        self.owner.faults()
+        prompt_tokens = sum(_count_tokens(message["content"]) for message in messages)
+        cached_tokens = self._cached_prefix_tokens(model, messages)
+        if kwargs.get("response_format") == {"type": "json_object"}:
+            tokens = [self._rerank_answer(messages[-1]["content"])]
+        else:
+            tokens = self.owner.response_tokens[:max_tokens]
+        speed = self.owner.model_speed.get(model, 1.0)
+        # Reading the prompt takes time too (prefill), except for the cached prefix
+        time.sleep((prompt_tokens - cached_tokens) * self.owner.prompt_token_latency_ms / 1000 / speed)
+        usage = SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=len(tokens),
+            total_tokens=prompt_tokens + len(tokens),
+            prompt_tokens_details=SimpleNamespace(cached_tokens=cached_tokens),
+        )
+        self.owner.chat_calls.append({"model": model, "prompt_tokens": prompt_tokens, "cached_tokens": cached_tokens,
+                                      "messages": messages})
+        if stream:
+            return self._stream(tokens)
+
+        # Generation time grows with the number of output tokens
+        time.sleep(len(tokens) * self.owner.token_latency_ms / 1000 / speed)
+        message = SimpleNamespace(role="assistant", content="".join(tokens))
+        return SimpleNamespace(choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")], usage=usage, model=model)
+
+    def _stream(self, tokens: List[str]) -> Iterator[SimpleNamespace]:
+        for token in tokens:
+            time.sleep(self.owner.token_latency_ms / 1000)
+            delta = SimpleNamespace(content=token, role="assistant")
+            yield SimpleNamespace(choices=[SimpleNamespace(index=0, delta=delta, finish_reason=None)])
+
+
+class FakeOpenAIClient:
+    """Stand-in for `openai.OpenAI` with configurable latency and token streams"""
+
+    def __init__(self, faults: Optional[FaultInjector] = None, dimensions: int = 256,
+                 response_text: str = FAKE_RESPONSE, transcription: str = FAKE_TRANSCRIPTION,
+                 token_latency_ms: float = 0.0, whisper_scale: float = 4.0, prompt_token_latency_ms: float = 0.0,
+                 model_speed: Optional[Dict[str, float]] = None, prompt_cache_min_tokens: int = 1024,
+                 whisper_ms_per_kb: float = 0.0):
+        self.faults = faults or FaultInjector()
+        self.dimensions = dimensions
+        self.transcription = transcription
+        self.token_latency_ms = token_latency_ms
+        self.prompt_token_latency_ms = prompt_token_latency_ms
+        self.whisper_scale = whisper_scale
+        self.whisper_ms_per_kb = whisper_ms_per_kb
+        # Relative speed per model; latencies are divided by it
+        self.model_speed = model_speed or {}
+        self.prompt_cache_min_tokens = prompt_cache_min_tokens
+        self.prompt_prefixes = set()
+        # Split into word-sized tokens so streams look like the real API
+        self.response_tokens = [piece + " " for piece in response_text.split(" ")]
+        self.embedding_calls = 0
+        self.chat_calls: List[Dict[str, Any]] = []
+        self.embeddings = _FakeEmbeddings(self)
+        self.audio = SimpleNamespace(transcriptions=_FakeTranscriptions(self))
+        self.chat = SimpleNamespace(completions=_FakeChatCompletions(self))
+
+
+def _matches_filter(metadata: Dict[str, Any], filter: Optional[Dict[str, Any]]) -> bool:
+    if not filter:
+        return True
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(_matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(_matches_filter(metadata, sub) for sub in condition):
+                return False
+            continue
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for op, expected in condition.items():
+            if op == "$eq" and value != expected:
+                return False
+            if op == "$ne" and value == expected:
+                return False
+            if op == "$in" and value not in expected:
+                return False
+            if op == "$nin" and value in expected:
+                return False
+    return True
+
+
+class InMemoryIndex:
+    """Stand-in for `pinecone.Index` using brute-force cosine similarity"""
+
+    def __init__(self, faults: Optional[FaultInjector] = None):
+        self.faults = faults or FaultInjector()
+        self.namespaces: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def describe_index_stats(self, **kwargs):
+        with self._lock:
+            namespaces = {name: {"vector_count": len(vectors)} for name, vectors in self.namespaces.items()}
+        return {"namespaces": namespaces, "total_vector_count": sum(n["vector_count"] for n in namespaces.values())}
+
+    def upsert(self, vectors: List[Dict[str, Any]], namespace: str = "", **kwargs):
+        self.faults(scale=1 + len(vectors) / 100)
+        with self._lock:
+            store = self.namespaces.setdefault(namespace, {})
+            for vector in vectors:
+                store[vector["id"]] = vector
+        return SimpleNamespace(upserted_count=len(vectors))
+
+    def query(self, vector: List[float], top_k: int = 3, include_metadata: bool = False,
+              namespace: str = "", filter: Optional[Dict[str, Any]] = None, **kwargs):
+        self.faults()
+        with self._lock:
+            candidates = list(self.namespaces.get(namespace, {}).values())
+        scored = []
+        for candidate in candidates:
+            metadata = candidate.get("metadata", {})
+            if not _matches_filter(metadata, filter):
+                continue
+            score = sum(a * b for a, b in zip(vector, candidate["values"]))
+            scored.append(SimpleNamespace(
+                id=candidate["id"],
+                score=score,
+                values=candidate["values"],
+                metadata=metadata if include_metadata else None,
+            ))
+        scored.sort(key=lambda match: match.score, reverse=True)
+        return SimpleNamespace(matches=scored[:top_k], namespace=namespace)
+
+    def fetch(self, ids: List[str], namespace: str = "", **kwargs):
+        self.faults()
+        with self._lock:
+            store = self.namespaces.get(namespace, {})
+            vectors = {
+                vector_id: SimpleNamespace(id=vector_id, values=store[vector_id]["values"], metadata=store[vector_id].get("metadata", {}))
+                for vector_id in ids if vector_id in store
+            }
+        return SimpleNamespace(vectors=vectors, namespace=namespace)
+
+    def delete(self, ids: Optional[List[str]] = None, namespace: str = "", delete_all: bool = False, **kwargs):
+        self.faults()
+        with self._lock:
+            store = self.namespaces.setdefault(namespace, {})
+            if delete_all:
+                store.clear()
+            for vector_id in ids or []:
+                store.pop(vector_id, None)
+        return {}
+
+
+class FakeFile:
+    """Stand-in for `telegram.File`"""
+
+    def __init__(self, file_id: str, content: bytes, download_latency_ms: float = 0.0):
+        self.file_id = file_id
+        self.file_size = len(content)
+        self.content = content
+        self.download_latency_ms = download_latency_ms
+
+    async def download_to_drive(self, custom_path: str = None):
+        await asyncio.sleep(self.download_latency_ms / 1000)
+        with open(custom_path, "wb") as file:
+            file.write(self.content)
+        return custom_path
+
+    async def download_to_memory(self, out: io.BufferedIOBase = None):
+        await asyncio.sleep(self.download_latency_ms / 1000)
+        out.write(self.content)
+
+
+class FakeBot:
+    """Stand-in for `telegram.Bot` serving files registered by the update generator"""
+
+    def __init__(self, download_latency_ms: float = 0.0, api_latency_ms: float = 0.0):
+        self.files: Dict[str, bytes] = {}
+        self.download_latency_ms = download_latency_ms
+        self.api_latency_ms = api_latency_ms
+        self.sent_messages = 0
+        self.sent_documents = 0
+        self.failure_replies = 0
+
+    async def get_file(self, file_id: str):
+        await asyncio.sleep(self.api_latency_ms / 1000)
+        return FakeFile(file_id, self.files[file_id], self.download_latency_ms)
+
+
+class FakeMessage:
+    """Stand-in for `telegram.Message` recording replies"""
+
+    _ids = count(1)
+
+    def __init__(self, bot: FakeBot, chat_id: int, text: str = None, voice=None, document=None,
+                 media_group_id: str = None, caption: str = None):
+        self.message_id = next(self._ids)
+        self.bot = bot
+        self.chat_id = chat_id
+        self.chat = SimpleNamespace(id=chat_id, type="private")
+        self.from_user = SimpleNamespace(id=chat_id, is_bot=False)
+        self.text = text
+        self.voice = voice
+        self.document = document
+        self.media_group_id = media_group_id
+        self.caption = caption
+        self.replies: List["FakeMessage"] = []
+        self.edits: List[str] = []
+
+    async def _api_call(self):
+        await asyncio.sleep(self.bot.api_latency_ms / 1000)
+
+    async def reply_text(self, text: str, **kwargs) -> "FakeMessage":
+        await self._api_call()
+        self.bot.sent_messages += 1
+        if text.startswith(FAILURE_REPLY_PREFIXES):
+            self.bot.failure_replies += 1
+        reply = FakeMessage(self.bot, self.chat_id, text=text)
+        self.replies.append(reply)
+        return reply
+
+    async def reply_document(self, document: Any, **kwargs) -> "FakeMessage":
+        await self._api_call()
+        self.bot.sent_documents += 1
+        reply = FakeMessage(self.bot, self.chat_id, document=document)
+        self.replies.append(reply)
+        return reply
+
+    async def edit_text(self, text: str, **kwargs) -> "FakeMessage":
+        await self._api_call()
+        self.text = text
+        self.edits.append(text)
+        return self
+
+
+class FakeCallbackQuery:
+    """Stand-in for `telegram.CallbackQuery` recording message edits"""
+
+    def __init__(self, message: FakeMessage, data: str, user: SimpleNamespace):
+        self.message = message
+        self.data = data
+        self.from_user = user
+
+    async def answer(self, *args, **kwargs):
+        await self.message._api_call()
+
+    async def edit_message_text(self, text: str, **kwargs) -> FakeMessage:
+        return await self.message.edit_text(text, **kwargs)
+
+
+class FakeApplication:
+    """Stand-in for `telegram.ext.Application` tracking tasks started with create_task"""
+
+    def __init__(self):
+        self.tasks: Set[asyncio.Task] = set()
+
+    def create_task(self, coroutine, update: Any = None, **kwargs) -> asyncio.Task:
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def wait_for_tasks(self):
+        while self.tasks:
+            await asyncio.gather(*list(self.tasks), return_exceptions=True)
+
+
+class FakeContext:
+    """Stand-in for `telegram.ext.CallbackContext`"""
+
+    def __init__(self, bot: FakeBot, user_data: Optional[Dict[str, Any]] = None, application: Any = None):
+        self.bot = bot
+        self.user_data = user_data if user_data is not None else {}
+        self.chat_data: Dict[str, Any] = {}
+        self.bot_data: Dict[str, Any] = {}
+        self.args: List[str] = []
+        self.application = application
+
+
+class UpdateGenerator:
+    """Builds Telegram-shaped voice and document updates"""
+
+    def __init__(self, bot: FakeBot, users: int = 50, seed: int = 0, application: FakeApplication = None):
+        self.bot = bot
+        self.application = application or FakeApplication()
+        self.users = users
+        self._random = random.Random(seed)
+        self._update_ids = count(1)
+        self._file_ids = count(1)
+        self._user_data: Dict[int, Dict[str, Any]] = {}
+
+    def _register_file(self, content: bytes) -> str:
+        file_id = f"file-{next(self._file_ids)}"
+        self.bot.files[file_id] = content
+        return file_id
+
+    def user(self) -> SimpleNamespace:
+        user_id = 1000 + self._random.randrange(self.users)
+        return SimpleNamespace(id=user_id, first_name=f"Advisor {user_id}", is_bot=False)
+
+    def context_for(self, update: SimpleNamespace) -> FakeContext:
+        user_data = self._user_data.setdefault(update.effective_user.id, {})
+        return FakeContext(self.bot, user_data, self.application)
+
+    def text(self, words: int) -> str:
+        """Random product-like text drawn from a small vocabulary"""
+        vocabulary = ["страхування", "внесок", "пенсія", "накопичення", "поліс", "ризик", "дохід", "клієнт"]
+        return " ".join(self._random.choice(vocabulary) for _ in range(words))
+
+    def voice_update(self, duration: int = 30, size_bytes: int = 48_000) -> SimpleNamespace:
+        user = self.user()
+        content = self._random.randbytes(size_bytes)
+        voice = SimpleNamespace(
+            file_id=self._register_file(content),
+            file_unique_id=f"u{self._random.getrandbits(32)}",
+            duration=duration,
+            mime_type="audio/ogg",
+            file_size=size_bytes,
+        )
+        message = FakeMessage(self.bot, chat_id=user.id, voice=voice)
+        return SimpleNamespace(update_id=next(self._update_ids), message=message,
+                               effective_user=user, effective_chat=message.chat, callback_query=None)
+
+    def callback_update(self, data: str) -> SimpleNamespace:
+        """Inline button press, e.g. data="clients" for the client list"""
+        user = self.user()
+        message = FakeMessage(self.bot, chat_id=user.id, text="menu")
+        return SimpleNamespace(update_id=next(self._update_ids), message=None, effective_user=user,
+                               effective_chat=message.chat, callback_query=FakeCallbackQuery(message, data, user))
+
+    def document_update(self, words: int = 5000, file_name: str = None, content: bytes = None,
+                        media_group_id: str = None, caption: str = None,
+                        user: SimpleNamespace = None) -> SimpleNamespace:
+        """Document message; pass the same user for every file of an album"""
+        user = user or self.user()
+        if content is None:
+            content = self.text(words).encode()
+        file_id = self._register_file(content)
+        document = SimpleNamespace(
+            file_id=file_id,
+            file_unique_id=f"u{self._random.getrandbits(32)}",
+            file_name=file_name or f"{file_id}.txt",
+            mime_type="text/plain",
+            file_size=len(content),
+        )
+        message = FakeMessage(self.bot, chat_id=user.id, document=document,
+                              media_group_id=media_group_id, caption=caption)
+        return SimpleNamespace(update_id=next(self._update_ids), message=message,
+                               effective_user=user, effective_chat=message.chat, callback_query=None)
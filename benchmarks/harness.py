@@ -0,0 +1,183 @@
+"""Shared plumbing for the offline benchmarks: environment, fakes wiring and reporting"""
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), "src")
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+
+# Dummy credentials so service construction never needs a real .env
+FAKE_ENV = {
+    "TELEGRAM_BOT_TOKEN": "123456:benchmark",
+    "OPENAI_API_KEY": "sk-benchmark",
+    "PINECONE_API_KEY": "benchmark",
+    "PINECONE_HOST": "https://benchmark.invalid",
+    "PINECONE_INDEX_NAME": "benchmark",
+    "METRICS_PORT": "0",
+    "LOG_LEVEL": "WARNING",
+}
+
+
+def prepare_environment(workdir: Optional[str] = None) -> str:
+    """Point the bot at a scratch directory and fake credentials; call before importing bot code"""
+    for key, value in FAKE_ENV.items():
+        os.environ.setdefault(key, value)
+    if SRC_DIR not in sys.path:
+        sys.path.insert(0, SRC_DIR)
+    workdir = workdir or tempfile.mkdtemp(prefix="tg-ai-agent-bench-")
+    # DatabaseService and log sinks use paths relative to the working directory
+    os.chdir(workdir)
+    return workdir
+
+
+def quiet_logging(level: str = "WARNING"):
+    from loguru import logger
+    logger.remove()
+    logger.add(sys.stderr, level=level)
+
+
+def install_fakes(openai_client: Any, index: Any):
+    """Swap the network clients of the service singletons for local fakes"""
+    from services.openai_service import openai_service
+    from services.pinecone_service import pinecone_service
+    openai_service.client = openai_client
+    pinecone_service.index = index
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize_latencies(values: List[float]) -> Dict[str, Optional[float]]:
+    """Latency summary in milliseconds"""
+    to_ms = lambda value: None if value is None else round(value * 1000, 3)
+    return {
+        "count": len(values),
+        "mean_ms": to_ms(sum(values) / len(values)) if values else None,
+        "p50_ms": to_ms(percentile(values, 50)),
+        "p95_ms": to_ms(percentile(values, 95)),
+        "p99_ms": to_ms(percentile(values, 99)),
+        "max_ms": to_ms(max(values)) if values else None,
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and KiB on Linux
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 2)
+
+
+def current_rss_mb() -> float:
+    """Current resident set size in MiB (Linux), falling back to the peak"""
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024), 2)
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+class LoopLagProbe:
+    """Measures how late the event loop wakes up from short sleeps"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - started - self.interval))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> Dict[str, Optional[float]]:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        return summarize_latencies(self.samples)
+
+
+async def run_concurrently(make_call: Callable[[int], Awaitable[Any]], requests: int, concurrency: int) -> Dict[str, Any]:
+    """Run `requests` calls with at most `concurrency` in flight and collect latencies"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def _one(i: int):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                await make_call(i)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    probe = LoopLagProbe()
+    probe.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(_one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - started
+    loop_lag = await probe.stop()
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 4),
+        "throughput_rps": round(requests / elapsed, 3) if elapsed else None,
+        "latency": summarize_latencies(latencies),
+        "loop_lag": loop_lag,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARKS_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(name: str, config: Dict[str, Any], results: Any, output: Optional[str] = None) -> str:
+    """Write results as JSON with enough context to compare runs across commits"""
+    payload = {
+        "benchmark": name,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config,
+        "results": results,
+    }
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{name}-{stamp}.json")
+    with open(output, "w", encoding="utf-8") as file:
+        json.dump(payload, file, ensure_ascii=False, indent=2)
+    return output
@@ -1,7 +1,12 @@
+import asyncio
+import functools
+import io
 import os
+import re
+import time
 import tempfile
-import json
-from typing import BinaryIO, Dict, Any
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, BinaryIO, Callable, Dict, Any, Iterator, List
 from loguru import logger
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
@@ -14,18 +19,51 @@ from telegram.ext import (
     filters
 )
 from services.rag_service import rag_service
+from services.audio_service import audio_service
 from services.database_service import database_service
-import PyPDF2
-import docx
-import openpyxl
-from pptx import Presentation
+from services.client_context import client_context
+from services.resilience import CircuitOpenError
+from services.metrics_service import metrics_service
+from services.loop_monitor import loop_monitor
+from services.profiler import profiler, ProfilerBusyError, PROFILED_HANDLERS
+from services.persistence_service import SQLitePersistence
+from services.lifecycle import start_services, stop_services
 
 # Conversation states
 AWAITING_INPUT = 1
 
-# Configure logging
-logger.add("bot.log", rotation="500 MB")
+# Telegram user ids allowed to run admin commands such as /perf
+ADMIN_USER_IDS = {
+    int(user_id) for user_id in os.getenv("ADMIN_USER_IDS", "").split(",") if user_id.strip()
+}
 
+# Row groups and line groups yielded by the streaming extractors
+TABLE_ROWS_PER_BLOCK = int(os.getenv("TABLE_ROWS_PER_BLOCK", "20"))
+TEXT_LINES_PER_BLOCK = int(os.getenv("TEXT_LINES_PER_BLOCK", "200"))
+
+# Files up to this size are downloaded into memory; larger ones spill to a temporary file
+MAX_IN_MEMORY_DOWNLOAD = int(os.getenv("MAX_IN_MEMORY_DOWNLOAD", str(8 * 1024 * 1024)))
+
+# Album documents arriving within this many seconds of each other are ingested together
+MEDIA_GROUP_WAIT = float(os.getenv("MEDIA_GROUP_WAIT", "1.0"))
+MEDIA_GROUP_CONCURRENCY = int(os.getenv("MEDIA_GROUP_CONCURRENCY", "4"))
+
+# media_group_id -> album messages received so far and the time the album counts as complete
+_media_groups: Dict[str, Dict[str, Any]] = {}
+
+SUPPORTED_DOCUMENT_FORMATS = ('.txt', '.md', '.pdf', '.doc', '.docx', '.xlsx', '.pptx')
+# Formats whose extractor yields one block per page or slide, empty ones included, so the block index is the page
+PAGED_DOCUMENT_FORMATS = ('.pdf', '.pptx')
+
+def with_request_id(handler: Callable[[Update, ContextTypes.DEFAULT_TYPE], Awaitable[Any]]):
+    """Tag every log record written while handling an update with the update id"""
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        with logger.contextualize(request_id=update.update_id):
+            return await handler(update, context)
+    return wrapper
+
+@with_request_id
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send a message when the command /start is issued."""
     keyboard = [
@@ -43,6 +81,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=reply_markup
     )
 
+@with_request_id
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send a message when the command /help is issued."""
     await update.message.reply_text(
@@ -58,6 +97,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "- PowerPoint презентації (.pptx)"
     )
 
+@with_request_id
 async def settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle settings button click."""
     query = update.callback_query
@@ -76,6 +116,138 @@ async def settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
         reply_markup=reply_markup
     )
 
+def is_admin(update: Update) -> bool:
+    """Check whether the update comes from a configured admin."""
+    user = update.effective_user
+    return user is not None and user.id in ADMIN_USER_IDS
+
+def _format_ms(seconds) -> str:
+    return "-" if seconds is None else f"{seconds * 1000:.0f}"
+
+@with_request_id
+async def perf_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show pipeline stage latency percentiles and OpenAI spend (admin only)."""
+    if not is_admin(update):
+        await update.message.reply_text("⛔ Ця команда доступна лише адміністраторам.")
+        return
+
+    stages = metrics_service.get_percentiles("pipeline_stage_seconds")
+    if not stages:
+        await update.message.reply_text("📊 Метрик ще немає. Надішліть голосове повідомлення.")
+        return
+
+    lines = ["📊 Затримки етапів, мс (n / p50 / p95 / p99):"]
+    for stage in stages:
+        label = ",".join(stage['labels'].values())
+        lines.append(
+            f"{label}: {stage['count']} / {_format_ms(stage['p50'])} / "
+            f"{_format_ms(stage['p95'])} / {_format_ms(stage['p99'])}"
+        )
+
+    tokens = metrics_service.get_counter("openai_tokens_total")
+    if tokens:
+        lines.append("\n🔢 Токени:")
+        for labels, value in sorted(tokens.items()):
+            labels = dict(labels)
+            lines.append(f"{labels['model']} ({labels['type']}): {int(value)}")
+
+    costs = metrics_service.get_counter("openai_cost_usd_total")
+    if costs:
+        lines.append(f"\n💵 Вартість: ${sum(costs.values()):.4f}")
+
+    await update.message.reply_text("\n".join(lines))
+
+@with_request_id
+async def loop_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show event loop lag and the call sites that blocked it (admin only)."""
+    if not is_admin(update):
+        await update.message.reply_text("⛔ Ця команда доступна лише адміністраторам.")
+        return
+
+    lag = metrics_service.get_percentiles("event_loop_lag_seconds")
+    lines = ["🔄 Затримка event loop, мс:"]
+    if lag:
+        lines.append(
+            f"p50 {_format_ms(lag[0]['p50'])} / p95 {_format_ms(lag[0]['p95'])} / "
+            f"p99 {_format_ms(lag[0]['p99'])} / max {_format_ms(loop_monitor.max_lag)}"
+        )
+    else:
+        lines.append("даних ще немає")
+
+    offenders = loop_monitor.get_offenders()
+    if offenders:
+        lines.append(f"\n🐢 Блокуючі виклики (> {_format_ms(loop_monitor.threshold)} мс):")
+        for offender in offenders:
+            lines.append(
+                f"{offender['call_site']}\n"
+                f"  {offender['count']}×, всього {_format_ms(offender['total'])} мс, "
+                f"макс {_format_ms(offender['max'])} мс"
+            )
+    else:
+        lines.append("\n✅ Блокуючих викликів не виявлено.")
+
+    await update.message.reply_text("\n".join(lines))
+
+def _format_profile(report: Dict[str, Any]) -> str:
+    """Per-handler summary of a profile: share of event loop CPU and average tasks in flight."""
+    lines = [
+        f"🔥 Профіль за {report['seconds']:.0f} с: {report['cpu_samples']} зразків стеків, "
+        f"{report['wall_samples']} зразків задач, накладні витрати {report['overhead']:.1%}",
+        "\nОбробник: CPU event loop / задач одночасно:",
+    ]
+    cpu_samples = max(report["cpu_samples"], 1)
+    wall_samples = max(report["wall_samples"], 1)
+    for handler, counts in report["handlers"].items():
+        lines.append(f"{handler}: {counts['cpu'] / cpu_samples:.1%} / {counts['wall'] / wall_samples:.2f}")
+
+    waits = [(handler, report["top_waits"][handler]) for handler in PROFILED_HANDLERS if report["top_waits"][handler]]
+    if waits:
+        lines.append("\n⏳ Де чекають обробники:")
+        for handler, frames in waits:
+            lines.append(f"{handler}:")
+            lines.extend(f"  {frame} — {count}" for frame, count in frames)
+    return "\n".join(lines)
+
+async def _send_profile(message: Any, seconds: float):
+    """Run a profile in the background and send the collapsed stacks back as a file."""
+    try:
+        report = await profiler.profile(seconds)
+        await message.reply_document(
+            document=io.BytesIO(report["collapsed"].encode("utf-8")),
+            filename=f"profile-{report['started_at']}.collapsed",
+        )
+        await message.reply_text(_format_profile(report))
+    except ProfilerBusyError:
+        await message.reply_text("⏳ Профілювання вже триває, дочекайтеся результату.")
+    except Exception as e:
+        logger.error(f"Error sending profile: {str(e)}")
+        await message.reply_text("😕 Не вдалося зібрати профіль. Спробуйте пізніше.")
+
+@with_request_id
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Sample the running bot for the given number of seconds and send a flamegraph file (admin only)."""
+    if not is_admin(update):
+        await update.message.reply_text("⛔ Ця команда доступна лише адміністраторам.")
+        return
+    if not profiler.enabled:
+        await update.message.reply_text("🚫 Профілювання вимкнено (PROFILER_ENABLED=false).")
+        return
+
+    try:
+        seconds = float(context.args[0]) if context.args else 30.0
+    except ValueError:
+        await update.message.reply_text("Використання: /profile <секунди>, наприклад /profile 30")
+        return
+    if profiler.running:
+        await update.message.reply_text("⏳ Профілювання вже триває, дочекайтеся результату.")
+        return
+
+    seconds = min(max(seconds, 1.0), profiler.max_seconds)
+    await update.message.reply_text(f"⏱ Профілюю {seconds:.0f} с, потім надішлю файл для flamegraph.")
+    # Updates are handled one at a time, so the profile must not hold up this handler
+    context.application.create_task(_send_profile(update.message, seconds), update=update)
+
+@with_request_id
 async def handle_settings_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle settings menu callbacks."""
     query = update.callback_query
@@ -98,58 +270,163 @@ async def handle_settings_callback(update: Update, context: ContextTypes.DEFAULT
         # Тут можна додати логіку отримання статистики
         await query.edit_message_text("📊 Статистика бази знань буде доступна незабаром.")
 
-def extract_text_from_pdf(file_path: str) -> str:
-    """Extract text from PDF file."""
-    text = ""
-    with open(file_path, 'rb') as file:
-        reader = PyPDF2.PdfReader(file)
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-    return text
-
-def extract_text_from_docx(file_path: str) -> str:
-    """Extract text from DOCX file."""
-    doc = docx.Document(file_path)
-    return "\n".join([paragraph.text for paragraph in doc.paragraphs])
-
-def extract_text_from_xlsx(file_path: str) -> str:
-    """Extract text from XLSX file."""
-    wb = openpyxl.load_workbook(file_path)
-    text = []
-    for sheet in wb.sheetnames:
-        ws = wb[sheet]
-        for row in ws.rows:
-            row_text = " ".join(str(cell.value) for cell in row if cell.value)
-            if row_text:
-                text.append(row_text)
-    return "\n".join(text)
-
-def extract_text_from_pptx(file_path: str) -> str:
-    """Extract text from PPTX file."""
-    prs = Presentation(file_path)
-    text = []
+# Parsers are imported inside the extractors so startup only pays for formats actually used.
+# Extractors are generators: they yield text blocks so chunking never needs the whole document.
+def iter_text_from_pdf(file: BinaryIO) -> Iterator[str]:
+    """Yield text of PDF pages, "" for pages without text."""
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(file)
+    for page in reader.pages:
+        yield page.extract_text() or ""
+
+def _iter_table_blocks(header: str, rows: List[str]) -> Iterator[str]:
+    """Yield groups of table rows, each prefixed with the header row for context."""
+    for i in range(0, len(rows), TABLE_ROWS_PER_BLOCK):
+        yield "\n".join([header, *rows[i:i + TABLE_ROWS_PER_BLOCK]])
+
+def iter_text_from_docx(file: BinaryIO) -> Iterator[str]:
+    """Yield DOCX paragraphs and table row groups in document order."""
+    import docx
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    doc = docx.Document(file)
+    for element in doc.element.body.iterchildren():
+        if element.tag.endswith('}p'):
+            text = Paragraph(element, doc).text
+            if text.strip():
+                yield text
+        elif element.tag.endswith('}tbl'):
+            rows = [
+                " | ".join(cell.text.strip() for cell in row.cells)
+                for row in Table(element, doc).rows
+            ]
+            if len(rows) == 1:
+                yield rows[0]
+            elif rows:
+                yield from _iter_table_blocks(rows[0], rows[1:])
+
+def iter_text_from_xlsx(file: BinaryIO) -> Iterator[str]:
+    """Yield XLSX row groups, streaming rows without loading the workbook object model."""
+    import openpyxl
+
+    wb = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        for ws in wb.worksheets:
+            header = None
+            has_body = False
+            rows = []
+            for values in ws.iter_rows(values_only=True):
+                row_text = " ".join(str(value) for value in values if value is not None and value != "")
+                if not row_text:
+                    continue
+                if header is None:
+                    header = row_text
+                    continue
+                rows.append(row_text)
+                has_body = True
+                if len(rows) >= TABLE_ROWS_PER_BLOCK:
+                    yield from _iter_table_blocks(header, rows)
+                    rows = []
+            if rows:
+                yield from _iter_table_blocks(header, rows)
+            elif header is not None and not has_body:
+                # A sheet with a single row still carries text worth indexing
+                yield header
+    finally:
+        # Read-only workbooks keep the archive open until closed
+        wb.close()
+
+def iter_text_from_pptx(file: BinaryIO) -> Iterator[str]:
+    """Yield PPTX text slide by slide, "" for slides without text."""
+    from pptx import Presentation
+
+    prs = Presentation(file)
     for slide in prs.slides:
+        text = []
         for shape in slide.shapes:
-            if hasattr(shape, "text"):
+            if hasattr(shape, "text") and shape.text:
                 text.append(shape.text)
-    return "\n".join(text)
+            elif getattr(shape, "has_table", False):
+                for row in shape.table.rows:
+                    text.append(" | ".join(cell.text.strip() for cell in row.cells))
+        yield "\n".join(text)
+
+def iter_text_from_plain(file: BinaryIO) -> Iterator[str]:
+    """Yield UTF-8 text files in groups of lines."""
+    lines = []
+    for line in file:
+        lines.append(line.decode('utf-8'))
+        if len(lines) >= TEXT_LINES_PER_BLOCK:
+            yield "".join(lines)
+            lines = []
+    if lines:
+        yield "".join(lines)
+
+def iter_document_text(file: BinaryIO, file_name: str) -> Iterator[str]:
+    """Pick the extractor for a document based on its extension."""
+    if file_name.endswith('.pdf'):
+        return iter_text_from_pdf(file)
+    elif file_name.endswith(('.doc', '.docx')):
+        return iter_text_from_docx(file)
+    elif file_name.endswith('.xlsx'):
+        return iter_text_from_xlsx(file)
+    elif file_name.endswith('.pptx'):
+        return iter_text_from_pptx(file)
+    else:  # txt or md
+        return iter_text_from_plain(file)
 
+@asynccontextmanager
+async def download_file(context: ContextTypes.DEFAULT_TYPE, file_id: str, file_size: int = None,
+                        media: str = "document") -> AsyncIterator[BinaryIO]:
+    """Download a Telegram file into a rewound buffer that is released on exit."""
+    if file_size is not None and file_size <= MAX_IN_MEMORY_DOWNLOAD:
+        buffer = io.BytesIO()
+    else:
+        # Unknown or large sizes: stays in memory up to the threshold, then rolls over to disk
+        buffer = tempfile.SpooledTemporaryFile(max_size=MAX_IN_MEMORY_DOWNLOAD)
+
+    try:
+        with metrics_service.timer("telegram_download", media=media):
+            telegram_file = await context.bot.get_file(file_id)
+            await telegram_file.download_to_memory(out=buffer)
+        buffer.seek(0)
+        yield buffer
+    finally:
+        buffer.close()
+
+@with_request_id
 async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle voice messages."""
+    with metrics_service.timer("voice_total"):
+        await _process_voice(update, context)
+
+async def _process_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Run the voice pipeline and reply with the result."""
     try:
-        # Send initial status
-        status_message = await update.message.reply_text("🎧 Обробляю ваше голосове повідомлення...")
-        
         # Get voice file
         voice = update.message.voice
-        voice_file = await context.bot.get_file(voice.file_id)
+
+        # Reject notes over the limit before downloading them
+        if audio_service.is_too_long(voice.duration):
+            await update.message.reply_text(
+                f"⏱ Голосове повідомлення задовге ({voice.duration // 60} хв {voice.duration % 60} с). "
+                f"Максимальна тривалість — {audio_service.max_duration // 60} хв. "
+                "Будь ласка, розділіть його на кілька коротших."
+            )
+            return
+
+        # Send initial status
+        status_message = await update.message.reply_text("🎧 Обробляю ваше голосове повідомлення...")
         
-        # Download voice file to temporary location
-        with tempfile.NamedTemporaryFile(suffix=".ogg", delete=False) as temp_file:
-            await voice_file.download_to_drive(temp_file.name)
-            
+        # Download voice file into memory
+        async with download_file(context, voice.file_id, voice.file_size, media="voice") as audio_file:
             # Process audio using RAG service
-            result = await rag_service.process_audio_query(temp_file.name)
+            result = await rag_service.process_audio_query(
+                audio_file, namespaces=rag_service.get_search_namespaces(update.effective_user.id),
+                duration=voice.duration
+            )
             
             # Extract client info from the response
             client_info = extract_client_info(result['response'])
@@ -157,7 +434,7 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # Store client info in context for later use
             if client_info:
                 context.user_data['current_client_info'] = client_info
-                logger.info(f"Extracted client info: {client_info}")
+                logger.bind(payload=True).info("Extracted client info: {}", client_info)
             
             # Add buttons for saving/editing client info
             keyboard = [
@@ -166,18 +443,30 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     InlineKeyboardButton("✏️ Редагувати дані", callback_data='edit_client')
                 ]
             ]
+
+            # A recognised client is only a suggestion; the advisor confirms it is the same person
+            context.user_data['recognized_client_id'] = result.get('client_id')
+            if result.get('client_id') is not None:
+                known_client = await database_service.get_client(result['client_id'])
+                if known_client:
+                    keyboard.insert(0, [InlineKeyboardButton(
+                        f"🔁 Повторна зустріч: {known_client['full_name']}", callback_data='save_follow_up'
+                    )])
             reply_markup = InlineKeyboardMarkup(keyboard)
             
             # Send transcription and response
-            await status_message.edit_text(
-                f"🎯 Я почув: {result['transcription']}\n\n"
-                f"🤖 Моя відповідь: {result['response']}",
-                reply_markup=reply_markup
-            )
-            
-        # Cleanup temporary file
-        os.unlink(temp_file.name)
+            with metrics_service.timer("telegram_reply"):
+                await status_message.edit_text(
+                    f"🎯 Я почув: {result['transcription']}\n\n"
+                    f"🤖 Моя відповідь: {result['response']}",
+                    reply_markup=reply_markup
+                )
         
+    except CircuitOpenError as e:
+        logger.warning(f"Voice message rejected, upstream unavailable: {str(e)}")
+        await update.message.reply_text(
+            "⏳ AI-сервіс тимчасово недоступний. Будь ласка, спробуйте ще раз за хвилину."
+        )
     except Exception as e:
         logger.error(f"Error processing voice message: {str(e)}")
         await update.message.reply_text(
@@ -246,7 +535,7 @@ def extract_client_info(response_text: str) -> Dict[str, Any]:
         # Validate required fields
         required_fields = ['full_name', 'age', 'product_type', 'goal']
         if all(field in client_info for field in required_fields):
-            logger.info(f"Successfully extracted client info: {client_info}")
+            logger.bind(payload=True).debug("Successfully extracted client info: {}", client_info)
             return client_info
             
         missing_fields = [field for field in required_fields if field not in client_info]
@@ -257,6 +546,7 @@ def extract_client_info(response_text: str) -> Dict[str, Any]:
         logger.error(f"Error extracting client info: {str(e)}")
         return None
 
+@with_request_id
 async def handle_clients(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle clients button click"""
     query = update.callback_query
@@ -298,12 +588,13 @@ async def handle_clients(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "❌ Помилка при отриманні списку клієнтів. Спробуйте пізніше."
         )
 
+@with_request_id
 async def handle_client_action(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle client-related button actions"""
     query = update.callback_query
     await query.answer()
     
-    if query.data == 'save_client':
+    if query.data in ('save_client', 'save_follow_up'):
         client_info = context.user_data.get('current_client_info')
         if not client_info:
             await query.message.reply_text(
@@ -323,8 +614,15 @@ async def handle_client_action(update: Update, context: ContextTypes.DEFAULT_TYP
                 )
                 return
             
+            # Only a confirmed follow-up updates an existing client; otherwise a new one is created
+            client_info = {key: value for key, value in client_info.items() if key != 'client_id'}
+            if query.data == 'save_follow_up' and context.user_data.get('recognized_client_id') is not None:
+                client_info['client_id'] = context.user_data['recognized_client_id']
+
             # Save client data
             client_id = await database_service.save_client(client_info)
+            # The save invalidated the client's cached profile; rebuild it before their next meeting
+            context.application.create_task(client_context.prewarm(client_id), update=update)
             
             # Send success message with client details
             success_message = (
@@ -358,6 +656,7 @@ async def handle_client_action(update: Update, context: ContextTypes.DEFAULT_TYP
             
             # Clear the stored client info after successful save
             context.user_data['current_client_info'] = None
+            context.user_data['recognized_client_id'] = None
             
         except Exception as e:
             logger.error(f"Error saving client: {str(e)}")
@@ -403,6 +702,7 @@ async def handle_client_action(update: Update, context: ContextTypes.DEFAULT_TYP
         
         await query.message.reply_text(current_values, reply_markup=reply_markup)
 
+@with_request_id
 async def handle_edit_field(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle editing specific client fields"""
     query = update.callback_query
@@ -453,6 +753,7 @@ async def handle_edit_field(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     return ConversationHandler.END
 
+@with_request_id
 async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle text input for editing"""
     field = context.user_data.get('editing_field')
@@ -495,15 +796,14 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     return ConversationHandler.END
 
+@with_request_id
 async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle document messages."""
     try:
         # Check if document format is supported
         document = update.message.document
         file_name = document.file_name.lower()
-        supported_formats = ('.txt', '.md', '.pdf', '.doc', '.docx', '.xlsx', '.pptx')
-        
-        if not any(file_name.endswith(fmt) for fmt in supported_formats):
+        if not file_name.endswith(SUPPORTED_DOCUMENT_FORMATS):
             await update.message.reply_text(
                 "❌ Будь ласка, надсилайте файли лише в підтримуваних форматах:\n"
                 "- Текстові файли (.txt, .md)\n"
@@ -513,40 +813,34 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 "- PowerPoint презентації (.pptx)"
             )
             return
+
+        if update.message.media_group_id:
+            _queue_media_group_document(update, context)
+            return
             
         # Send initial status
         status_message = await update.message.reply_text("📚 Обробляю ваш документ...")
         
-        # Get document file
-        doc_file = await context.bot.get_file(document.file_id)
-        
-        # Download and process document
-        with tempfile.NamedTemporaryFile(suffix=os.path.splitext(file_name)[1], delete=False) as temp_file:
-            await doc_file.download_to_drive(temp_file.name)
-            
-            # Extract text based on file format
-            if file_name.endswith('.pdf'):
-                text = extract_text_from_pdf(temp_file.name)
-            elif file_name.endswith(('.doc', '.docx')):
-                text = extract_text_from_docx(temp_file.name)
-            elif file_name.endswith('.xlsx'):
-                text = extract_text_from_xlsx(temp_file.name)
-            elif file_name.endswith('.pptx'):
-                text = extract_text_from_pptx(temp_file.name)
-            else:  # txt or md
-                with open(temp_file.name, 'r', encoding='utf-8') as f:
-                    text = f.read()
-            
-            # Process document using RAG service
-            await rag_service.process_document(text, document.file_id)
-            
-            await status_message.edit_text(
-                "✅ Документ успішно оброблено! Я вивчив його вміст."
+        # Download document and stream its text into the RAG service
+        async with download_file(context, document.file_id, document.file_size) as file:
+            blocks = iter_document_text(file, file_name)
+            await rag_service.process_document_stream(
+                blocks,
+                document.file_id,
+                namespace=rag_service.get_namespace(update.effective_user.id),
+                metadata=document_metadata(update.message),
+                paged=file_name.endswith(PAGED_DOCUMENT_FORMATS),
             )
-            
-        # Cleanup temporary file
-        os.unlink(temp_file.name)
         
+        await status_message.edit_text(
+            "✅ Документ успішно оброблено! Я вивчив його вміст."
+        )
+        
+    except CircuitOpenError as e:
+        logger.warning(f"Document rejected, upstream unavailable: {str(e)}")
+        await update.message.reply_text(
+            "⏳ База знань тимчасово недоступна. Будь ласка, надішліть документ ще раз за хвилину."
+        )
     except Exception as e:
         logger.error(f"Error processing document: {str(e)}")
         await update.message.reply_text(
@@ -554,18 +848,153 @@ async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "Будь ласка, перевірте формат файлу та спробуйте ще раз."
         )
 
-def main():
-    """Start the bot."""
-    # Create application
-    application = Application.builder().token(os.getenv("TELEGRAM_BOT_TOKEN")).build()
+def caption_category(caption: str) -> str:
+    """Product category from the first hashtag of a caption, e.g. "#пенсія" -> "пенсія"."""
+    match = re.search(r"#(\w+)", caption or "")
+    return match.group(1).lower() if match else None
+
+def document_metadata(message: Any, category: str = None) -> Dict[str, Any]:
+    """Metadata stored with every chunk of an uploaded document."""
+    uploaded_at = int(time.time())
+    metadata = {
+        "source": message.document.file_name,
+        "uploaded_by": message.from_user.id,
+        "uploaded_at": uploaded_at,
+        "upload_date": time.strftime("%Y-%m-%d", time.gmtime(uploaded_at)),
+    }
+    category = category or caption_category(message.caption)
+    if category:
+        metadata["category"] = category
+    return metadata
+
+def _queue_media_group_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Collect an album document; the album is ingested once no new file arrived for MEDIA_GROUP_WAIT."""
+    loop = asyncio.get_running_loop()
+    group_id = update.message.media_group_id
+    group = _media_groups.get(group_id)
+    if group is None:
+        group = _media_groups[group_id] = {"messages": [], "deadline": 0.0}
+        context.application.create_task(_ingest_media_group(group_id, context), update=update)
+    group["messages"].append(update.message)
+    group["deadline"] = loop.time() + MEDIA_GROUP_WAIT
+
+async def _ingest_media_group(group_id: str, context: ContextTypes.DEFAULT_TYPE):
+    """Wait for the rest of the album, then ingest all of its documents as one batch."""
+    loop = asyncio.get_running_loop()
+    group = _media_groups[group_id]
+    while loop.time() < group["deadline"]:
+        await asyncio.sleep(group["deadline"] - loop.time())
+    # Files arriving after this point start a new group
+    del _media_groups[group_id]
+
+    with metrics_service.timer("media_group_total"):
+        await _process_media_group(group["messages"], context)
+
+async def _process_media_group(messages: List[Any], context: ContextTypes.DEFAULT_TYPE):
+    """Download and extract album documents in parallel, embedding their chunks in shared batches."""
+    total = len(messages)
+    status_message = await messages[0].reply_text(f"📚 Обробляю альбом документів (0/{total})...")
+    semaphore = asyncio.Semaphore(MEDIA_GROUP_CONCURRENCY)
+    progress_lock = asyncio.Lock()
+    progress = {"done": 0, "reported": 0}
+    failed: List[str] = []
+    # Telegram keeps an album caption on one of its messages; it describes the whole album
+    category = next(filter(None, (caption_category(message.caption) for message in messages)), None)
+    namespace = rag_service.get_namespace(messages[0].from_user.id)
+
+    async def report_progress():
+        # One status message for the whole album; edits are serialized so counts never go backwards
+        async with progress_lock:
+            if progress["done"] > progress["reported"] and progress["done"] < total:
+                progress["reported"] = progress["done"]
+                await status_message.edit_text(f"📚 Обробляю альбом документів ({progress['done']}/{total})...")
+
+    async def ingest(batch, message):
+        document = message.document
+        async with semaphore:
+            try:
+                file_name = document.file_name.lower()
+                async with download_file(context, document.file_id, document.file_size) as file:
+                    await batch.add(
+                        iter_document_text(file, file_name),
+                        document.file_id,
+                        namespace=namespace,
+                        metadata=document_metadata(message, category),
+                        paged=file_name.endswith(PAGED_DOCUMENT_FORMATS),
+                    )
+            except Exception as e:
+                if batch.error is not None:
+                    # Embedding or upsert failed: the shared batch is lost, so the whole album fails
+                    raise
+                logger.error(f"Error processing document {document.file_name}: {str(e)}")
+                failed.append(document.file_name)
+        progress["done"] += 1
+        await report_progress()
+
+    try:
+        async with rag_service.ingest_batch() as batch:
+            await asyncio.gather(*(ingest(batch, message) for message in messages))
+        logger.info(f"Stored {batch.stored} vectors for an album of {total} documents")
+    except CircuitOpenError as e:
+        logger.warning(f"Album rejected, upstream unavailable: {str(e)}")
+        await status_message.edit_text(
+            "⏳ База знань тимчасово недоступна. Будь ласка, надішліть документи ще раз за хвилину."
+        )
+        return
+    except Exception as e:
+        logger.error(f"Error processing album: {str(e)}")
+        await status_message.edit_text(
+            "😕 Вибачте, виникла проблема з обробкою документів. Будь ласка, спробуйте ще раз."
+        )
+        return
+
+    if failed:
+        await status_message.edit_text(
+            f"⚠️ Оброблено {total - len(failed)} з {total} документів. "
+            f"Не вдалося обробити: {', '.join(failed)}. Перевірте формат цих файлів та спробуйте ще раз."
+        )
+    else:
+        await status_message.edit_text(f"✅ Усі документи ({total}) успішно оброблено! Я вивчив їх вміст.")
+
+async def post_init(application: Application):
+    """Start background services once the application is initialized."""
+    application.persistence.attach_application(application)
+    await start_services()
+    await metrics_service.start_http_server()
+    await loop_monitor.start()
+    if profiler.enabled and profiler.startup_seconds > 0:
+        application.create_task(profiler.profile_startup())
+
+async def post_shutdown(application: Application):
+    """Stop background services on shutdown."""
+    await loop_monitor.stop()
+    await metrics_service.stop_http_server()
+    await stop_services()
+
+def build_application(with_updater: bool = True) -> Application:
+    """Create the application and register all handlers."""
+    builder = (
+        Application.builder()
+        .token(os.getenv("TELEGRAM_BOT_TOKEN"))
+        .persistence(SQLitePersistence())
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if not with_updater:
+        # Webhook workers receive updates from the dispatcher instead of polling
+        builder = builder.updater(None)
+    application = builder.build()
 
     # Add handlers
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("help", help_command))
+    application.add_handler(CommandHandler("perf", perf_command))
+    application.add_handler(CommandHandler("loop", loop_command))
+    application.add_handler(CommandHandler("profile", profile_command))
     application.add_handler(CallbackQueryHandler(settings, pattern='^settings$'))
     application.add_handler(CallbackQueryHandler(handle_settings_callback, pattern='^(add_docs|delete_docs|stats)$'))
     application.add_handler(CallbackQueryHandler(handle_clients, pattern='^clients$'))
-    application.add_handler(CallbackQueryHandler(handle_client_action, pattern='^(save_client|edit_client|save_changes)$'))
+    application.add_handler(CallbackQueryHandler(handle_client_action, pattern='^(save_client|save_follow_up|edit_client|save_changes)$'))
     
     # Add handler for text messages during editing
     application.add_handler(MessageHandler(
@@ -583,7 +1012,17 @@ def main():
     application.add_handler(MessageHandler(filters.VOICE, handle_voice))
     application.add_handler(MessageHandler(filters.Document.ALL, handle_document))
 
+    return application
+
+def main():
+    """Start the bot."""
+    if os.getenv("BOT_MODE", "polling").lower() == "webhook":
+        from webhook import run_webhook
+        run_webhook()
+        return
+
     # Start the bot
+    application = build_application()
     application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 if __name__ == '__main__':
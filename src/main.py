@@ -1,18 +1,8 @@
-import os
 from dotenv import load_dotenv
 from loguru import logger
+from services.logging_setup import setup_logging
 from bot import main as run_bot
 
-def setup_logging():
-    """Configure logging settings"""
-    log_level = os.getenv("LOG_LEVEL", "INFO")
-    logger.add(
-        "logs/app.log",
-        level=log_level,
-        rotation="500 MB",
-        compression="zip"
-    )
-
 def main():
     """Main entry point of the application"""
     try:
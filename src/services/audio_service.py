@@ -0,0 +1,172 @@
+import asyncio
+import importlib.util
+import io
+import os
+import shutil
+from typing import TYPE_CHECKING, BinaryIO, List, Tuple
+from loguru import logger
+from .openai_service import openai_service
+from .metrics_service import metrics_service
+from .lifecycle import LazyService
+
+# numpy is imported where audio is analysed, so bot startup does not pay for it
+if TYPE_CHECKING:
+    import numpy as np
+
+# Loudness is measured over frames of this length
+FRAME_MS = 10
+# Kept around the trimmed speech so the first and last words are not clipped
+TRIM_PADDING_MS = 200
+
+
+def frame_levels(samples: "np.ndarray", frame_rate: int, full_scale: float) -> "np.ndarray":
+    """Loudness of every FRAME_MS frame in dBFS"""
+    import numpy as np
+
+    frame = max(1, frame_rate * FRAME_MS // 1000)
+    usable = len(samples) // frame * frame
+    frames = samples[:usable].astype(np.float32).reshape(-1, frame)
+    rms = np.sqrt((frames ** 2).mean(axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-9) / full_scale)
+
+
+def silent_ranges(levels: "np.ndarray", threshold: float, min_frames: int) -> List[Tuple[int, int]]:
+    """(start, end) frame ranges quieter than the threshold and at least min_frames long"""
+    import numpy as np
+
+    silent = np.concatenate(([False], levels < threshold, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(silent))
+    starts, ends = edges[::2], edges[1::2]
+    keep = ends - starts >= min_frames
+    return [(int(start), int(end)) for start, end in zip(starts[keep], ends[keep])]
+
+
+def speech_bounds(levels: "np.ndarray", threshold: float) -> Tuple[int, int]:
+    """First and one-past-last loud frame; the whole note when nothing is loud"""
+    import numpy as np
+
+    loud = np.flatnonzero(levels >= threshold)
+    if not len(loud):
+        return 0, len(levels)
+    return int(loud[0]), int(loud[-1]) + 1
+
+
+def plan_segments(length: int, pauses: List[Tuple[int, int]], target: int) -> List[Tuple[int, int]]:
+    """
+    Split [0, length) into segments of at most `target`, cutting in the middle of the last
+    pause in the second half of each window; a window without pauses is cut at the limit
+    """
+    segments, start = [], 0
+    while length - start > target:
+        limit = start + target
+        cuts = [(pause_start + pause_end) // 2 for pause_start, pause_end in pauses
+                if start + target // 2 < (pause_start + pause_end) // 2 <= limit]
+        end = cuts[-1] if cuts else limit
+        segments.append((start, end))
+        start = end
+    segments.append((start, length))
+    return segments
+
+
+class AudioService:
+    """
+    Checks voice notes before download and prepares them for Whisper.
+    With pydub and ffmpeg installed, long notes are trimmed of leading and trailing
+    silence and split at pauses, so the segments are transcribed concurrently.
+    Otherwise audio goes to Whisper unchanged.
+    """
+
+    def __init__(self):
+        self.max_duration = int(os.getenv("MAX_AUDIO_LENGTH", "900"))
+        # Shorter notes are sent as recorded; decoding them would cost more than it saves
+        self.preprocess_min_duration = int(os.getenv("AUDIO_PREPROCESS_MIN_SECONDS", "30"))
+        self.segment_seconds = int(os.getenv("AUDIO_SEGMENT_SECONDS", "120"))
+        self.pause_ms = int(os.getenv("AUDIO_PAUSE_MIN_MS", "400"))
+        # Frames this many dB below the note's average loudness count as silence
+        self.silence_offset_db = float(os.getenv("AUDIO_SILENCE_OFFSET_DB", "16"))
+        self.transcribe_concurrency = int(os.getenv("AUDIO_TRANSCRIBE_CONCURRENCY", "4"))
+        self.available = self._load_pydub()
+        metrics_service.describe("audio_trimmed_seconds_total", "Silence trimmed from voice notes before Whisper")
+        metrics_service.describe("audio_segments", "Segments a voice note was split into for transcription")
+        logger.info(f"Audio service initialized successfully (preprocessing: {self.available})")
+
+    def _load_pydub(self) -> bool:
+        if shutil.which("ffmpeg") is None:
+            logger.warning("ffmpeg is not installed, voice notes are sent to Whisper unchanged")
+            return False
+        if importlib.util.find_spec("pydub") is None:
+            logger.warning("pydub is not installed, voice notes are sent to Whisper unchanged")
+            return False
+        return True
+
+    def is_too_long(self, duration: int) -> bool:
+        return duration > self.max_duration
+
+    def analyze(self, samples: "np.ndarray", frame_rate: int,
+                full_scale: float) -> Tuple[Tuple[int, int], List[Tuple[int, int]]]:
+        """Speech bounds and segment plan for mono samples, both in milliseconds"""
+        import numpy as np
+
+        levels = frame_levels(samples, frame_rate, full_scale)
+        # Average loudness of the whole note, as the mean power of its frames
+        threshold = 10 * np.log10(np.mean(10 ** (levels / 10))) - self.silence_offset_db
+        first, last = speech_bounds(levels, threshold)
+        padding = TRIM_PADDING_MS // FRAME_MS
+        first, last = max(0, first - padding), min(len(levels), last + padding)
+
+        pauses = [(start - first, end - first) for start, end in
+                  silent_ranges(levels[first:last], threshold, self.pause_ms // FRAME_MS)]
+        segments = plan_segments(last - first, pauses, self.segment_seconds * 1000 // FRAME_MS)
+        to_ms = lambda frames: frames * FRAME_MS
+        return (to_ms(first), to_ms(last)), [(to_ms(start + first), to_ms(end + first)) for start, end in segments]
+
+    def _split(self, audio_file: BinaryIO) -> Tuple[List[BinaryIO], float]:
+        import numpy as np
+        from pydub import AudioSegment
+
+        audio_file.seek(0)
+        audio = AudioSegment.from_file(audio_file)
+        mono = audio.set_channels(1)
+        samples = np.array(mono.get_array_of_samples())
+        (first, last), segments = self.analyze(samples, mono.frame_rate, float(1 << (8 * mono.sample_width - 1)))
+
+        buffers = []
+        for start, end in segments:
+            buffer = io.BytesIO()
+            audio[start:end].export(buffer, format="ogg", codec="libopus")
+            buffer.seek(0)
+            buffers.append(buffer)
+        metrics_service.inc("audio_trimmed_seconds_total", (len(audio) - (last - first)) / 1000)
+        return buffers, (last - first) / 1000
+
+    async def prepare(self, audio_file: BinaryIO, duration: float) -> Tuple[List[BinaryIO], float]:
+        """
+        Segments to transcribe, in order, and the seconds Whisper will bill for them
+        """
+        if not self.available or duration < self.preprocess_min_duration:
+            return [audio_file], duration
+        try:
+            with metrics_service.timer("audio_preprocess"):
+                segments, billed = await asyncio.to_thread(self._split, audio_file)
+            metrics_service.observe("audio_segments", len(segments))
+            return segments, billed
+        except Exception as e:
+            # Preprocessing only saves time and money, the original note is still usable
+            logger.error(f"Error preprocessing audio, sending it unchanged: {str(e)}")
+            return [audio_file], duration
+
+    async def transcribe(self, segments: List[BinaryIO]) -> str:
+        """Transcribe segments concurrently and join the texts in order"""
+        if len(segments) == 1:
+            return await openai_service.transcribe_audio(segments[0])
+        semaphore = asyncio.Semaphore(self.transcribe_concurrency)
+
+        async def _transcribe(segment: BinaryIO) -> str:
+            async with semaphore:
+                return await openai_service.transcribe_audio(segment)
+
+        texts = await asyncio.gather(*(_transcribe(segment) for segment in segments))
+        return " ".join(text.strip() for text in texts if text.strip())
+
+# Create lazily constructed singleton instance
+audio_service = LazyService(AudioService, "audio")
@@ -0,0 +1,160 @@
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+from loguru import logger
+from .database_service import database_service, client_name_key, normalize_name
+from .metrics_service import metrics_service
+
+# Ukrainian names inflect ("Іван Петренко" -> "з Іваном Петренком"), so a name word matches
+# its own case forms: the word without its final vowel, й, ь or adjective ending plus one of
+# these endings. Longer words that merely start with a name ("Ковальчук" for "Коваль") do not.
+NAME_ENDINGS = (
+    "", "а", "я", "у", "ю", "о", "е", "є", "і", "ї", "ом", "ем", "єм", "ою", "ею", "єю",
+    "ові", "еві", "єві", "ий", "ій", "ої", "ого", "ому", "им", "ім", "ь", "й",
+)
+BASE_SUFFIXES = ("ий", "ій", "а", "я", "о", "е", "є", "й", "ь")
+
+
+def _name_forms(word: str) -> Set[str]:
+    """The word and its case forms"""
+    bases = {word} | {
+        word[:-len(suffix)] for suffix in BASE_SUFFIXES
+        if word.endswith(suffix) and len(word) > len(suffix) + 1
+    }
+    return {base + ending for base in bases for ending in NAME_ENDINGS}
+
+
+class ClientContextCache:
+    """
+    Per-client context for follow-up meetings.
+    Recognises returning clients by name in a transcription and keeps a compact profile
+    of each: a summary of the client and their recent meetings (read through the indexed
+    get_client_meetings) plus the ids of the chunks that were relevant to them before.
+    A profile is rebuilt after every save_client of that client; its chunk ids are kept,
+    since they still describe what the advisor discussed with the client.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("CLIENT_CONTEXT_ENABLED", "true").lower() == "true"
+        self.max_meetings = int(os.getenv("CLIENT_CONTEXT_MEETINGS", "3"))
+        self.max_chunks = int(os.getenv("CLIENT_CONTEXT_CHUNKS", "6"))
+        self.summary_chars = int(os.getenv("CLIENT_CONTEXT_SUMMARY_CHARS", "600"))
+        # Webhook workers do not see each other's saves, so profiles also expire
+        self.ttl = float(os.getenv("CLIENT_CONTEXT_TTL", "600"))
+        self.cache_size = int(os.getenv("CLIENT_CONTEXT_CACHE_SIZE", "1000"))
+        # Fresh candidates retrieved for a returning client, next to their remembered chunks
+        self.min_candidates = int(os.getenv("CLIENT_CONTEXT_MIN_CANDIDATES", "4"))
+        self._profiles: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        # Case form of a name word -> (client, name word) pairs, and how many words each name has
+        self._forms: Dict[str, Set[Tuple[int, str]]] = {}
+        self._name_words: Dict[int, int] = {}
+        self._names_version: Optional[int] = None
+        metrics_service.describe("client_context_requests_total", "Client profile lookups by cache result")
+        metrics_service.describe("returning_client_queries_total", "Voice queries about a known client")
+        logger.info(f"Client context cache initialized successfully (enabled: {self.enabled})")
+
+    async def _load_names(self):
+        version = database_service.names_version
+        forms, name_words = {}, {}
+        for client in await database_service.get_client_names():
+            words = set((client['name_key'] or client_name_key(client['full_name'])).split())
+            # A first name alone is too ambiguous to identify a client
+            if len(words) < 2:
+                continue
+            for word in words:
+                for form in _name_forms(word):
+                    forms.setdefault(form, set()).add((client['id'], word))
+            name_words[client['id']] = len(words)
+        self._forms, self._name_words, self._names_version = forms, name_words, version
+
+    async def recognize(self, text: str) -> Optional[int]:
+        """
+        Id of the known client named in the text; the most recent one if several match equally.
+        Every word of the stored name must appear in some case form. The id only suggests a
+        returning client: the advisor confirms it before the meeting is saved against them.
+        """
+        if not self.enabled:
+            return None
+        try:
+            if self._names_version != database_service.names_version:
+                await self._load_names()
+            hits: Dict[int, Set[str]] = {}
+            for word in re.findall(r"[\w']+", normalize_name(text)):
+                for client_id, name_word in self._forms.get(word, ()):
+                    hits.setdefault(client_id, set()).add(name_word)
+            matched = [client_id for client_id, words in hits.items() if len(words) >= self._name_words[client_id]]
+            if not matched:
+                return None
+            metrics_service.inc("returning_client_queries_total")
+            return max(matched, key=lambda client_id: (self._name_words[client_id], client_id))
+        except Exception as e:
+            # Recognition only narrows retrieval, so a failure falls back to a regular query
+            logger.error(f"Error recognising client: {str(e)}")
+            return None
+
+    def _summarize(self, client: Dict[str, Any], meetings: List[Dict[str, Any]]) -> str:
+        lines = [
+            f"Клієнт: {client['full_name']}, {client['age']} р., продукт: {client['product_type']}, "
+            f"ціль: {client['goal']}."
+        ]
+        if meetings:
+            lines.append("Попередні зустрічі:")
+            lines.extend(
+                f"- {meeting['meeting_date']} ({meeting['meeting_type']}): {(meeting['notes'] or '')[:160]}"
+                for meeting in meetings
+            )
+        return "\n".join(lines)[:self.summary_chars]
+
+    def _fresh(self, client_id: int, profile: Dict[str, Any]) -> bool:
+        return (
+            profile["version"] == database_service.client_version(client_id)
+            and time.monotonic() - profile["loaded_at"] < self.ttl
+        )
+
+    async def get_profile(self, client_id: int) -> Optional[Dict[str, Any]]:
+        """Summary and remembered chunk ids of a client, loaded from the database when stale"""
+        profile = self._profiles.get(client_id)
+        if profile is not None and self._fresh(client_id, profile):
+            metrics_service.inc("client_context_requests_total", result="hit")
+            self._profiles.move_to_end(client_id)
+            return profile
+
+        metrics_service.inc("client_context_requests_total", result="miss")
+        version = database_service.client_version(client_id)
+        client = await database_service.get_client(client_id)
+        if client is None:
+            self._profiles.pop(client_id, None)
+            return None
+        meetings = await database_service.get_client_meetings(client_id, limit=self.max_meetings)
+        profile = {
+            "client_id": client_id,
+            "summary": self._summarize(client, meetings),
+            # Added to the search text of follow-up queries
+            "focus": f"{client['product_type']} {client['goal']}",
+            "chunk_ids": profile["chunk_ids"] if profile else [],
+            "version": version,
+            "loaded_at": time.monotonic(),
+        }
+        self._profiles[client_id] = profile
+        self._profiles.move_to_end(client_id)
+        while len(self._profiles) > self.cache_size:
+            self._profiles.popitem(last=False)
+        return profile
+
+    async def prewarm(self, client_id: int):
+        """Load a client's profile ahead of their next query, e.g. right after a save"""
+        try:
+            await self.get_profile(client_id)
+        except Exception as e:
+            logger.error(f"Error prewarming client context: {str(e)}")
+
+    def remember(self, client_id: int, chunk_ids: List[str]):
+        """Record the chunks used for a client's answer, most recent first"""
+        profile = self._profiles.get(client_id)
+        if profile is not None:
+            profile["chunk_ids"] = list(dict.fromkeys(chunk_ids + profile["chunk_ids"]))[:self.max_chunks]
+
+# Create singleton instance
+client_context = ClientContextCache()
@@ -1,16 +1,32 @@
 import sqlite3
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
 from datetime import datetime
 from loguru import logger
 import os
+from .lifecycle import LazyService
+
+def normalize_name(text: str) -> str:
+    """Casefolded text with the apostrophe variants of Ukrainian names unified"""
+    return text.casefold().replace("’", "'").replace("ʼ", "'")
+
+def client_name_key(full_name: str) -> str:
+    """Case- and word-order-insensitive form of a client's name, used to find returning clients"""
+    return " ".join(sorted(normalize_name(full_name).split()))
 
 class DatabaseService:
     def __init__(self):
         self.db_path = "data/clients.db"
+        # Bumped by save_client, so caches built from client rows know when they are stale
+        self.names_version = 0
+        self._client_versions: Dict[int, int] = {}
         self._ensure_data_directory()
         self._init_database()
         logger.info("Database service initialized successfully")
 
+    def client_version(self, client_id: int) -> int:
+        """Number of saves of a client in this process"""
+        return self._client_versions.get(client_id, 0)
+
     def _ensure_data_directory(self):
         """Ensure the data directory exists"""
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
@@ -48,6 +64,22 @@ class DatabaseService:
                     )
                 """)
                 
+                # Databases created before name_key existed get it backfilled once
+                columns = {row[1] for row in cursor.execute("PRAGMA table_info(clients)")}
+                if "name_key" not in columns:
+                    cursor.execute("ALTER TABLE clients ADD COLUMN name_key TEXT")
+                    rows = cursor.execute("SELECT id, full_name FROM clients").fetchall()
+                    cursor.executemany(
+                        "UPDATE clients SET name_key = ? WHERE id = ?",
+                        [(client_name_key(full_name), client_id) for client_id, full_name in rows]
+                    )
+
+                # A client's recent meetings are read newest first
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_meetings_client_date
+                    ON meetings (client_id, meeting_date DESC, id DESC)
+                """)
+                
                 conn.commit()
                 logger.info("Database tables created successfully")
         except Exception as e:
@@ -85,7 +117,11 @@ class DatabaseService:
             raise
 
     async def save_client(self, client_data: Dict[str, Any]) -> int:
-        """Save client information to database"""
+        """
+        Save client information to database.
+        A client_id the advisor confirmed updates that client and records a follow-up
+        meeting; without one a new client is created.
+        """
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
@@ -99,23 +135,46 @@ class DatabaseService:
                 # Set meeting_date to current date if not provided
                 if 'meeting_date' not in client_data:
                     client_data['meeting_date'] = datetime.now().strftime('%d.%m.%Y')
-                
-                # Insert client data
-                cursor.execute("""
-                    INSERT INTO clients (
-                        full_name, age, meeting_date, product_type, 
-                        goal, description
-                    ) VALUES (?, ?, ?, ?, ?, ?)
-                """, (
-                    client_data['full_name'],
-                    client_data['age'],
-                    datetime.strptime(client_data['meeting_date'], '%d.%m.%Y').date(),
-                    client_data['product_type'],
-                    client_data['goal'],
-                    client_data.get('description', '')
-                ))
-                
-                client_id = cursor.lastrowid
+                meeting_date = datetime.strptime(client_data['meeting_date'], '%d.%m.%Y').date()
+                name_key = client_name_key(client_data['full_name'])
+
+                # Only an id the advisor confirmed updates an existing client; two people may share a name
+                client_id = client_data.get('client_id')
+                if client_id is None:
+                    # Insert client data
+                    cursor.execute("""
+                        INSERT INTO clients (
+                            full_name, age, meeting_date, product_type, 
+                            goal, description, name_key
+                        ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                    """, (
+                        client_data['full_name'],
+                        client_data['age'],
+                        meeting_date,
+                        client_data['product_type'],
+                        client_data['goal'],
+                        client_data.get('description', ''),
+                        name_key
+                    ))
+                    client_id = cursor.lastrowid
+                    meeting_type = client_data.get('meeting_type', 'Initial')
+                else:
+                    cursor.execute("""
+                        UPDATE clients
+                        SET full_name = ?, age = ?, meeting_date = ?, product_type = ?,
+                            goal = ?, description = ?, name_key = ?
+                        WHERE id = ?
+                    """, (
+                        client_data['full_name'],
+                        client_data['age'],
+                        meeting_date,
+                        client_data['product_type'],
+                        client_data['goal'],
+                        client_data.get('description', ''),
+                        name_key,
+                        client_id
+                    ))
+                    meeting_type = client_data.get('meeting_type', 'Follow-up')
                 
                 # Insert meeting record
                 cursor.execute("""
@@ -124,12 +183,14 @@ class DatabaseService:
                     ) VALUES (?, ?, ?, ?)
                 """, (
                     client_id,
-                    datetime.strptime(client_data['meeting_date'], '%d.%m.%Y').date(),
-                    client_data.get('meeting_type', 'Initial'),
+                    meeting_date,
+                    meeting_type,
                     client_data.get('description', '')
                 ))
                 
                 conn.commit()
+                self.names_version += 1
+                self._client_versions[client_id] = self.client_version(client_id) + 1
                 logger.info(f"Client information saved successfully. Client ID: {client_id}")
                 return client_id
                 
@@ -167,17 +228,19 @@ class DatabaseService:
             logger.error(f"Error getting client information: {str(e)}")
             raise
 
-    async def get_client_meetings(self, client_id: int) -> list:
-        """Get all meetings for a specific client"""
+    async def get_client_meetings(self, client_id: int, limit: Optional[int] = None) -> list:
+        """Get meetings for a specific client, newest first; limit keeps only the most recent ones"""
         try:
             with sqlite3.connect(self.db_path) as conn:
                 cursor = conn.cursor()
+                # Served in order by idx_meetings_client_date, so no sort is needed; -1 means no limit
                 cursor.execute("""
                     SELECT id, meeting_date, meeting_type, notes, created_at
                     FROM meetings
                     WHERE client_id = ?
-                    ORDER BY meeting_date DESC
-                """, (client_id,))
+                    ORDER BY meeting_date DESC, id DESC
+                    LIMIT ?
+                """, (client_id, -1 if limit is None else limit))
                 
                 meetings = []
                 for row in cursor.fetchall():
@@ -194,5 +257,20 @@ class DatabaseService:
             logger.error(f"Error getting client meetings: {str(e)}")
             raise
 
-# Create singleton instance
-database_service = DatabaseService() 
\ No newline at end of file
+    async def get_client_names(self) -> List[Dict[str, Any]]:
+        """Ids and names of all clients, for recognising them in transcriptions"""
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT id, full_name, name_key FROM clients")
+                return [
+                    {'id': row[0], 'full_name': row[1], 'name_key': row[2]}
+                    for row in cursor.fetchall()
+                ]
+
+        except Exception as e:
+            logger.error(f"Error getting client names: {str(e)}")
+            raise
+
+# Create lazily constructed singleton instance
+database_service = LazyService(DatabaseService, "database") 
\ No newline at end of file
@@ -0,0 +1,162 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Deque, List, Optional, Set, Tuple
+from loguru import logger
+from .openai_service import openai_service
+from .metrics_service import metrics_service
+from .lifecycle import LazyService
+
+# Voice queries wait on their embedding; document ingestion can wait longer
+PRIORITY_QUERY = "query"
+PRIORITY_BULK = "bulk"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count; Ukrainian text averages about two characters per token, so this errs high"""
+    return len(text) // 2 + 1
+
+
+class _Request:
+    __slots__ = ("texts", "tokens", "future", "priority", "queued_at")
+
+    def __init__(self, texts: List[str], future: asyncio.Future, priority: str):
+        self.texts = texts
+        self.tokens = sum(estimate_tokens(text) for text in texts)
+        self.future = future
+        self.priority = priority
+        self.queued_at = time.perf_counter()
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent create_embeddings calls into shared API requests.
+    Requests arriving within a short window (or until the batch is full) are sent
+    as one call and the vectors are handed back to each caller. A call carries either
+    queries or bulk ingestion, never both, so a failed ingestion batch cannot fail a
+    voice query. Queries are sent first, and one concurrent call is always kept free for them.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("EMBEDDING_COALESCE", "true").lower() == "true"
+        self.window = float(os.getenv("EMBEDDING_COALESCE_WINDOW_MS", "5")) / 1000
+        self.max_items = int(os.getenv("EMBEDDING_COALESCE_MAX_ITEMS", "256"))
+        # The API rejects requests over 300k tokens; counts are estimated, so stay well below
+        self.max_tokens = int(os.getenv("EMBEDDING_COALESCE_MAX_TOKENS", "150000"))
+        self.max_calls = int(os.getenv("EMBEDDING_MAX_CONCURRENT_CALLS", "4"))
+        # One call is kept free for queries, so bulk ingestion needs another
+        if self.enabled and self.max_calls < 2:
+            raise ValueError(
+                f"EMBEDDING_MAX_CONCURRENT_CALLS ({self.max_calls}) must be at least 2: one call is kept free for queries"
+            )
+        self._queues = {PRIORITY_QUERY: deque(), PRIORITY_BULK: deque()}
+        self._queued_items = 0
+        self._queued_tokens = 0
+        self._in_flight = 0
+        self._bulk_in_flight = 0
+        self._task: Optional[asyncio.Task] = None
+        # Calls in flight, referenced so they are not garbage collected while running
+        self._sending: Set[asyncio.Task] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._changed: Optional[asyncio.Event] = None
+        metrics_service.describe("embedding_batch_inputs", "Texts per coalesced embeddings request")
+        metrics_service.describe("embedding_batch_requests", "Caller requests merged into one embeddings request")
+        metrics_service.describe("embedding_queue_seconds", "Time an embedding request waited for its batch to be sent")
+        logger.info(f"Embedding batcher initialized successfully (coalescing: {self.enabled})")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            # Events and tasks belong to one loop, so a new loop gets fresh ones
+            self._loop = loop
+            self._changed = asyncio.Event()
+            self._task = loop.create_task(self._run())
+
+    async def embed(self, texts: List[str], priority: str = PRIORITY_QUERY) -> List[List[float]]:
+        """Embeddings for texts, sent together with whatever other callers are waiting"""
+        if not self.enabled or not texts:
+            return await openai_service.create_embeddings(texts)
+        self._ensure_running()
+        request = _Request(texts, self._loop.create_future(), priority)
+        self._queues[priority].append(request)
+        self._queued_items += len(texts)
+        self._queued_tokens += request.tokens
+        self._changed.set()
+        return await request.future
+
+    def _bulk_allowed(self) -> bool:
+        return self._bulk_in_flight < self.max_calls - 1
+
+    def _sendable(self) -> bool:
+        if self._in_flight >= self.max_calls:
+            return False
+        return bool(self._queues[PRIORITY_QUERY]) or (bool(self._queues[PRIORITY_BULK]) and self._bulk_allowed())
+
+    def _fits(self, items: int, tokens: int, request: _Request) -> bool:
+        return items + len(request.texts) <= self.max_items and tokens + request.tokens <= self.max_tokens
+
+    def _take_batch(self) -> Tuple[List[_Request], bool]:
+        """Queries if any are waiting, else bulk requests, while they fit; a request is never split"""
+        has_query = bool(self._queues[PRIORITY_QUERY])
+        queue: Deque[_Request] = self._queues[PRIORITY_QUERY if has_query else PRIORITY_BULK]
+        batch, items, tokens = [], 0, 0
+        while queue and (not batch or self._fits(items, tokens, queue[0])):
+            request = queue.popleft()
+            batch.append(request)
+            items += len(request.texts)
+            tokens += request.tokens
+        self._queued_items -= items
+        self._queued_tokens -= tokens
+        return batch, has_query
+
+    async def _run(self):
+        while True:
+            if not self._sendable():
+                self._changed.clear()
+                await self._changed.wait()
+                continue
+            # Give concurrent callers a moment to join, unless the batch is already full
+            if self._queued_items < self.max_items and self._queued_tokens < self.max_tokens:
+                await asyncio.sleep(self.window)
+            batch, has_query = self._take_batch()
+            self._in_flight += 1
+            if not has_query:
+                self._bulk_in_flight += 1
+            task = asyncio.create_task(self._send(batch, has_query))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch: List[_Request], has_query: bool):
+        sent_at = time.perf_counter()
+        for request in batch:
+            metrics_service.observe("embedding_queue_seconds", sent_at - request.queued_at, priority=request.priority)
+        texts = [text for request in batch for text in request.texts]
+        metrics_service.observe("embedding_batch_inputs", len(texts))
+        metrics_service.observe("embedding_batch_requests", len(batch))
+        try:
+            vectors = await openai_service.create_embeddings(texts)
+        except Exception as e:
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+        else:
+            offset = 0
+            for request in batch:
+                # A caller that was cancelled while waiting no longer needs its vectors
+                if not request.future.done():
+                    request.future.set_result(vectors[offset:offset + len(request.texts)])
+                offset += len(request.texts)
+        finally:
+            self._in_flight -= 1
+            if not has_query:
+                self._bulk_in_flight -= 1
+            self._changed.set()
+
+# Create lazily constructed singleton instance
+embedding_batcher = LazyService(EmbeddingBatcher, "embedding_batcher")
@@ -0,0 +1,61 @@
+import time
+from typing import Any, Callable, List, Optional
+from loguru import logger
+
+
+class LazyService:
+    """
+    Proxy that constructs a service on first attribute access.
+    Importing a service module therefore costs nothing; the network client,
+    database DDL and heavy SDK imports happen when the service is first used
+    or when start_services() runs from Application.post_init.
+    """
+
+    def __init__(self, factory: Callable[[], Any], name: str):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_instance", None)
+        _registry.append(self)
+
+    @property
+    def is_initialized(self) -> bool:
+        return self._instance is not None
+
+    def get_instance(self) -> Any:
+        if self._instance is None:
+            started = time.perf_counter()
+            object.__setattr__(self, "_instance", self._factory())
+            logger.info(f"Constructed {self._name} service in {(time.perf_counter() - started) * 1000:.0f} ms")
+        return self._instance
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.get_instance(), name)
+
+    def __setattr__(self, name: str, value: Any):
+        setattr(self.get_instance(), name, value)
+
+
+_registry: List[LazyService] = []
+
+
+async def start_services(names: Optional[List[str]] = None):
+    """Construct services and run their start() hooks, in registration order"""
+    for service in _registry:
+        if names is not None and service._name not in names:
+            continue
+        instance = service.get_instance()
+        if hasattr(instance, "start"):
+            await instance.start()
+
+
+async def stop_services():
+    """Run stop() hooks of constructed services, in reverse registration order"""
+    for service in reversed(_registry):
+        if not service.is_initialized:
+            continue
+        instance = service.get_instance()
+        if hasattr(instance, "stop"):
+            try:
+                await instance.stop()
+            except Exception as e:
+                logger.error(f"Error stopping {service._name} service: {str(e)}")
@@ -0,0 +1,431 @@
+import json
+import os
+import threading
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional, Set
+import numpy as np
+from loguru import logger
+from .quantization import QUANTIZATION_MODES, dequantize_int8, int8_scores, quantize_int8
+from .snapshot import load_snapshot, read_manifest, remove_snapshot, write_snapshot
+
+# Namespace "" is stored under this file name
+DEFAULT_NAMESPACE_FILE = "_default"
+
+
+class _StoredMetadata:
+    """
+    Metadata of a partition loaded from a snapshot.
+    Rows stay as JSON bytes in the memory-mapped snapshot and are parsed on first
+    access, so a restart does not parse metadata no query has asked for yet.
+    Rows written since the load are kept as dicts.
+    """
+
+    def __init__(self, blob: memoryview, offsets: List[int]):
+        self.blob = blob
+        self.offsets = offsets
+        self.stored = len(offsets) - 1
+        self.parsed: Dict[int, Dict[str, Any]] = {}
+        self.changed: Set[int] = set()
+        self.appended: List[Dict[str, Any]] = []
+
+    def __len__(self) -> int:
+        return self.stored + len(self.appended)
+
+    def __getitem__(self, row: int) -> Dict[str, Any]:
+        if row >= self.stored:
+            return self.appended[row - self.stored]
+        metadata = self.parsed.get(row)
+        if metadata is None:
+            metadata = self.parsed[row] = json.loads(self.raw(row))
+        return metadata
+
+    def __setitem__(self, row: int, metadata: Dict[str, Any]):
+        if row >= self.stored:
+            self.appended[row - self.stored] = metadata
+        else:
+            self.parsed[row] = metadata
+            self.changed.add(row)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return (self[row] for row in range(len(self)))
+
+    def append(self, metadata: Dict[str, Any]):
+        self.appended.append(metadata)
+
+    def raw(self, row: int) -> Optional[bytes]:
+        """Stored JSON of a row, or None if it changed since the load"""
+        if row >= self.stored or row in self.changed:
+            return None
+        return bytes(self.blob[self.offsets[row]:self.offsets[row + 1]])
+
+    def copy(self) -> "_StoredMetadata":
+        """Copy for a background save; the mapped bytes are shared"""
+        copied = _StoredMetadata(self.blob, self.offsets)
+        copied.parsed, copied.changed, copied.appended = dict(self.parsed), set(self.changed), list(self.appended)
+        return copied
+
+
+def _encode_metadata(metadata: Any) -> Dict[str, np.ndarray]:
+    """Metadata of all rows as one JSON byte blob and the offset of every row in it"""
+    raw = getattr(metadata, "raw", None)
+    lines = []
+    for row in range(len(metadata)):
+        line = raw(row) if raw is not None else None
+        lines.append(line if line is not None else json.dumps(metadata[row], ensure_ascii=False).encode("utf-8"))
+    offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+    np.cumsum([len(line) for line in lines], out=offsets[1:])
+    return {"metadata": np.frombuffer(b"".join(lines), dtype=np.uint8), "offsets": offsets}
+
+
+class _Partition:
+    """
+    Vectors of one namespace with an inverted index over scalar metadata values.
+
+    Vectors are stored as float32 or as int8 codes with a per-vector scale.
+    """
+
+    def __init__(self, dimension: int, quantization: str = "float32"):
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown vector quantization: {quantization}")
+        self.dimension = dimension
+        self.quantization = quantization
+        self.ids: List[str] = []
+        self.rows: Dict[str, int] = {}
+        # A list, or _StoredMetadata for a partition loaded from a snapshot
+        self.metadata: Any = []
+        # array name -> preallocated storage, rows beyond `size` are unused
+        self.arrays: Dict[str, np.ndarray] = {}
+        self.size = 0
+        # field -> value -> rows having that value (list values are indexed per element);
+        # None until first needed for a partition loaded from a snapshot
+        self._postings: Optional[Dict[str, Dict[Any, Set[int]]]] = {}
+
+    @property
+    def postings(self) -> Dict[str, Dict[Any, Set[int]]]:
+        if self._postings is None:
+            self._postings = {}
+            for row in range(self.size):
+                self._index(row, self.metadata[row])
+        return self._postings
+
+    def _index(self, row: int, metadata: Dict[str, Any], remove: bool = False):
+        # Postings not built yet will be built from the current metadata
+        if self._postings is None:
+            return
+        for field, value in metadata.items():
+            for item in value if isinstance(value, list) else [value]:
+                rows = self.postings.setdefault(field, {}).setdefault(item, set())
+                if remove:
+                    rows.discard(row)
+                else:
+                    rows.add(row)
+
+    def _encode(self, values: np.ndarray) -> Dict[str, np.ndarray]:
+        if self.quantization == "float32":
+            return {"vectors": values}
+        codes, scale = quantize_int8(values)
+        return {"codes": codes, "scales": scale}
+
+    def decode(self, row: int) -> np.ndarray:
+        if self.quantization == "float32":
+            return self.arrays["vectors"][row]
+        return dequantize_int8(self.arrays["codes"][row], self.arrays["scales"][row])
+
+    def _reserve(self, size: int, encoded: Dict[str, np.ndarray]):
+        for name, value in encoded.items():
+            array = self.arrays.get(name)
+            if array is None or size > len(array):
+                capacity = max(size, 2 * (len(array) if array is not None else 0), 64)
+                grown = np.zeros((capacity,) + np.shape(value), dtype=np.asarray(value).dtype)
+                if array is not None:
+                    grown[:self.size] = array[:self.size]
+                self.arrays[name] = grown
+
+    @property
+    def nbytes(self) -> int:
+        """Memory taken by the stored vectors of this partition"""
+        return sum(array[:self.size].nbytes for array in self.arrays.values())
+
+    def upsert(self, vector_id: str, values: np.ndarray, metadata: Dict[str, Any]):
+        encoded = self._encode(values)
+        row = self.rows.get(vector_id)
+        if row is None:
+            row = self.size
+            self._reserve(row + 1, encoded)
+            self.rows[vector_id] = row
+            self.ids.append(vector_id)
+            self.metadata.append(metadata)
+            self.size += 1
+        else:
+            self._index(row, self.metadata[row], remove=True)
+            self.metadata[row] = metadata
+        for name, value in encoded.items():
+            self.arrays[name][row] = value
+        self._index(row, metadata)
+
+    def delete(self, ids: List[str]):
+        """Remove vectors and compact the partition; deletes are rare next to queries"""
+        removed = set(ids)
+        keep = [row for row in range(self.size) if self.ids[row] not in removed]
+        for name, array in self.arrays.items():
+            self.arrays[name] = array[keep]
+        self.ids = [self.ids[row] for row in keep]
+        self.metadata = [self.metadata[row] for row in keep]
+        self.rows = {vector_id: row for row, vector_id in enumerate(self.ids)}
+        self.size = len(keep)
+        self._postings = None
+
+    def _scan(self, predicate) -> Set[int]:
+        return {row for row in range(self.size) if predicate(self.metadata[row])}
+
+    def filter_rows(self, filter: Dict[str, Any]) -> Set[int]:
+        """Rows matching a Pinecone-style metadata filter"""
+        result: Optional[Set[int]] = None
+        for key, condition in filter.items():
+            if key == "$and":
+                rows = set.intersection(*(self.filter_rows(part) for part in condition))
+            elif key == "$or":
+                rows = set().union(*(self.filter_rows(part) for part in condition))
+            else:
+                rows = self._field_rows(key, condition)
+            result = rows if result is None else result & rows
+        return result if result is not None else set(range(self.size))
+
+    def _field_rows(self, field: str, condition: Any) -> Set[int]:
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        postings = self.postings.get(field, {})
+        result: Optional[Set[int]] = None
+        for operator, operand in condition.items():
+            # Equality goes through the inverted index; everything else scans the field
+            if operator == "$eq":
+                rows = set(postings.get(operand, ()))
+            elif operator == "$in":
+                rows = set().union(*(postings.get(value, set()) for value in operand))
+            elif operator == "$ne":
+                rows = set(range(self.size)) - postings.get(operand, set())
+            elif operator == "$nin":
+                rows = set(range(self.size)) - set().union(*(postings.get(value, set()) for value in operand))
+            elif operator == "$exists":
+                present = set().union(*postings.values()) if postings else set()
+                rows = present if operand else set(range(self.size)) - present
+            elif operator in ("$gt", "$gte", "$lt", "$lte"):
+                compare = {
+                    "$gt": lambda value: value > operand,
+                    "$gte": lambda value: value >= operand,
+                    "$lt": lambda value: value < operand,
+                    "$lte": lambda value: value <= operand,
+                }[operator]
+                rows = self._scan(
+                    lambda metadata: isinstance(metadata.get(field), (int, float)) and compare(metadata[field])
+                )
+            else:
+                raise ValueError(f"Unsupported filter operator: {operator}")
+            result = rows if result is None else result & rows
+        return result if result is not None else set()
+
+    def _scores(self, rows: Any, query: np.ndarray) -> np.ndarray:
+        if self.quantization == "float32":
+            return self.arrays["vectors"][rows] @ query
+        return int8_scores(self.arrays["codes"][rows], self.arrays["scales"][rows], query)
+
+    def query(self, vector: np.ndarray, top_k: int, filter: Optional[Dict[str, Any]]) -> List[tuple]:
+        if filter:
+            # Push the filter down: only matching rows are scored
+            rows = np.fromiter(sorted(self.filter_rows(filter)), dtype=np.int64)
+            selection = rows
+        else:
+            rows = np.arange(self.size)
+            # A slice is a view; indexing with all row numbers would copy the whole partition
+            selection = slice(0, self.size)
+        if not len(rows):
+            return []
+        scores = self._scores(selection, vector)
+        k = min(top_k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(int(rows[i]), float(scores[i])) for i in best]
+
+
+class LocalVectorIndex:
+    """
+    In-process vector index with the subset of the Pinecone Index API the bot uses.
+    Each namespace is a separate partition, so a query only scans its own namespace,
+    and metadata filters select rows before any similarity is computed.
+    Vectors are normalized on write, so scores are cosine similarities.
+    Partitions are kept in memory and written to `path` by save() as snapshots that a
+    restart memory-maps instead of reading: vectors and metadata are paged in as
+    queries touch them, and the metadata postings are built on the first filtered query.
+    """
+
+    def __init__(self, path: str, quantization: str = "float32"):
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unknown vector quantization: {quantization}")
+        self.path = path
+        self.quantization = quantization
+        self.partitions: Dict[str, _Partition] = {}
+        self._dirty: Set[str] = set()
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    def _file_base(self, namespace: str) -> str:
+        return os.path.join(self.path, namespace or DEFAULT_NAMESPACE_FILE)
+
+    def _new_partition(self, dimension: int) -> _Partition:
+        return _Partition(dimension, self.quantization)
+
+    def _load(self):
+        for file_name in os.listdir(self.path):
+            if not file_name.endswith(".json"):
+                continue
+            name = file_name[:-len(".json")]
+            namespace = "" if name == DEFAULT_NAMESPACE_FILE else name
+            base = self._file_base(namespace)
+            manifest = read_manifest(base)
+            if manifest is None:
+                # The namespace was deleted by another process after the directory was listed
+                continue
+            # Every unfiltered query scans all vectors, so they are read ahead of the first one
+            snapshot = load_snapshot(base, manifest, prefetch=manifest["vector_arrays"])
+            if snapshot is None:
+                continue
+            stored = self._from_snapshot(*snapshot)
+            if stored.quantization == self.quantization:
+                stored.rows = {vector_id: row for row, vector_id in enumerate(stored.ids)}
+                stored._postings = None
+                self.partitions[namespace] = stored
+            else:
+                # Quantization setting changed since the save: re-encode from the stored vectors
+                partition = self._new_partition(stored.dimension)
+                for row, vector_id in enumerate(stored.ids):
+                    partition.upsert(vector_id, stored.decode(row), stored.metadata[row])
+                self.partitions[namespace] = partition
+        if self.partitions:
+            logger.info(f"Loaded local vector index with {sum(p.size for p in self.partitions.values())} vectors")
+
+    @staticmethod
+    def _from_snapshot(manifest: Dict[str, Any], arrays: Dict[str, np.ndarray]) -> _Partition:
+        stored = _Partition(manifest["dimension"], manifest["quantization"])
+        stored.arrays = {array: arrays[array] for array in manifest["vector_arrays"]}
+        stored.size = manifest["size"]
+        stored.ids = arrays["ids"].tolist()
+        # A memoryview slices the mapped bytes without numpy's per-slice overhead
+        stored.metadata = _StoredMetadata(memoryview(arrays["metadata"]), arrays["offsets"].tolist())
+        return stored
+
+    def save(self):
+        """
+        Write partitions changed since the last save, each as a new snapshot generation.
+        The copies are taken under the lock and written outside it.
+        """
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            snapshots = {}
+            for namespace in dirty:
+                partition = self.partitions.get(namespace)
+                if partition is None:
+                    snapshots[namespace] = None
+                else:
+                    snapshots[namespace] = (
+                        {name: array[:partition.size].copy() for name, array in partition.arrays.items()},
+                        list(partition.ids),
+                        partition.metadata.copy(),
+                        {
+                            "dimension": partition.dimension,
+                            "quantization": partition.quantization,
+                            "size": partition.size,
+                            "vector_arrays": sorted(partition.arrays),
+                        },
+                    )
+        # Files are written outside the lock so queries are not blocked by disk I/O
+        for namespace, snapshot in snapshots.items():
+            base = self._file_base(namespace)
+            if snapshot is None:
+                remove_snapshot(base)
+                continue
+            arrays, ids, metadata, manifest = snapshot
+            arrays["ids"] = np.array(ids, dtype=str)
+            arrays.update(_encode_metadata(metadata))
+            write_snapshot(base, manifest, arrays)
+
+    @staticmethod
+    def _normalize(values: Any) -> np.ndarray:
+        vector = np.asarray(values, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_dimension(self, values: np.ndarray, namespace: str, dimension: Optional[int] = None):
+        partition = self.partitions.get(namespace)
+        expected = partition.dimension if partition is not None else dimension
+        if expected is not None and len(values) != expected:
+            raise ValueError(
+                f"Vector has {len(values)} dimensions but namespace '{namespace}' stores {expected}; "
+                "EMBEDDING_DIMENSIONS must match the dimension the index was built with"
+            )
+
+    def upsert(self, vectors: List[Dict[str, Any]], namespace: str = "", **kwargs):
+        normalized = [self._normalize(vector["values"]) for vector in vectors]
+        with self._lock:
+            # Checked up front so a bad request stores nothing, as Pinecone rejects it whole
+            for values in normalized:
+                self._check_dimension(values, namespace, len(normalized[0]))
+            for vector, values in zip(vectors, normalized):
+                partition = self.partitions.get(namespace)
+                if partition is None:
+                    partition = self.partitions[namespace] = self._new_partition(len(values))
+                partition.upsert(vector["id"], values, vector.get("metadata") or {})
+            self._dirty.add(namespace)
+        return SimpleNamespace(upserted_count=len(vectors))
+
+    def query(self, vector: List[float], top_k: int = 3, include_metadata: bool = False,
+              namespace: str = "", filter: Optional[Dict[str, Any]] = None, include_values: bool = False, **kwargs):
+        query = self._normalize(vector)
+        with self._lock:
+            self._check_dimension(query, namespace)
+            partition = self.partitions.get(namespace)
+            matches = []
+            if partition is not None and partition.size:
+                for row, score in partition.query(query, top_k, filter):
+                    matches.append(SimpleNamespace(
+                        id=partition.ids[row],
+                        score=score,
+                        values=partition.decode(row).tolist() if include_values else [],
+                        metadata=partition.metadata[row] if include_metadata else None,
+                    ))
+        return SimpleNamespace(matches=matches, namespace=namespace)
+
+    def fetch(self, ids: List[str], namespace: str = "", **kwargs):
+        with self._lock:
+            partition = self.partitions.get(namespace)
+            vectors = {}
+            for vector_id in ids:
+                if partition is not None and vector_id in partition.rows:
+                    row = partition.rows[vector_id]
+                    vectors[vector_id] = SimpleNamespace(
+                        id=vector_id, values=partition.decode(row).tolist(), metadata=partition.metadata[row]
+                    )
+        return SimpleNamespace(vectors=vectors, namespace=namespace)
+
+    def delete(self, ids: Optional[List[str]] = None, namespace: str = "", delete_all: bool = False, **kwargs):
+        with self._lock:
+            if delete_all:
+                self.partitions.pop(namespace, None)
+            elif namespace in self.partitions:
+                self.partitions[namespace].delete(ids or [])
+            self._dirty.add(namespace)
+        return {}
+
+    def describe_index_stats(self, **kwargs) -> Dict[str, Any]:
+        with self._lock:
+            namespaces = {
+                namespace: {"vector_count": p.size, "memory_bytes": p.nbytes}
+                for namespace, p in self.partitions.items()
+            }
+            dimension = next((p.dimension for p in self.partitions.values()), 0)
+        return {
+            "dimension": dimension,
+            "quantization": self.quantization,
+            "namespaces": namespaces,
+            "total_vector_count": sum(ns["vector_count"] for ns in namespaces.values()),
+        }
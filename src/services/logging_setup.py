@@ -0,0 +1,192 @@
+import gzip
+import json
+import os
+import queue
+import random
+import shutil
+import sys
+import threading
+import traceback
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+from loguru import logger
+
+# Records bound with payload=True carry user content (transcriptions, answers, client data)
+PAYLOAD_KEY = "payload"
+
+_FIELDS_SKIPPED_IN_EXTRA = (PAYLOAD_KEY, "sampled", "serialized")
+
+
+def _parse_module_levels(value: str) -> Dict[str, str]:
+    """"services.rag_service=WARNING,bot=INFO" -> {"services.rag_service": "WARNING", "bot": "INFO"}"""
+    levels = {}
+    for item in value.split(","):
+        if "=" in item:
+            module, level = item.split("=", 1)
+            levels[module.strip()] = level.strip().upper()
+    return levels
+
+
+class _LogSettings:
+    def __init__(self):
+        self.level = os.getenv("LOG_LEVEL", "INFO").upper()
+        # Per-module overrides for chatty hot paths, e.g. services.rag_service=WARNING
+        self.module_levels = _parse_module_levels(os.getenv("LOG_LEVELS", ""))
+        self.max_message_chars = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "2000"))
+        self.payload_chars = int(os.getenv("LOG_PAYLOAD_CHARS", "200"))
+        # Share of payload records that are written at all
+        self.payload_sample_rate = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "1.0"))
+
+    @property
+    def min_level_no(self) -> int:
+        """Lowest level any module logs at; calls below it are skipped before a record is built"""
+        return min(logger.level(level).no for level in [self.level, *self.module_levels.values()])
+
+    @lru_cache(maxsize=None)
+    def level_no(self, name: Optional[str]) -> int:
+        """Minimum level for a module, from the closest configured parent package"""
+        parts = (name or "").split(".")
+        for end in range(len(parts), 0, -1):
+            level = self.module_levels.get(".".join(parts[:end]))
+            if level:
+                return logger.level(level).no
+        return logger.level(self.level).no
+
+
+def _truncate(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}… [+{len(text) - limit} chars]"
+
+
+def _patch(settings: _LogSettings):
+    def patcher(record: Dict[str, Any]):
+        extra = record["extra"]
+        if extra.get(PAYLOAD_KEY):
+            # Decide once per record, so every sink keeps or drops the same records
+            extra["sampled"] = settings.payload_sample_rate >= 1 or random.random() < settings.payload_sample_rate
+            record["message"] = _truncate(record["message"], settings.payload_chars)
+        else:
+            record["message"] = _truncate(record["message"], settings.max_message_chars)
+    return patcher
+
+
+def _filter(settings: _LogSettings):
+    def accept(record: Dict[str, Any]) -> bool:
+        if not record["extra"].get("sampled", True):
+            return False
+        return record["level"].no >= settings.level_no(record["name"])
+    return accept
+
+
+def _json_format(record: Dict[str, Any]) -> str:
+    """One JSON object per line; request_id and stage come from logger.contextualize"""
+    entry = {
+        "ts": record["time"].isoformat(timespec="milliseconds"),
+        "level": record["level"].name,
+        "pid": record["process"].id,
+        "logger": record["name"],
+        "function": record["function"],
+        "line": record["line"],
+        "message": record["message"],
+    }
+    for key, value in record["extra"].items():
+        if key not in _FIELDS_SKIPPED_IN_EXTRA:
+            entry[key] = value if isinstance(value, (str, int, float, bool)) or value is None else str(value)
+    if record["exception"]:
+        entry["exception"] = "".join(traceback.format_exception(*record["exception"]))
+    record["extra"]["serialized"] = json.dumps(entry, ensure_ascii=False)
+    return "{extra[serialized]}\n"
+
+
+class BackgroundFileSink:
+    """
+    Loguru sink that only puts formatted lines on an in-process queue.
+    A writer thread drains the queue, writes lines in batches, and rotates the file
+    once it reaches max_bytes, keeping `backups` gzip-compressed copies.
+    """
+
+    def __init__(self, path: str, max_bytes: int, backups: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._queue: "queue.SimpleQueue[Optional[str]]" = queue.SimpleQueue()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def write(self, message: str):
+        self._queue.put(message)
+
+    def stop(self):
+        """Write what is queued and close the file; loguru calls this on logger.remove()"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _drain(self) -> List[Optional[str]]:
+        batch = [self._queue.get()]
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def _run(self):
+        file = open(self.path, "a", encoding="utf-8")
+        try:
+            while True:
+                batch = self._drain()
+                file.writelines(line for line in batch if line is not None)
+                file.flush()
+                if file.tell() >= self.max_bytes:
+                    file.close()
+                    self._rotate()
+                    file = open(self.path, "a", encoding="utf-8")
+                if None in batch:
+                    return
+        except Exception as e:
+            # The writer must not take the bot down; report on stderr, which does not go through this sink
+            print(f"Log writer stopped: {str(e)}", file=sys.stderr)
+        finally:
+            file.close()
+
+    def _rotate(self):
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}.gz"):
+                os.replace(f"{self.path}.{index}.gz", f"{self.path}.{index + 1}.gz")
+        if self.backups > 0:
+            with open(self.path, "rb") as source, gzip.open(f"{self.path}.1.gz", "wb") as target:
+                shutil.copyfileobj(source, target)
+        os.remove(self.path)
+
+
+def setup_logging(worker: Optional[int] = None):
+    """
+    Configure all log sinks for this process.
+    Records are formatted on the caller's side and written by a background thread,
+    so the event loop never waits on file I/O or log rotation.
+    Webhook workers pass their index and write to their own file.
+    """
+    settings = _LogSettings()
+    log_file = os.getenv("LOG_FILE", "logs/app.jsonl")
+    if worker is not None:
+        base, extension = os.path.splitext(log_file)
+        log_file = f"{base}.worker{worker}{extension}"
+
+    logger.remove()
+    logger.configure(patcher=_patch(settings))
+    accept = _filter(settings)
+    # The JSON file is the full record; the console only shows what needs attention, so it stays synchronous
+    console_level = max(settings.min_level_no, logger.level(os.getenv("LOG_CONSOLE_LEVEL", "WARNING").upper()).no)
+    logger.add(sys.stderr, level=console_level, filter=accept)
+    # Per-module levels are applied by the filter; the handler level only cuts off what no module wants
+    logger.add(
+        BackgroundFileSink(
+            log_file,
+            max_bytes=int(os.getenv("LOG_ROTATION_MB", "100")) * 1024 * 1024,
+            backups=int(os.getenv("LOG_RETENTION", "10")),
+        ),
+        level=settings.min_level_no,
+        filter=accept,
+        format=_json_format,
+    )
@@ -0,0 +1,130 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional
+from loguru import logger
+from .metrics_service import metrics_service
+
+# Frames under this directory are our code; the innermost one names the offending call site
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _format_frame(frame: traceback.FrameSummary) -> str:
+    filename = os.path.relpath(frame.filename, PROJECT_DIR) if frame.filename.startswith(PROJECT_DIR) else frame.filename
+    return f"{filename}:{frame.lineno} in {frame.name}"
+
+
+def find_call_site(stack: List[traceback.FrameSummary]) -> str:
+    """Pick the innermost project frame of a stack, falling back to the innermost frame"""
+    for frame in reversed(stack):
+        if frame.filename.startswith(PROJECT_DIR) and "loop_monitor" not in frame.filename:
+            return _format_frame(frame)
+    return _format_frame(stack[-1]) if stack else "unknown"
+
+
+def get_thread_stack(thread_id: int) -> List[traceback.FrameSummary]:
+    """Stack of a thread, starting at the coroutine or callback the event loop is running"""
+    frame = sys._current_frames().get(thread_id)
+    if frame is None:
+        return []
+    stack = traceback.extract_stack(frame)
+    for i in range(len(stack) - 1, -1, -1):
+        if stack[i].filename.endswith(os.path.join("asyncio", "events.py")):
+            return stack[i + 1:]
+    return stack
+
+
+class LoopMonitor:
+    """
+    Watchdog for the asyncio event loop.
+    A heartbeat coroutine measures loop lag continuously, while a background thread
+    captures the loop thread's stack whenever the heartbeat is late by more than the threshold.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+        self.interval = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.1"))
+        self.threshold = float(os.getenv("LOOP_LAG_THRESHOLD", "0.25"))
+        self.offenders: Dict[str, Dict[str, Any]] = {}
+        self.max_lag = 0.0
+        self._lock = threading.Lock()
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._pending_stall: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        metrics_service.describe("event_loop_lag_seconds", "Delay of event loop wake-ups")
+        logger.info("Loop monitor initialized successfully")
+
+    async def start(self):
+        """Start the heartbeat and the watchdog thread on the running loop"""
+        if not self.enabled or self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._run_heartbeat())
+        self._watchdog = threading.Thread(target=self._run_watchdog, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(f"Loop monitor started (threshold {self.threshold * 1000:.0f} ms)")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopped.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._watchdog = None
+
+    async def _run_heartbeat(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - started - self.interval)
+            with self._lock:
+                self._heartbeat = now
+                stall = self._pending_stall
+                self._pending_stall = None
+            metrics_service.observe("event_loop_lag_seconds", lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag >= self.threshold:
+                self._record_stall(lag, stall)
+
+    def _run_watchdog(self):
+        # Poll faster than the threshold so that a stall is caught while it is still happening
+        poll_interval = min(self.interval, self.threshold) / 2
+        while not self._stopped.wait(poll_interval):
+            with self._lock:
+                overdue = time.monotonic() - self._heartbeat - self.interval
+                if overdue < self.threshold or self._pending_stall is not None:
+                    continue
+                stack = get_thread_stack(self._loop_thread_id)
+                self._pending_stall = {"call_site": find_call_site(stack), "stack": stack}
+
+    def _record_stall(self, lag: float, stall: Optional[Dict[str, Any]]):
+        call_site = stall["call_site"] if stall else "unknown (stall ended before capture)"
+        stack = "".join(traceback.format_list(stall["stack"])) if stall else ""
+
+        offender = self.offenders.setdefault(call_site, {"count": 0, "total": 0.0, "max": 0.0, "stack": ""})
+        offender["count"] += 1
+        offender["total"] += lag
+        offender["max"] = max(offender["max"], lag)
+        offender["stack"] = stack or offender["stack"]
+        logger.warning(f"Event loop blocked for {lag * 1000:.0f} ms at {call_site}\n{stack}")
+
+    def get_offenders(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Blocking call sites ordered by total blocked time"""
+        ordered = sorted(self.offenders.items(), key=lambda item: item[1]["total"], reverse=True)
+        return [{"call_site": call_site, **stats} for call_site, stats in ordered[:limit]]
+
+# Create singleton instance
+loop_monitor = LoopMonitor()
@@ -0,0 +1,216 @@
+import asyncio
+import os
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+from loguru import logger
+
+# Upper bounds in seconds; voice replies routinely take 10+ seconds end to end
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+# USD per 1M tokens as (prompt, completion)
+MODEL_PRICES = {
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+    "gpt-4-turbo-preview": (10.0, 30.0),
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4o": (5.0, 15.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-3.5-turbo": (0.5, 1.5),
+}
+
+# Prompt tokens served from the provider's prompt cache are billed at this share of the prompt price
+CACHED_PROMPT_PRICE_SHARE = 0.5
+
+# Whisper is billed per audio minute and reports no token usage
+WHISPER_PRICE_PER_MINUTE = 0.006
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _format_labels(labels: Labels, extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = list(labels) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+class Histogram:
+    """Cumulative Prometheus-style histogram with a sliding window for percentiles"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, window: int = 2048):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.recent: Deque[float] = deque(maxlen=window)
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.bucket_counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[index]
+
+
+class MetricsService:
+    def __init__(self):
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.descriptions: Dict[str, str] = {}
+        self.host = os.getenv("METRICS_HOST", "127.0.0.1")
+        self.port = int(os.getenv("METRICS_PORT", "9464"))
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.describe("pipeline_stage_seconds", "Duration of bot pipeline stages")
+        self.describe("openai_tokens_total", "OpenAI tokens reported in API usage")
+        self.describe("openai_cost_usd_total", "Estimated OpenAI spend in USD")
+        self.describe("openai_route_requests_total", "Answers generated per model route")
+        self.describe("openai_route_cost_usd_total", "Estimated answer generation spend in USD per model route")
+        logger.info("Metrics service initialized successfully")
+
+    def describe(self, name: str, description: str):
+        self.descriptions[name] = description
+
+    def observe(self, name: str, value: float, **labels: Any):
+        series = self.histograms.setdefault(name, {})
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        if key not in series:
+            series[key] = Histogram()
+        series[key].observe(value)
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any):
+        series = self.counters.setdefault(name, {})
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        series[key] = series.get(key, 0.0) + value
+
+    @contextmanager
+    def timer(self, stage: str, **labels: Any) -> Iterator[None]:
+        """Record the duration of a pipeline stage, including failed runs; log records inside carry the stage"""
+        started = time.perf_counter()
+        try:
+            with logger.contextualize(stage=stage):
+                yield
+        finally:
+            self.observe("pipeline_stage_seconds", time.perf_counter() - started, stage=stage, **labels)
+
+    def record_usage(self, model: str, usage: Any) -> float:
+        """
+        Update token and cost counters from an OpenAI response `usage` object
+        Returns the estimated cost in USD
+        """
+        if usage is None:
+            return 0.0
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", 0) or 0
+        self.inc("openai_tokens_total", prompt_tokens, model=model, type="prompt")
+        if cached_tokens:
+            self.inc("openai_tokens_total", cached_tokens, model=model, type="cached_prompt")
+        if completion_tokens:
+            self.inc("openai_tokens_total", completion_tokens, model=model, type="completion")
+
+        prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+        billed_prompt = prompt_tokens - cached_tokens + cached_tokens * CACHED_PROMPT_PRICE_SHARE
+        cost = (billed_prompt * prompt_price + completion_tokens * completion_price) / 1_000_000
+        self.inc("openai_cost_usd_total", cost, model=model)
+        return cost
+
+    def record_audio_usage(self, model: str, duration_seconds: float):
+        """Update cost counter for audio billed by duration"""
+        self.inc("openai_audio_seconds_total", duration_seconds, model=model)
+        self.inc("openai_cost_usd_total", duration_seconds / 60 * WHISPER_PRICE_PER_MINUTE, model=model)
+
+    def get_percentiles(self, name: str = "pipeline_stage_seconds") -> List[Dict[str, Any]]:
+        """Get count and p50/p95/p99 for every series of a histogram"""
+        summary = []
+        for labels, histogram in sorted(self.histograms.get(name, {}).items()):
+            summary.append({
+                "labels": dict(labels),
+                "count": histogram.count,
+                "p50": histogram.percentile(50),
+                "p95": histogram.percentile(95),
+                "p99": histogram.percentile(99),
+            })
+        return summary
+
+    def get_counter(self, name: str) -> Dict[Labels, float]:
+        return dict(self.counters.get(name, {}))
+
+    def render_prometheus(self) -> str:
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, series in sorted(self.counters.items()):
+            if name in self.descriptions:
+                lines.append(f"# HELP {name} {self.descriptions[name]}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for name, series in sorted(self.histograms.items()):
+            if name in self.descriptions:
+                lines.append(f"# HELP {name} {self.descriptions[name]}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.bucket_counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels, {'le': str(bound)})} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels, {'le': '+Inf'})} {histogram.count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    async def _handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            # Drain headers; the body of a GET is empty
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", self.render_prometheus().encode()
+            else:
+                status, body = "404 Not Found", b"Not Found\n"
+
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.error(f"Error serving metrics request: {str(e)}")
+        finally:
+            writer.close()
+
+    async def start_http_server(self):
+        """Expose /metrics on the local HTTP endpoint; METRICS_PORT=0 disables it"""
+        if self.port == 0 or self._server is not None:
+            return
+        try:
+            self._server = await asyncio.start_server(self._handle_http, self.host, self.port)
+            logger.info(f"Metrics endpoint listening on http://{self.host}:{self.port}/metrics")
+        except OSError as e:
+            logger.error(f"Error starting metrics endpoint: {str(e)}")
+
+    async def stop_http_server(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+# Create singleton instance
+metrics_service = MetricsService()
@@ -0,0 +1,52 @@
+import os
+from typing import NamedTuple
+from dotenv import load_dotenv
+from loguru import logger
+
+load_dotenv()
+
+# Query stems that call for comparison or calculation rather than a templated answer
+COMPLEX_MARKERS = ("порівн", "розрах", "аналіз", "різниц", "оптиміз", "стратег", "податк", "compare", "calculat")
+
+
+class Route(NamedTuple):
+    name: str
+    model: str
+    max_tokens: int
+
+
+class ModelRouter:
+    """
+    Picks the model tier for an answer.
+    Short queries over a small context go to the light model with a smaller token budget;
+    long or analytical queries and large contexts go to the full model.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("MODEL_ROUTING", "true").lower() == "true"
+        self.full = Route(
+            "full",
+            os.getenv("ROUTE_FULL_MODEL", "gpt-4-turbo-preview"),
+            int(os.getenv("MAX_TOKENS_RESPONSE", "600")),
+        )
+        self.light = Route(
+            "light",
+            os.getenv("ROUTE_LIGHT_MODEL", "gpt-4o-mini"),
+            int(os.getenv("ROUTE_LIGHT_MAX_TOKENS", "400")),
+        )
+        self.light_max_query_words = int(os.getenv("ROUTE_LIGHT_MAX_QUERY_WORDS", "40"))
+        self.light_max_context_chars = int(os.getenv("ROUTE_LIGHT_MAX_CONTEXT_CHARS", "4000"))
+        logger.info(f"Model router initialized (routing: {self.enabled})")
+
+    def route(self, query: str, context: str) -> Route:
+        if not self.enabled:
+            return self.full
+        lowered = query.lower()
+        if len(query.split()) > self.light_max_query_words or len(context) > self.light_max_context_chars:
+            return self.full
+        if any(marker in lowered for marker in COMPLEX_MARKERS):
+            return self.full
+        return self.light
+
+# Create singleton instance
+model_router = ModelRouter()
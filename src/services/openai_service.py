@@ -1,19 +1,62 @@
+import json
 import os
-from typing import List, Dict, Any
-from openai import OpenAI
+from typing import BinaryIO, List
 from dotenv import load_dotenv
 from loguru import logger
 from datetime import datetime
-from .database_service import database_service
+from .resilience import resilience_service
+from .metrics_service import metrics_service
+from .model_router import model_router
+from .lifecycle import LazyService
 
 load_dotenv()
 
+SYSTEM_PROMPT = """Ти - корисний помічник фінансового консультанта компанії OVB, з доступом до бази знань продуктів компаній партнерів.
+Використовуй наданий контекст для точних відповідей на запитання. Якщо відповідь не відповідає контексту, скажи про це чітко.
+
+Твоя відповідь повинна мати наступну структуру:
+
+1. Інформація про клієнта
+Клієнт: [ім'я та прізвище]
+Вік: [вік] років
+Дата: [поточна дата]
+Тип зустрічі: [тип зустрічі]
+Продукт: [тип продукту]
+Ціль: [мета клієнта]
+
+Опис клієнта:
+[детальний опис клієнта та його потреб]
+
+2. Пропозиції продукту
+### Найкращі пропозиції на ринку:
+
+#### 1. [Назва програми/компанії]:
+- **Мета**: [основна мета програми]
+- **Переваги**:
+  - *[перевага 1]*
+  - *[перевага 2]*
+  [...]
+
+[Додатковий коментар щодо програми]"""
+
 class OpenAIService:
     def __init__(self):
         self._validate_config()
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # The SDK takes a noticeable share of startup, so it is imported on first use
+        from openai import OpenAI
+        # Retries are handled by resilience_service, so the SDK must not retry on its own
+        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+        self.rerank_model = os.getenv("RERANK_MODEL", "gpt-4o-mini")
+        self.embedding_model = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+        # text-embedding-3 models can return shortened vectors; unset keeps the model's full size (1536)
+        dimensions = os.getenv("EMBEDDING_DIMENSIONS")
+        self.embedding_dimensions = int(dimensions) if dimensions else None
         logger.info("OpenAI client initialized successfully")
 
+    async def stop(self):
+        """Close the HTTP connection pool"""
+        self.client.close()
+
     def _validate_config(self):
         if not os.getenv("OPENAI_API_KEY"):
             raise ValueError("Missing required environment variable: OPENAI_API_KEY")
@@ -23,124 +66,107 @@ class OpenAIService:
         Create embeddings for a list of texts
         """
         try:
-            response = self.client.embeddings.create(
-                model="text-embedding-3-small",
-                input=texts
+            kwargs = {"dimensions": self.embedding_dimensions} if self.embedding_dimensions else {}
+            response = await resilience_service.call(
+                "openai.embeddings",
+                self.client.embeddings.create,
+                model=self.embedding_model,
+                input=texts,
+                idempotent=True,
+                **kwargs
             )
+            metrics_service.record_usage(self.embedding_model, response.usage)
             return [item.embedding for item in response.data]
         except Exception as e:
             logger.error(f"Error creating embeddings: {str(e)}")
             raise
 
-    async def transcribe_audio(self, audio_file_path: str) -> str:
+    async def transcribe_audio(self, audio_file: BinaryIO, file_name: str = "voice.ogg") -> str:
         """
-        Transcribe audio file using Whisper API
+        Transcribe an audio file object using Whisper API
+        file_name: Name whose extension tells Whisper the audio format
         """
         try:
-            with open(audio_file_path, "rb") as audio_file:
-                response = self.client.audio.transcriptions.create(
+            def _transcribe():
+                # Rewind so that retried attempts upload the whole file again
+                audio_file.seek(0)
+                return self.client.audio.transcriptions.create(
                     model="whisper-1",
-                    file=audio_file
+                    file=(file_name, audio_file)
                 )
+
+            response = await resilience_service.call("openai.transcriptions", _transcribe)
             return response.text
         except Exception as e:
             logger.error(f"Error transcribing audio: {str(e)}")
             raise
 
-    def _extract_client_info(self, response_text: str) -> Dict[str, Any]:
-        """Extract client information from the response text"""
+    async def score_passages(self, query: str, passages: List[str]) -> List[float]:
+        """
+        Rate the relevance of passages to a query with one cheap chat call
+        Returns scores between 0 and 1 in passage order
+        """
         try:
-            lines = response_text.split('\n')
-            client_info = {}
-            
-            for line in lines:
-                line = line.strip()
-                if line.startswith('Клієнт:'):
-                    client_info['full_name'] = line.split(':', 1)[1].strip()
-                elif line.startswith('Вік:'):
-                    age_text = line.split(':', 1)[1].strip()
-                    client_info['age'] = int(''.join(filter(str.isdigit, age_text)))
-                elif line.startswith('Дата:'):
-                    client_info['meeting_date'] = line.split(':', 1)[1].strip()
-                elif line.startswith('Тип зустрічі:'):
-                    client_info['meeting_type'] = line.split(':', 1)[1].strip()
-                elif line.startswith('Продукт:'):
-                    client_info['product_type'] = line.split(':', 1)[1].strip()
-                elif line.startswith('Ціль:'):
-                    client_info['goal'] = line.split(':', 1)[1].strip()
-                elif line.startswith('Опис клієнта:'):
-                    description_start = lines.index(line) + 1
-                    description_lines = []
-                    for desc_line in lines[description_start:]:
-                        if desc_line.strip() and not desc_line.startswith('###'):
-                            description_lines.append(desc_line.strip())
-                        else:
-                            break
-                    client_info['description'] = ' '.join(description_lines)
-                    break
-            
-            return client_info
+            numbered = "\n".join(f"[{i}] {' '.join(passage.split())}" for i, passage in enumerate(passages))
+            messages = [
+                {"role": "system", "content": (
+                    "Оціни, наскільки кожен фрагмент допомагає відповісти на запит, за шкалою від 0 до 10. "
+                    "Поверни лише JSON виду {\"scores\": [оцінка для [0], оцінка для [1], ...]}."
+                )},
+                {"role": "user", "content": f"Запит: {query}\n\nФрагменти:\n{numbered}"}
+            ]
+            response = await resilience_service.call(
+                "openai.rerank",
+                self.client.chat.completions.create,
+                model=self.rerank_model,
+                messages=messages,
+                temperature=0,
+                max_tokens=16 + 4 * len(passages),
+                response_format={"type": "json_object"},
+                idempotent=True
+            )
+            metrics_service.record_usage(self.rerank_model, response.usage)
+            scores = json.loads(response.choices[0].message.content).get("scores", [])
+            # Passages the model skipped count as irrelevant
+            scores = [min(max(float(score), 0.0), 10.0) / 10 for score in scores[:len(passages)]]
+            return scores + [0.0] * (len(passages) - len(scores))
         except Exception as e:
-            logger.error(f"Error extracting client info: {str(e)}")
-            return None
+            logger.error(f"Error scoring passages: {str(e)}")
+            raise
 
     async def generate_response(self, query: str, context: str) -> str:
         """
-        Generate structured response using GPT-4 with context and save client info
+        Generate structured response with context.
+        Client details in the response are only saved once the advisor confirms them in the bot.
+        The model and token budget are chosen by model_router
         """
         try:
             current_date = datetime.now().strftime("%d.%m.%Y")
-            
-            system_prompt = """Ти - корисний помічник фінансового консультанта компанії OVB, з доступом до бази знань продуктів компаній партнерів. 
-            Використовуй наданий контекст для точних відповідей на запитання. Якщо відповідь не відповідає контексту, скажи про це чітко.
-
-            Твоя відповідь повинна мати наступну структуру:
-
-            1. Інформація про клієнта
-            Клієнт: [ім'я та прізвище]
-            Вік: [вік] років
-            Дата: [поточна дата]
-            Тип зустрічі: [тип зустрічі]
-            Продукт: [тип продукту]
-            Ціль: [мета клієнта]
-
-            Опис клієнта:
-            [детальний опис клієнта та його потреб]
-
-            2. Пропозиції продукту
-            ### Найкращі пропозиції на ринку:
-
-            #### 1. [Назва програми/компанії]:
-            - **Мета**: [основна мета програми]
-            - **Переваги**:
-              - *[перевага 1]*
-              - *[перевага 2]*
-              [...]
-
-            [Додатковий коментар щодо програми]"""
+            route = model_router.route(query, context)
 
+            # The system prompt is a constant prefix and everything per-request comes after it,
+            # so the provider can reuse its cached prompt prefix between calls
             messages = [
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": SYSTEM_PROMPT},
                 {"role": "user", "content": f"Context: {context}\n\nQuery: {query}\n\nCurrent date: {current_date}"}
             ]
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4-turbo-preview",
-                messages=messages,
-                max_tokens=int(os.getenv("MAX_TOKENS_RESPONSE", "600"))
-            )
-            
-            response_text = response.choices[0].message.content
-            
-            # Extract and save client information
-            client_info = self._extract_client_info(response_text)
-            if client_info:
-                await database_service.save_client(client_info)
-            
-            return response_text
+
+            with metrics_service.timer("gpt_generation", route=route.name):
+                response = await resilience_service.call(
+                    "openai.chat",
+                    self.client.chat.completions.create,
+                    model=route.model,
+                    messages=messages,
+                    max_tokens=route.max_tokens
+                )
+            cost = metrics_service.record_usage(route.model, response.usage)
+            metrics_service.inc("openai_route_requests_total", route=route.name)
+            metrics_service.inc("openai_route_cost_usd_total", cost, route=route.name)
+
+            return response.choices[0].message.content
         except Exception as e:
             logger.error(f"Error generating response: {str(e)}")
             raise
 
-# Create singleton instance
-openai_service = OpenAIService() 
\ No newline at end of file
+# Create lazily constructed singleton instance
+openai_service = LazyService(OpenAIService, "openai") 
\ No newline at end of file
@@ -0,0 +1,301 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+from loguru import logger
+from telegram.ext import Application, BasePersistence, PersistenceInput
+
+# Kinds whose entries are kept in memory behind the LRU front
+MEMORY_BOUNDED_KINDS = ("user_data", "chat_data")
+
+
+class SQLitePersistence(BasePersistence):
+    """
+    python-telegram-bot persistence backed by a local SQLite store.
+    The store is shared by every bot process, so user and chat data outlive the
+    process that wrote them. Webhook workers route updates by chat id, which
+    keeps a single writer per chat.
+
+    Writes are buffered and flushed in batches (write-behind). Only the most
+    recently active users and chats stay in the application's memory; the rest
+    are evicted once their last update is persisted and reloaded from the store
+    on their next update. Entries idle for longer than the TTL, such as abandoned
+    client drafts and conversations, are deleted.
+    """
+
+    def __init__(self, db_path: str = None, update_interval: float = None):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=True, chat_data=True, user_data=True, callback_data=False),
+            update_interval=update_interval or float(os.getenv("PERSISTENCE_UPDATE_INTERVAL", "5")),
+        )
+        self.db_path = db_path or os.getenv("PERSISTENCE_DB_PATH", "data/state.db")
+        self.cache_size = int(os.getenv("PERSISTENCE_CACHE_SIZE", "1000"))
+        self.ttl = float(os.getenv("PERSISTENCE_DRAFT_TTL", "86400"))
+        self.flush_interval = float(os.getenv("PERSISTENCE_FLUSH_INTERVAL", "2"))
+        self.batch_size = int(os.getenv("PERSISTENCE_BATCH_SIZE", "100"))
+        self.application: Optional[Application] = None
+        # (kind, key) -> serialized value, or None for a pending delete
+        self._pending: Dict[Tuple[str, str], Optional[str]] = {}
+        # kind -> id -> last access time, least recently used first
+        self._recent: Dict[str, "OrderedDict[int, float]"] = {kind: OrderedDict() for kind in MEMORY_BOUNDED_KINDS}
+        # kind -> id -> when PTB last handed the entry to update_*_data
+        self._persisted_at: Dict[str, Dict[int, float]] = {kind: {} for kind in MEMORY_BOUNDED_KINDS}
+        # kind -> ids dropped from memory by eviction whose stored rows must stay
+        self._evicting: Dict[str, Set[int]] = {kind: set() for kind in MEMORY_BOUNDED_KINDS}
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._init_database()
+        logger.info("SQLite persistence initialized successfully")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        # WAL lets worker processes read while another one writes
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _init_database(self):
+        try:
+            with self._connect() as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS persistence (
+                        kind TEXT NOT NULL,
+                        key TEXT NOT NULL,
+                        value TEXT NOT NULL,
+                        updated_at REAL NOT NULL,
+                        PRIMARY KEY (kind, key)
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_persistence_updated ON persistence (kind, updated_at)")
+                conn.commit()
+        except Exception as e:
+            logger.error(f"Error initializing persistence database: {str(e)}")
+            raise
+
+    def attach_application(self, application: Application):
+        """Enable memory eviction and start the background flusher; call from post_init"""
+        self.application = application
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._run_flusher())
+
+    def _load(self, kind: str, limit: Optional[int] = None) -> Dict[str, Any]:
+        query = "SELECT key, value FROM persistence WHERE kind = ? AND updated_at >= ? ORDER BY updated_at DESC"
+        # bot_data is rewritten on every persistence run and never expires
+        params: Tuple = (kind, time.time() - self.ttl if kind != "bot_data" else 0)
+        if limit is not None:
+            query += " LIMIT ?"
+            params += (limit,)
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def _load_one(self, kind: str, key: str) -> Optional[Any]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT value FROM persistence WHERE kind = ? AND key = ? AND updated_at >= ?",
+                (kind, key, time.time() - self.ttl),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _write_batch(self, batch: Dict[Tuple[str, str], Optional[str]]):
+        now = time.time()
+        upserts = [(kind, key, value, now) for (kind, key), value in batch.items() if value is not None]
+        deletes = [(kind, key) for (kind, key), value in batch.items() if value is None]
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO persistence (kind, key, value, updated_at) VALUES (?, ?, ?, ?)", upserts
+            )
+            conn.executemany("DELETE FROM persistence WHERE kind = ? AND key = ?", deletes)
+            conn.commit()
+
+    def _delete_expired(self) -> int:
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM persistence WHERE kind != 'bot_data' AND updated_at < ?", (time.time() - self.ttl,)
+            )
+            conn.commit()
+            return cursor.rowcount
+
+    async def _flush_pending(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except Exception as e:
+                # Keep the batch unless newer writes for the same keys arrived meanwhile
+                for key, value in batch.items():
+                    self._pending.setdefault(key, value)
+                logger.error(f"Error flushing persistence batch: {str(e)}")
+                raise
+
+    async def _sweep(self, expire: bool = False):
+        """Evict idle entries and flush; with `expire`, also drop and purge everything past the TTL"""
+        self._evict(expire)
+        await self._flush_pending()
+        if expire:
+            deleted = await asyncio.to_thread(self._delete_expired)
+            if deleted:
+                logger.info(f"Deleted {deleted} expired conversation state entries")
+
+    async def _run_flusher(self):
+        last_expiry = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                expire = time.monotonic() - last_expiry >= min(self.ttl, 60)
+                if expire:
+                    last_expiry = time.monotonic()
+                await self._sweep(expire)
+            except Exception as e:
+                logger.error(f"Error in persistence flusher: {str(e)}")
+
+    def _queue_write(self, kind: str, key: str, value: Optional[Any]):
+        self._pending[(kind, key)] = None if value is None else json.dumps(value, ensure_ascii=False, default=str)
+
+    async def _maybe_flush(self):
+        if len(self._pending) >= self.batch_size:
+            await self._flush_pending()
+
+    def _touch(self, kind: str, entry_id: int):
+        """Mark an entry as used by an update that is now being processed"""
+        recent = self._recent[kind]
+        recent[entry_id] = time.time()
+        recent.move_to_end(entry_id)
+
+    def _evict(self, expire: bool):
+        """
+        Hand least recently used entries over the capacity, and with `expire` the ones idle
+        past the TTL, back to the store through the application's public drop hooks.
+        An entry refreshed since PTB last passed it to update_*_data still has an update in
+        flight: its handler holds the live dict, so it stays until its changes are persisted.
+        """
+        if self.application is None:
+            return
+        cutoff = time.time() - self.ttl
+        for kind, recent in self._recent.items():
+            persisted = self._persisted_at[kind]
+            drop = self.application.drop_user_data if kind == "user_data" else self.application.drop_chat_data
+            excess = len(recent) - self.cache_size
+            for entry_id, last_used in list(recent.items()):
+                expired = expire and last_used < cutoff
+                if excess <= 0 and not expired:
+                    break
+                if last_used > persisted.get(entry_id, 0):
+                    continue
+                del recent[entry_id]
+                persisted.pop(entry_id, None)
+                excess -= 1
+                if not expired:
+                    # Only leaving memory: the drop_*_data call PTB makes next must keep the stored row
+                    self._evicting[kind].add(entry_id)
+                drop(entry_id)
+
+    async def _refresh(self, kind: str, entry_id: int, data: Dict[Any, Any]):
+        was_cached = entry_id in self._recent[kind]
+        self._touch(kind, entry_id)
+        if was_cached or data:
+            return
+        # LRU miss: the entry was evicted from memory or belongs to another worker's past
+        pending = self._pending.get((kind, str(entry_id)), "missing")
+        if pending != "missing":
+            stored = json.loads(pending) if pending is not None else None
+        else:
+            stored = await asyncio.to_thread(self._load_one, kind, str(entry_id))
+        if stored:
+            data.update(stored)
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        data = await asyncio.to_thread(self._load, "user_data", self.cache_size)
+        for user_id in reversed(list(data)):
+            self._recent["user_data"][int(user_id)] = self._persisted_at["user_data"][int(user_id)] = time.time()
+        return {int(user_id): value for user_id, value in data.items()}
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        data = await asyncio.to_thread(self._load, "chat_data", self.cache_size)
+        for chat_id in reversed(list(data)):
+            self._recent["chat_data"][int(chat_id)] = self._persisted_at["chat_data"][int(chat_id)] = time.time()
+        return {int(chat_id): value for chat_id, value in data.items()}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        data = await asyncio.to_thread(self._load, "bot_data")
+        return data.get("bot_data", {})
+
+    async def get_callback_data(self) -> Optional[Any]:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict[Tuple, object]:
+        data = await asyncio.to_thread(self._load, f"conversation:{name}")
+        return {tuple(json.loads(key)): state for key, state in data.items()}
+
+    async def update_conversation(self, name: str, key: Tuple, new_state: Optional[object]):
+        self._queue_write(f"conversation:{name}", json.dumps(key), new_state)
+        await self._maybe_flush()
+
+    async def _update(self, kind: str, entry_id: int, data: Dict[Any, Any]):
+        if entry_id in self._recent[kind]:
+            self._persisted_at[kind][entry_id] = time.time()
+        elif not data:
+            # Nothing new for an entry no longer in memory; keep the stored copy
+            return
+        # Empty dicts are not worth a row; PTB creates one for every user it sees
+        self._queue_write(kind, str(entry_id), data or None)
+        await self._maybe_flush()
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]):
+        await self._update("user_data", user_id, data)
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]):
+        await self._update("chat_data", chat_id, data)
+
+    async def update_bot_data(self, data: Dict[Any, Any]):
+        self._queue_write("bot_data", "bot_data", data)
+        await self._maybe_flush()
+
+    async def update_callback_data(self, data: Any):
+        pass
+
+    async def _drop(self, kind: str, entry_id: int):
+        if entry_id in self._evicting[kind]:
+            self._evicting[kind].discard(entry_id)
+            if entry_id in self._recent[kind]:
+                # Used again since its eviction; PTB skips updates of dropped entries, so write it here
+                memory = self.application.user_data if kind == "user_data" else self.application.chat_data
+                if memory.get(entry_id):
+                    self._queue_write(kind, str(entry_id), memory[entry_id])
+                self._persisted_at[kind][entry_id] = time.time()
+            return
+        self._recent[kind].pop(entry_id, None)
+        self._persisted_at[kind].pop(entry_id, None)
+        self._queue_write(kind, str(entry_id), None)
+        await self._maybe_flush()
+
+    async def drop_user_data(self, user_id: int):
+        await self._drop("user_data", user_id)
+
+    async def drop_chat_data(self, chat_id: int):
+        await self._drop("chat_data", chat_id)
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]):
+        await self._refresh("user_data", user_id, user_data)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]):
+        await self._refresh("chat_data", chat_id, chat_data)
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]):
+        pass
+
+    async def flush(self):
+        """Write everything still buffered; PTB calls this on shutdown"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self._flush_pending()
@@ -1,18 +1,72 @@
+import asyncio
 import os
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
-from pinecone import Pinecone, Index
 from loguru import logger
+from .resilience import resilience_service
+from .lifecycle import LazyService
 
 load_dotenv()
 
 class PineconeService:
     def __init__(self):
+        # "pinecone" uses the hosted index, "local" an in-process index persisted under LOCAL_VECTOR_PATH
+        self.backend = os.getenv("VECTOR_BACKEND", "pinecone").lower()
+        self.save_interval = float(os.getenv("LOCAL_VECTOR_SAVE_INTERVAL", "30"))
+        # After an ingestion the index is saved this many seconds later, so a restart starts warm
+        self.save_delay = float(os.getenv("LOCAL_VECTOR_SAVE_DELAY", "2"))
+        self._save_task: Optional[asyncio.Task] = None
+        self._save_requested = asyncio.Event()
+        if self.backend == "local":
+            from .local_vector_store import LocalVectorIndex
+            self.index = LocalVectorIndex(
+                os.getenv("LOCAL_VECTOR_PATH", "data/vectors"),
+                quantization=os.getenv("LOCAL_VECTOR_QUANTIZATION", "float32").lower(),
+            )
+            logger.info("Local vector index initialized successfully")
+            return
         self._validate_config()
+        # The SDK takes a noticeable share of startup, so it is imported on first use
+        from pinecone import Pinecone
         self.pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
         self.index = self.pc.Index(host=os.getenv("PINECONE_HOST"))
         logger.info("Pinecone client initialized successfully")
 
+    async def start(self):
+        """Write the local index to disk periodically and after ingestions"""
+        if self.backend == "local" and self._save_task is None:
+            self._save_task = asyncio.create_task(self._run_saver())
+
+    async def stop(self):
+        if self._save_task is not None:
+            self._save_task.cancel()
+            try:
+                await self._save_task
+            except asyncio.CancelledError:
+                pass
+            self._save_task = None
+        if self.backend == "local":
+            await asyncio.to_thread(self.index.save)
+
+    def request_save(self):
+        """Save the local index soon instead of at the next interval, e.g. after an ingestion"""
+        if self.backend == "local":
+            self._save_requested.set()
+
+    async def _run_saver(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._save_requested.wait(), self.save_interval)
+                # Documents sent together finish ingesting before one snapshot is written
+                await asyncio.sleep(self.save_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._save_requested.clear()
+            try:
+                await asyncio.to_thread(self.index.save)
+            except Exception as e:
+                logger.error(f"Error saving local vector index: {str(e)}")
+
     def _validate_config(self):
         required_vars = [
             "PINECONE_API_KEY",
@@ -25,54 +79,90 @@ class PineconeService:
 
     async def initialize_index(self):
         try:
-            stats = self.index.describe_index_stats()
+            stats = await resilience_service.call("pinecone.describe", self.index.describe_index_stats)
             logger.info(f"Successfully connected to Pinecone index: {stats}")
             return stats
         except Exception as e:
             logger.error(f"Error connecting to index: {str(e)}")
             raise
 
-    async def upsert_vectors(self, vectors: List[Dict[str, Any]]):
+    async def upsert_vectors(self, vectors: List[Dict[str, Any]], namespace: str = ""):
         """
         Upsert vectors to Pinecone index
         vectors: List of dictionaries with 'id', 'values', and optional 'metadata'
+        namespace: Partition the vectors belong to ("" is the shared one)
         """
         try:
-            response = self.index.upsert(vectors=vectors)
+            response = await resilience_service.call(
+                "pinecone.upsert", self.index.upsert, vectors=vectors, namespace=namespace
+            )
             logger.info(f"Successfully upserted {len(vectors)} vectors")
             return response
         except Exception as e:
             logger.error(f"Error upserting vectors: {str(e)}")
             raise
 
-    async def query_vectors(self, vector: List[float], top_k: int = 3):
+    async def query_vectors(self, vector: List[float], top_k: int = 3, namespace: str = "",
+                            filter: Optional[Dict[str, Any]] = None):
         """
         Query vectors from Pinecone index
         vector: Query vector
         top_k: Number of results to return
+        namespace: Partition to search; other namespaces are not scanned
+        filter: Metadata filter applied by the index before ranking, e.g. {"category": {"$eq": "pension"}}
         """
         try:
-            response = self.index.query(
+            kwargs = {"filter": filter} if filter else {}
+            response = await resilience_service.call(
+                "pinecone.query",
+                self.index.query,
                 vector=vector,
                 top_k=top_k,
-                include_metadata=True
+                include_metadata=True,
+                namespace=namespace,
+                idempotent=True,
+                **kwargs
             )
             return response.matches
         except Exception as e:
             logger.error(f"Error querying vectors: {str(e)}")
             raise
 
-    async def delete_vectors(self, ids: List[str]):
+    async def query_namespaces(self, vector: List[float], namespaces: List[str], top_k: int = 3,
+                               filter: Optional[Dict[str, Any]] = None):
+        """Query several namespaces concurrently and merge the best matches"""
+        results = await asyncio.gather(*(
+            self.query_vectors(vector, top_k=top_k, namespace=namespace, filter=filter)
+            for namespace in dict.fromkeys(namespaces)
+        ))
+        matches = [match for result in results for match in result]
+        return sorted(matches, key=lambda match: match.score, reverse=True)[:top_k]
+
+    async def fetch_vectors(self, ids: List[str], namespaces: List[str]) -> List[Any]:
+        """Vectors with their metadata by id, looked up in each namespace; unknown ids are skipped"""
+        try:
+            responses = await asyncio.gather(*(
+                resilience_service.call(
+                    "pinecone.fetch", self.index.fetch, ids=ids, namespace=namespace, idempotent=True
+                )
+                for namespace in dict.fromkeys(namespaces)
+            ))
+            return [vector for response in responses for vector in response.vectors.values()]
+        except Exception as e:
+            logger.error(f"Error fetching vectors: {str(e)}")
+            raise
+
+    async def delete_vectors(self, ids: List[str], namespace: str = ""):
         """
         Delete vectors from Pinecone index
         ids: List of vector IDs to delete
         """
         try:
-            self.index.delete(ids=ids)
+            await resilience_service.call("pinecone.delete", self.index.delete, ids=ids, namespace=namespace)
             logger.info(f"Successfully deleted {len(ids)} vectors")
         except Exception as e:
             logger.error(f"Error deleting vectors: {str(e)}")
             raise
 
-# Create singleton instance
-pinecone_service = PineconeService() 
\ No newline at end of file
+# Create lazily constructed singleton instance
+pinecone_service = LazyService(PineconeService, "pinecone") 
\ No newline at end of file
@@ -0,0 +1,355 @@
+import asyncio
+import gc
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from functools import lru_cache
+from types import CodeType, FrameType
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from loguru import logger
+from .loop_monitor import PROJECT_DIR
+
+# Frames that identify the handler a stack belongs to; album ingestion runs in its own task
+HANDLER_FRAMES = {
+    "handle_voice": "handle_voice",
+    "_process_voice": "handle_voice",
+    "handle_document": "handle_document",
+    "_ingest_media_group": "handle_document",
+    "_process_media_group": "handle_document",
+    "handle_clients": "handle_clients",
+}
+PROFILED_HANDLERS = ("handle_voice", "handle_document", "handle_clients")
+OTHER = "other"
+IDLE = "(idle)"
+
+# Innermost frames of a thread that is waiting rather than running: the event loop's
+# selector, thread pool workers waiting for work, and threads blocked on a lock or event
+_IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+}
+
+# Generic call wrappers; the frame that called them says more about what a handler waits on
+_WRAPPER_FRAMES = ("call (services/resilience.py", "_call_hedged (services/resilience.py", "wrapper (bot.py")
+
+
+class ProfilerBusyError(Exception):
+    """Raised when a profile is requested while another one is running"""
+
+
+@lru_cache(maxsize=4096)
+def _code_label(code: CodeType, lineno: int) -> str:
+    filename = code.co_filename
+    if filename.startswith(PROJECT_DIR):
+        filename = os.path.relpath(filename, PROJECT_DIR)
+    else:
+        filename = os.path.basename(filename)
+    # Semicolons separate frames in the collapsed format
+    return f"{code.co_name} ({filename}:{lineno})".replace(";", ",")
+
+
+def _frame_label(frame: FrameType) -> str:
+    return _code_label(frame.f_code, frame.f_lineno)
+
+
+def _is_idle(frame: FrameType) -> bool:
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in _IDLE_FRAMES
+
+
+def _handler_of(frames: List[FrameType]) -> str:
+    """Handler of a stack given root first: the outermost frame naming one"""
+    for frame in frames:
+        handler = HANDLER_FRAMES.get(frame.f_code.co_name)
+        if handler:
+            return handler
+    return OTHER
+
+
+def _awaited_future(awaitable: Any) -> Optional[asyncio.Future]:
+    """Future at the end of an await chain; C futures are awaited through an iterator that holds them"""
+    if awaitable is None or isinstance(awaitable, asyncio.Future):
+        return awaitable
+    for referent in gc.get_referents(awaitable):
+        if isinstance(referent, asyncio.Future):
+            return referent
+    return None
+
+
+def _waiters(task: asyncio.Task) -> Iterator[Any]:
+    """Objects a task's done callbacks refer to: bound tasks, partial arguments and closure variables"""
+    for callback, _ in getattr(task, "_callbacks", None) or ():
+        yield getattr(callback, "__self__", None)
+        yield from getattr(callback, "args", ())
+        for cell in getattr(callback, "__closure__", None) or ():
+            try:
+                yield cell.cell_contents
+            except ValueError:
+                # Closure variable not assigned yet
+                continue
+
+
+def _coroutine_frame(awaitable: Any) -> Tuple[Optional[FrameType], Any]:
+    """Frame of a suspended coroutine or generator and the object it is waiting on"""
+    for frame_attr, await_attr in (("cr_frame", "cr_await"), ("gi_frame", "gi_yieldfrom"), ("ag_frame", "ag_await")):
+        if hasattr(awaitable, frame_attr):
+            return getattr(awaitable, frame_attr), getattr(awaitable, await_attr)
+    return None, None
+
+
+class SamplingProfiler:
+    """
+    On-demand sampling profiler for the running bot.
+    A background thread samples the stacks of all threads (CPU view: where time is spent
+    running Python code), while a task on the loop samples the await chains of all tasks
+    (wall view: what each handler is waiting on). Stacks are attributed to the handler
+    whose frame they contain and written in the collapsed format flamegraph tools read.
+    Each sampler measures its own cost and sleeps long enough to stay under max_overhead.
+    Garbage collection is paused while a sample is taken: collections triggered by the
+    sampler's short-lived objects would otherwise promote them and make the application
+    run full collections more often, a cost many times the sampler's own. Frame objects
+    the interpreter creates for sampled stacks still cost the profiled code some time,
+    which the sampler cannot time, so the default interval is 100 ms.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("PROFILER_ENABLED", "true").lower() == "true"
+        self.interval = float(os.getenv("PROFILER_INTERVAL_MS", "100")) / 1000
+        self.max_seconds = float(os.getenv("PROFILER_MAX_SECONDS", "120"))
+        # Share of one core the samplers may use; the interval stretches to stay under it
+        self.max_overhead = float(os.getenv("PROFILER_MAX_OVERHEAD", "0.02"))
+        self.max_depth = int(os.getenv("PROFILER_MAX_DEPTH", "64"))
+        self.max_stacks = int(os.getenv("PROFILER_MAX_STACKS", "20000"))
+        self.output_dir = os.getenv("PROFILER_OUTPUT_DIR", "profiles")
+        # Profile this many seconds right after startup and save the result under output_dir
+        self.startup_seconds = float(os.getenv("PROFILER_STARTUP_SECONDS", "0"))
+        self._running = False
+        self._gc_lock = threading.Lock()
+        self._gc_pauses = 0
+        self._gc_was_enabled = False
+        logger.info(f"Profiler initialized successfully (enabled: {self.enabled})")
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def _next_delay(self, cost: float) -> float:
+        """Sleep after a sample that took `cost` seconds, so sampling stays under max_overhead"""
+        return max(self.interval, cost / self.max_overhead - cost)
+
+    @contextmanager
+    def _gc_paused(self) -> Iterator[None]:
+        """Keep the garbage collector off while either sampler runs; restores the previous state"""
+        with self._gc_lock:
+            if self._gc_pauses == 0:
+                self._gc_was_enabled = gc.isenabled()
+                gc.disable()
+            self._gc_pauses += 1
+        try:
+            yield
+        finally:
+            with self._gc_lock:
+                self._gc_pauses -= 1
+                if self._gc_pauses == 0 and self._gc_was_enabled:
+                    gc.enable()
+
+    def _add(self, stacks: Counter, key: str):
+        if key in stacks or len(stacks) < self.max_stacks:
+            stacks[key] += 1
+        else:
+            stacks["(truncated)"] += 1
+
+    def _thread_names(self, loop_thread_id: int) -> Dict[int, str]:
+        names = {thread.ident: re.sub(r"_\d+$", "", thread.name) for thread in threading.enumerate()}
+        names[loop_thread_id] = "event-loop"
+        return names
+
+    def _sample_threads(self, stacks: Counter, handlers: Counter, loop_thread_id: int):
+        own_id = threading.get_ident()
+        names = self._thread_names(loop_thread_id)
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            thread = names.get(thread_id, "thread")
+            if _is_idle(frame):
+                self._add(stacks, f"cpu;{thread};{IDLE}")
+                continue
+            frames = []
+            while frame is not None and len(frames) < self.max_depth:
+                frames.append(frame)
+                frame = frame.f_back
+            frames.reverse()
+            handler = _handler_of(frames)
+            if thread_id == loop_thread_id:
+                handlers[handler] += 1
+            labels = ";".join(_frame_label(frame) for frame in frames)
+            self._add(stacks, f"cpu;{thread};{handler};{labels}")
+
+    def _run_thread_sampler(self, stacks: Counter, handlers: Counter, loop_thread_id: int,
+                            stopped: threading.Event, usage: Dict[str, float]):
+        delay = self.interval
+        while not stopped.wait(delay):
+            started = time.perf_counter()
+            try:
+                with self._gc_paused():
+                    self._sample_threads(stacks, handlers, loop_thread_id)
+            except Exception as e:
+                logger.error(f"Error sampling thread stacks: {str(e)}")
+                return
+            cost = time.perf_counter() - started
+            usage["cost"] += cost
+            usage["samples"] += 1
+            delay = self._next_delay(cost)
+
+    def _task_chain(self, task: asyncio.Task) -> Tuple[List[FrameType], Optional[asyncio.Future]]:
+        """Frames of a task's await chain (root first) and the future it is blocked on"""
+        frames = []
+        awaitable = task.get_coro()
+        while awaitable is not None and len(frames) < self.max_depth:
+            frame, awaiting = _coroutine_frame(awaitable)
+            if frame is None:
+                break
+            frames.append(frame)
+            awaitable = awaiting
+        return frames, _awaited_future(awaitable)
+
+    def _sample_tasks(self, stacks: Counter, handlers: Counter):
+        current = asyncio.current_task()
+        chains = {}
+        # id of a future -> the task blocked on it
+        blocked_on = {}
+        for task in asyncio.all_tasks():
+            if task is current or task.done():
+                continue
+            chains[task] = self._task_chain(task)
+            if chains[task][1] is not None:
+                blocked_on[id(chains[task][1])] = task
+
+        # A task belongs to whoever its completion wakes: the task awaiting it directly,
+        # or the task blocked on the gather/wait/wait_for future it reports to
+        children: Dict[asyncio.Task, List[asyncio.Task]] = {}
+        for task in chains:
+            for waiter in _waiters(task):
+                parent = waiter if isinstance(waiter, asyncio.Task) else blocked_on.get(id(waiter))
+                if parent is not None and parent is not task and parent in chains:
+                    children.setdefault(parent, []).append(task)
+                    break
+        nested = {child for tasks in children.values() for child in tasks}
+
+        def emit(task: asyncio.Task, prefix: List[str], handler: str, depth: int):
+            frames, future = chains[task]
+            if handler == OTHER:
+                handler = _handler_of(frames)
+            labels = prefix + [_frame_label(frame) for frame in frames]
+            if task in children and depth < self.max_depth:
+                for child in children[task]:
+                    emit(child, labels, handler, depth + 1)
+                return
+            if future is not None and not isinstance(future, asyncio.Task):
+                labels.append(f"(await {type(future).__name__})")
+            handlers[handler] += 1
+            self._add(stacks, ";".join(["wall", handler, *labels]))
+
+        # Child tasks are sampled under their parent's chain, so a handler's spawned work stays attributed to it
+        for task in chains:
+            if task not in nested:
+                emit(task, [], OTHER, 0)
+
+    async def profile(self, seconds: float) -> Dict[str, Any]:
+        """
+        Sample the running application for `seconds` (clamped to max_seconds).
+        Returns the collapsed stacks and per-handler sample counts.
+        """
+        if self._running:
+            raise ProfilerBusyError("A profile is already running")
+        seconds = min(max(seconds, 1.0), self.max_seconds)
+        self._running = True
+        cpu_stacks, wall_stacks = Counter(), Counter()
+        cpu_handlers, wall_handlers = Counter(), Counter()
+        thread_usage = {"cost": 0.0, "samples": 0}
+        task_usage = {"cost": 0.0, "samples": 0}
+        stopped = threading.Event()
+        sampler = threading.Thread(
+            target=self._run_thread_sampler,
+            args=(cpu_stacks, cpu_handlers, threading.get_ident(), stopped, thread_usage),
+            name="profiler",
+            daemon=True,
+        )
+        logger.info(f"Profiling for {seconds:.0f}s every {self.interval * 1000:.0f} ms")
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            deadline = started + seconds
+            while time.perf_counter() < deadline:
+                sample_started = time.perf_counter()
+                with self._gc_paused():
+                    self._sample_tasks(wall_stacks, wall_handlers)
+                cost = time.perf_counter() - sample_started
+                task_usage["cost"] += cost
+                task_usage["samples"] += 1
+                await asyncio.sleep(min(self._next_delay(cost), max(0.0, deadline - time.perf_counter())))
+        except Exception as e:
+            logger.error(f"Error profiling: {str(e)}")
+            raise
+        finally:
+            stopped.set()
+            await asyncio.to_thread(sampler.join)
+            self._running = False
+        elapsed = time.perf_counter() - started
+
+        return {
+            "started_at": datetime.now().strftime("%Y%m%d-%H%M%S"),
+            "seconds": elapsed,
+            "cpu_samples": thread_usage["samples"],
+            "wall_samples": task_usage["samples"],
+            # Sampling time as a share of the profiled interval
+            "overhead": (thread_usage["cost"] + task_usage["cost"]) / elapsed,
+            "handlers": {
+                handler: {"cpu": cpu_handlers[handler], "wall": wall_handlers[handler]}
+                for handler in (*PROFILED_HANDLERS, OTHER)
+            },
+            "top_waits": self._top_leaves(wall_stacks),
+            "collapsed": "".join(
+                f"{stack} {count}\n" for stacks in (cpu_stacks, wall_stacks) for stack, count in sorted(stacks.items())
+            ),
+        }
+
+    @staticmethod
+    def _top_leaves(wall_stacks: Counter, limit: int = 3) -> Dict[str, List[Tuple[str, int]]]:
+        """Most sampled innermost project frames per handler, i.e. where each handler waits"""
+        leaves: Dict[str, Counter] = {handler: Counter() for handler in PROFILED_HANDLERS}
+        for stack, count in wall_stacks.items():
+            parts = stack.split(";")
+            if len(parts) < 3 or parts[1] not in leaves:
+                continue
+            project = [
+                part for part in parts[2:]
+                if ("(services/" in part or "(bot.py:" in part) and not part.startswith(_WRAPPER_FRAMES)
+            ]
+            leaves[parts[1]][(project or parts[2:])[-1]] += count
+        return {handler: counter.most_common(limit) for handler, counter in leaves.items()}
+
+    def save(self, report: Dict[str, Any]) -> str:
+        """Write the collapsed stacks of a profile under output_dir; returns the file path"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"profile-{os.getpid()}-{report['started_at']}.collapsed")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(report["collapsed"])
+        return path
+
+    async def profile_startup(self):
+        """Profile the first startup_seconds of the process when PROFILER_STARTUP_SECONDS is set"""
+        try:
+            report = await self.profile(self.startup_seconds)
+            logger.info(f"Startup profile saved to {self.save(report)} (overhead {report['overhead']:.2%})")
+        except Exception as e:
+            logger.error(f"Error profiling startup: {str(e)}")
+
+# Create singleton instance
+profiler = SamplingProfiler()
@@ -0,0 +1,34 @@
+from typing import Tuple
+import numpy as np
+
+# Storage formats for embeddings kept locally, from most to least precise
+QUANTIZATION_MODES = ("float32", "int8")
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric per-vector int8 quantization.
+    Returns codes and scales such that vectors ~= codes * scales[..., None].
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=-1) / 127
+    safe = np.where(scales > 0, scales, 1)
+    codes = np.clip(np.rint(vectors / safe[..., None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def dequantize_int8(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    return codes.astype(np.float32) * scales[..., None]
+
+
+def int8_scores(codes: np.ndarray, scales: np.ndarray, query: np.ndarray, block_rows: int = 1024) -> np.ndarray:
+    """
+    Dot products of a float query with int8-coded vectors.
+    Rows are converted in blocks so a scan never materializes the whole matrix as floats.
+    """
+    scores = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), block_rows):
+        block = codes[start:start + block_rows].astype(np.float32)
+        scores[start:start + block_rows] = (block @ query) * scales[start:start + block_rows]
+    return scores
+
@@ -1,75 +1,353 @@
+import asyncio
 import os
-from typing import List, Dict, Any
+from collections import Counter
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from typing import AsyncIterator, BinaryIO, Iterable, Iterator, List, Dict, Any, Optional, Set, Tuple
 from loguru import logger
 from .openai_service import openai_service
 from .pinecone_service import pinecone_service
+from .metrics_service import metrics_service
+from .rerank_service import rerank_service
+from .audio_service import audio_service
+from .embedding_batcher import embedding_batcher, PRIORITY_BULK
+from .client_context import client_context
+
+# Vector ids per delete request, Pinecone's limit
+DELETE_BATCH_SIZE = 1000
+
+class IngestBatch:
+    """
+    Shared embedding buffer for documents ingested together, e.g. an album of files.
+    Documents are added concurrently; their chunks are pooled so every embeddings
+    request and upsert carries a full batch regardless of how small each file is.
+    Chunks are stored as the document streams in. If its extractor fails halfway,
+    the chunks of that document already stored are deleted again.
+    """
+
+    def __init__(self, rag: "RAGService"):
+        self.rag = rag
+        self.batch_size = rag.embedding_batch_size
+        self.stored = 0
+        self.error: Optional[Exception] = None
+        # (namespace, vector id, text, metadata) waiting to be embedded
+        self._chunks: List[Tuple[str, str, str, Dict[str, Any]]] = []
+        # Documents whose extractor failed; their chunks in a batch still in flight are deleted once it lands
+        self._failed: Set[str] = set()
+        # Chunks stored per document, so a failed one can be taken off the total
+        self._stored_counts: Counter = Counter()
+
+    async def _flush(self, size: int):
+        # Slice before awaiting so concurrent adders never send the same chunk twice
+        batch, self._chunks = self._chunks[:size], self._chunks[size:]
+        try:
+            await self.rag._store_chunks(batch)
+        except Exception as e:
+            # Chunks of other documents went down with this batch, so the whole ingest fails
+            self.error = e
+            raise
+        orphans = []
+        for namespace, vector_id, _, metadata in batch:
+            if metadata["document_id"] in self._failed:
+                orphans.append((namespace, vector_id))
+            else:
+                self._stored_counts[metadata["document_id"]] += 1
+        self.stored += len(batch) - len(orphans)
+        if orphans:
+            await self._delete(orphans)
+
+    @staticmethod
+    async def _delete(vectors: List[Tuple[str, str]]):
+        """Delete chunks of a failed document given as (namespace, vector id) pairs"""
+        by_namespace: Dict[str, List[str]] = {}
+        for namespace, vector_id in vectors:
+            by_namespace.setdefault(namespace, []).append(vector_id)
+        try:
+            for namespace, ids in by_namespace.items():
+                for start in range(0, len(ids), DELETE_BATCH_SIZE):
+                    await pinecone_service.delete_vectors(ids[start:start + DELETE_BATCH_SIZE], namespace=namespace)
+        except Exception as e:
+            # The document already failed; its leftovers must not fail the other documents too
+            logger.error(f"Error deleting chunks of a failed document: {str(e)}")
+
+    async def _discard(self, document_id: str, namespace: str, count: int):
+        """Drop the first `count` chunks of a failed document from the pool and the index"""
+        self._failed.add(document_id)
+        self._chunks = [chunk for chunk in self._chunks if chunk[3]["document_id"] != document_id]
+        self.stored -= self._stored_counts.pop(document_id, 0)
+        # Ids of chunks in a batch still in flight are included; _flush deletes them again when it lands
+        await self._delete([(namespace, f"{document_id}_chunk_{i}") for i in range(count)])
+
+    async def add(self, blocks: Iterable[str], document_id: str, namespace: str = "",
+                  metadata: Optional[Dict[str, Any]] = None, paged: bool = False) -> int:
+        """
+        Chunk a document into the batch; blocks are pulled in a worker thread because extractors parse as they go.
+        metadata: Extra fields stored with every chunk (source file, category, upload date...)
+        paged: Blocks are pages or slides, so each chunk records the page it starts on
+        """
+        chunks = self.rag._iter_chunks(blocks)
+        done = object()
+        count = 0
+        while True:
+            if self.error is not None:
+                raise self.error
+            try:
+                item = await asyncio.to_thread(next, chunks, done)
+            except Exception:
+                await self._discard(document_id, namespace, count)
+                raise
+            if item is done:
+                return count
+            chunk, block = item
+            chunk_metadata = {**(metadata or {}), "text": chunk, "document_id": document_id}
+            if paged:
+                chunk_metadata["page"] = block + 1
+            self._chunks.append((namespace, f"{document_id}_chunk_{count}", chunk, chunk_metadata))
+            count += 1
+            if len(self._chunks) >= self.batch_size:
+                await self._flush(self.batch_size)
+
+    async def close(self):
+        """Store whatever is left; raises if any batch of this ingest failed"""
+        if self.error is not None:
+            raise self.error
+        while self._chunks:
+            await self._flush(self.batch_size)
+
 
 class RAGService:
     def __init__(self):
         self.chunk_size = int(os.getenv("CHUNK_SIZE", "1000"))
         self.chunk_overlap = int(os.getenv("CHUNK_OVERLAP", "100"))
+        # Chunks advance by this many words; zero or less would never move past the first chunk
+        if self.chunk_size // 4 - self.chunk_overlap <= 0:
+            raise ValueError(
+                f"CHUNK_OVERLAP ({self.chunk_overlap}) must be less than CHUNK_SIZE / 4 ({self.chunk_size // 4} words)"
+            )
+        # Chunks embedded and upserted per request while a document streams in
+        self.embedding_batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+        # Where advisors' documents go: "shared" (one namespace), "team" or "advisor"
+        self.knowledge_scope = os.getenv("KNOWLEDGE_SCOPE", "shared").lower()
+        self.advisor_teams = self._parse_teams(os.getenv("ADVISOR_TEAMS", ""))
         logger.info("RAG service initialized successfully")
 
+    @staticmethod
+    def _parse_teams(value: str) -> Dict[int, str]:
+        """Parse ADVISOR_TEAMS, e.g. "kyiv:101,102;lviv:201", into user id -> team"""
+        teams = {}
+        for entry in value.split(";"):
+            if ":" not in entry:
+                continue
+            team, user_ids = entry.split(":", 1)
+            for user_id in user_ids.split(","):
+                if user_id.strip():
+                    teams[int(user_id)] = team.strip()
+        return teams
+
+    def get_namespace(self, user_id: int) -> str:
+        """Namespace an advisor's uploads are stored in ("" is the shared one)"""
+        if self.knowledge_scope == "team" and user_id in self.advisor_teams:
+            return f"team-{self.advisor_teams[user_id]}"
+        if self.knowledge_scope in ("team", "advisor"):
+            return f"advisor-{user_id}"
+        return ""
+
+    def get_search_namespaces(self, user_id: int) -> List[str]:
+        """Namespaces searched for an advisor: their own plus the shared knowledge base"""
+        namespace = self.get_namespace(user_id)
+        return [namespace, ""] if namespace else [""]
+
+    def _iter_chunks(self, blocks: Iterable[str]) -> Iterator[Tuple[str, int]]:
+        """
+        Split a stream of text blocks into overlapping chunks, holding one chunk of words at a time.
+        Yields (chunk, index of the block the chunk starts in).
+        """
+        chunk_size_words = self.chunk_size // 4  # Approximate words per chunk
+        step = chunk_size_words - self.chunk_overlap
+        words = []
+        word_blocks = []
+        for block_index, block in enumerate(blocks):
+            block_words = block.split()
+            words.extend(block_words)
+            word_blocks.extend([block_index] * len(block_words))
+            while len(words) >= chunk_size_words + step:
+                yield " ".join(words[:chunk_size_words]), word_blocks[0]
+                del words[:step]
+                del word_blocks[:step]
+        # Tail: same windows a single pass over the whole text would produce
+        for i in range(0, len(words), step):
+            yield " ".join(words[i:i + chunk_size_words]), word_blocks[i]
+
     def _chunk_text(self, text: str) -> List[str]:
         """Split text into chunks with overlap"""
-        chunks = []
-        words = text.split()
-        chunk_size_words = self.chunk_size // 4  # Approximate words per chunk
-        
-        for i in range(0, len(words), chunk_size_words - self.chunk_overlap):
-            chunk = " ".join(words[i:i + chunk_size_words])
-            chunks.append(chunk)
-        
-        return chunks
-
-    async def process_document(self, text: str, document_id: str):
-        """Process a document and store it in the vector database"""
+        return [chunk for chunk, _ in self._iter_chunks([text])]
+
+    async def _store_chunks(self, chunks: List[Tuple[str, str, str, Dict[str, Any]]]):
+        """Embed and upsert (namespace, vector id, text, metadata) entries, possibly from several documents"""
+        embeddings = await embedding_batcher.embed([text for _, _, text, _ in chunks], priority=PRIORITY_BULK)
+        by_namespace: Dict[str, List[Dict[str, Any]]] = {}
+        for (namespace, vector_id, _, metadata), embedding in zip(chunks, embeddings):
+            by_namespace.setdefault(namespace, []).append({
+                "id": vector_id,
+                "values": embedding,
+                "metadata": metadata
+            })
+        for namespace, vectors in by_namespace.items():
+            await pinecone_service.upsert_vectors(vectors, namespace=namespace)
+
+    @asynccontextmanager
+    async def ingest_batch(self) -> AsyncIterator["IngestBatch"]:
+        """Ingest several documents at once; remaining chunks are stored when the block exits"""
+        batch = IngestBatch(self)
+        yield batch
+        await batch.close()
+        pinecone_service.request_save()
+
+    async def process_document_stream(self, blocks: Iterable[str], document_id: str, namespace: str = "",
+                                      metadata: Optional[Dict[str, Any]] = None, paged: bool = False) -> int:
+        """
+        Chunk, embed and store a document given as a stream of text blocks.
+        Chunks are embedded in batches, so memory stays flat for large files.
+        Returns the number of stored chunks.
+        """
         try:
-            # Split text into chunks
-            chunks = self._chunk_text(text)
-            logger.info(f"Split document into {len(chunks)} chunks")
-
-            # Create embeddings for chunks
-            embeddings = await openai_service.create_embeddings(chunks)
-            logger.info("Created embeddings for chunks")
-
-            # Prepare vectors for Pinecone
-            vectors = []
-            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-                vectors.append({
-                    "id": f"{document_id}_chunk_{i}",
-                    "values": embedding,
-                    "metadata": {
-                        "text": chunk,
-                        "document_id": document_id
-                    }
-                })
-
-            # Store vectors in Pinecone
-            await pinecone_service.upsert_vectors(vectors)
-            logger.info(f"Stored {len(vectors)} vectors in Pinecone")
+            async with self.ingest_batch() as batch:
+                stored = await batch.add(blocks, document_id, namespace=namespace, metadata=metadata, paged=paged)
+            logger.info(f"Stored {stored} vectors in Pinecone")
+            return stored
 
         except Exception as e:
             logger.error(f"Error processing document: {str(e)}")
             raise
 
-    async def process_audio_query(self, audio_file_path: str) -> str:
-        """Process audio query and return response"""
+    async def process_document(self, text: str, document_id: str, namespace: str = "",
+                               metadata: Optional[Dict[str, Any]] = None):
+        """Process a document and store it in the vector database"""
+        await self.process_document_stream([text], document_id, namespace=namespace, metadata=metadata)
+
+    @staticmethod
+    def _score_fetched(vector: List[float], fetched: List[Any]) -> List[Any]:
+        """Give fetched vectors a cosine score against the query, like query matches carry"""
+        if not fetched:
+            return []
+        # Imported here so bot startup does not load numpy
+        import numpy as np
+
+        query = np.asarray(vector, dtype=np.float32)
+        values = np.asarray([match.values for match in fetched], dtype=np.float32)
+        scores = values @ query / np.maximum(np.linalg.norm(values, axis=1) * np.linalg.norm(query), 1e-12)
+        return [
+            SimpleNamespace(id=match.id, score=float(score), metadata=match.metadata)
+            for match, score in zip(fetched, scores)
+        ]
+
+    @staticmethod
+    def _merge(remembered: List[Any], candidates: List[Any]) -> List[Any]:
+        merged = {match.id: match for match in remembered}
+        merged.update((match.id, match) for match in candidates)
+        return sorted(merged.values(), key=lambda match: match.score, reverse=True)
+
+    async def _retrieve(self, query: str, vector: List[float], namespaces: List[str],
+                        filter: Optional[Dict[str, Any]], remembered: Optional[List[Any]] = None) -> List[Any]:
+        """
+        Retrieve passages for the prompt.
+        With reranking, a wider candidate set is fetched and rescored; the depth doubles
+        while too few relevant passages were found and deeper vector scores stay close
+        to the best one. Scores are cached, so widening only rescores new candidates.
+        remembered: Chunks that were relevant to the same client before; they join the
+        candidates, and fewer fresh candidates are retrieved to start with.
+        If no candidate passes the rerank threshold, the best vector matches are used.
+        """
+        remembered = remembered or []
+        if not rerank_service.enabled:
+            with metrics_service.timer("vector_query"):
+                candidates = await pinecone_service.query_namespaces(vector, namespaces, top_k=3, filter=filter)
+            return self._merge(remembered, candidates)[:3]
+
+        depth = client_context.min_candidates if remembered else rerank_service.min_candidates
+        while True:
+            with metrics_service.timer("vector_query"):
+                fresh = await pinecone_service.query_namespaces(vector, namespaces, top_k=depth, filter=filter)
+            candidates = self._merge(remembered, fresh)
+            try:
+                scores = await rerank_service.score(query, candidates)
+            except Exception as e:
+                # Reranking only refines the context, so fall back to the vector order
+                logger.error(f"Error reranking passages, using vector order: {str(e)}")
+                return candidates[:rerank_service.max_passages]
+            selected = rerank_service.select(candidates, scores)
+            if not rerank_service.should_widen(fresh, depth, len(selected)):
+                metrics_service.observe("rerank_candidate_depth", depth)
+                if not selected:
+                    logger.info("No passage passed the rerank threshold, using the best vector matches")
+                    return candidates[:rerank_service.fallback_passages]
+                return selected
+            depth = min(depth * 2, rerank_service.max_candidates)
+
+    async def _client_profile(self, transcription: str) -> Optional[Dict[str, Any]]:
+        """Cached profile of the known client a voice note is about, if any"""
+        client_id = await client_context.recognize(transcription)
+        if client_id is None:
+            return None
+        try:
+            return await client_context.get_profile(client_id)
+        except Exception as e:
+            logger.error(f"Error loading client context: {str(e)}")
+            return None
+
+    async def _remembered_chunks(self, profile: Optional[Dict[str, Any]], namespaces: List[str],
+                                 filter: Optional[Dict[str, Any]]) -> List[Any]:
+        """Chunks used for a returning client before (skipped with a filter, which they may not match)"""
+        if profile is None or not profile["chunk_ids"] or filter:
+            return []
         try:
-            # Transcribe audio
-            transcription = await openai_service.transcribe_audio(audio_file_path)
-            logger.info(f"Transcribed audio: {transcription}")
+            return await pinecone_service.fetch_vectors(profile["chunk_ids"], namespaces)
+        except Exception as e:
+            # The client's history only improves the answer, so carry on without it
+            logger.error(f"Error fetching remembered chunks: {str(e)}")
+            return []
+
+    async def process_audio_query(self, audio_file: BinaryIO, namespaces: Optional[List[str]] = None,
+                                  filter: Optional[Dict[str, Any]] = None, duration: float = 0) -> str:
+        """
+        Process audio query and return response
+        namespaces: Knowledge namespaces to search (default: the shared one)
+        filter: Metadata filter pushed down to the vector index
+        duration: Length of the recording in seconds; long ones are trimmed and split before Whisper
+        """
+        try:
+            # Trim silence and split long notes, then transcribe the segments concurrently
+            segments, billed_seconds = await audio_service.prepare(audio_file, duration)
+            if billed_seconds:
+                metrics_service.record_audio_usage("whisper-1", billed_seconds)
+            with metrics_service.timer("whisper"):
+                transcription = await audio_service.transcribe(segments)
+            logger.bind(payload=True).info("Transcribed audio: {}", transcription)
+
+            # A returning client's product and goal sharpen a follow-up like "зустрілися з Іваном ще раз"
+            namespaces = namespaces or [""]
+            profile = await self._client_profile(transcription)
+            search_text = f"{transcription} {profile['focus']}" if profile else transcription
 
-            # Create embedding for query
-            query_embedding = await openai_service.create_embeddings([transcription])
+            # Create embedding for query, while the chunks remembered for the client are fetched
+            with metrics_service.timer("query_embedding"):
+                query_embedding, fetched = await asyncio.gather(
+                    embedding_batcher.embed([search_text]),
+                    self._remembered_chunks(profile, namespaces, filter),
+                )
             logger.info("Created embedding for query")
 
-            # Search similar vectors
-            matches = await pinecone_service.query_vectors(query_embedding[0], top_k=3)
-            logger.info(f"Found {len(matches)} similar vectors")
+            # Search similar vectors and keep the relevant ones
+            remembered = self._score_fetched(query_embedding[0], fetched)
+            matches = await self._retrieve(search_text, query_embedding[0], namespaces, filter, remembered)
+            logger.info(f"Selected {len(matches)} relevant passages")
+            if profile is not None:
+                client_context.remember(profile["client_id"], [match.id for match in matches])
 
-            # Combine context from matches
+            # Combine context from matches, after what is known about the client
             context = "\n\n".join([match.metadata["text"] for match in matches])
+            if profile is not None:
+                context = f"Історія клієнта:\n{profile['summary']}\n\n{context}"
 
             # Generate response
             response = await openai_service.generate_response(transcription, context)
@@ -77,7 +355,8 @@ class RAGService:
 
             return {
                 "transcription": transcription,
-                "response": response
+                "response": response,
+                "client_id": profile["client_id"] if profile else None
             }
 
         except Exception as e:
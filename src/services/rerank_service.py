@@ -0,0 +1,189 @@
+import asyncio
+import hashlib
+import math
+import os
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from loguru import logger
+from .openai_service import openai_service
+from .metrics_service import metrics_service
+from .lifecycle import LazyService
+
+RERANK_BACKENDS = ("none", "llm", "cross-encoder")
+DIGEST_SIZE = 8
+
+
+def _digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=DIGEST_SIZE).digest()
+
+
+class RerankService:
+    """
+    Rescores retrieved passages against the query so only relevant ones reach the prompt.
+    Backends: "llm" rates all candidates in one cheap chat call, "cross-encoder" runs a
+    local sentence-transformers model, "none" keeps the vector store order.
+    Scores are cached per (query, passage) pair. The cache is snapshotted under
+    RERANK_CACHE_PATH and reloaded on start, so repeated questions stay cheap after a restart.
+    """
+
+    def __init__(self):
+        self.backend = os.getenv("RERANK_BACKEND", "llm").lower()
+        if self.backend not in RERANK_BACKENDS:
+            raise ValueError(f"Unknown RERANK_BACKEND: {self.backend}")
+        # Candidate depth starts small and doubles while the shortlist is thin
+        self.min_candidates = int(os.getenv("RERANK_MIN_CANDIDATES", "8"))
+        self.max_candidates = int(os.getenv("RERANK_MAX_CANDIDATES", "32"))
+        # Passages scoring below the threshold (0..1) are dropped from the prompt
+        self.threshold = float(os.getenv("RERANK_THRESHOLD", "0.5"))
+        self.max_passages = int(os.getenv("RERANK_MAX_PASSAGES", "3"))
+        # Best vector matches kept when none passes the threshold, so the answer still has context
+        self.fallback_passages = int(os.getenv("RERANK_FALLBACK_PASSAGES", "1"))
+        # Stop widening once vector scores fall this far below the best candidate
+        self.score_margin = float(os.getenv("RERANK_SCORE_MARGIN", "0.15"))
+        self.passage_chars = int(os.getenv("RERANK_PASSAGE_CHARS", "1000"))
+        self.cache_size = int(os.getenv("RERANK_CACHE_SIZE", "10000"))
+        self._cache: "OrderedDict[Tuple[bytes, bytes], float]" = OrderedDict()
+        # "" keeps the scores in memory only
+        self.cache_path = os.getenv("RERANK_CACHE_PATH", "data/rerank_cache")
+        self.save_interval = float(os.getenv("RERANK_CACHE_SAVE_INTERVAL", "60"))
+        self._cache_changed = False
+        self._save_task: Optional[asyncio.Task] = None
+        self.model = None
+        metrics_service.describe("rerank_cache_hits_total", "Passage scores served from the rerank cache")
+        metrics_service.describe("rerank_cache_misses_total", "Passage scores computed by the rerank backend")
+        metrics_service.describe("rerank_candidate_depth", "Candidates retrieved before the passages were selected")
+        if self.backend == "cross-encoder":
+            self._load_cross_encoder()
+        if self.enabled and self.cache_path:
+            self._load_cache()
+        logger.info(f"Rerank service initialized successfully (backend: {self.backend})")
+
+    def _load_cross_encoder(self):
+        try:
+            from sentence_transformers import CrossEncoder
+        except ImportError:
+            logger.warning("sentence-transformers is not installed, falling back to LLM reranking")
+            self.backend = "llm"
+            return
+        # Multilingual model, so Ukrainian queries and passages are scored properly
+        self.model = CrossEncoder(self._cross_encoder_name())
+
+    @staticmethod
+    def _cross_encoder_name() -> str:
+        return os.getenv("RERANK_CROSS_ENCODER_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+
+    def _scorer(self) -> Dict[str, Any]:
+        """What the cached scores depend on; a snapshot from another scorer is not loaded"""
+        model = self._cross_encoder_name() if self.backend == "cross-encoder" else openai_service.rerank_model
+        return {"backend": self.backend, "model": model, "passage_chars": self.passage_chars}
+
+    def _load_cache(self):
+        # The snapshot helpers pull in numpy, which bot startup should not load
+        from .snapshot import load_snapshot
+
+        try:
+            snapshot = load_snapshot(os.path.join(self.cache_path, "scores"))
+            if snapshot is None:
+                return
+            manifest, arrays = snapshot
+            if manifest.get("scorer") != self._scorer():
+                logger.info("Rerank scorer changed since the cached scores were saved, starting empty")
+                return
+            start = max(0, len(arrays["scores"]) - self.cache_size)
+            keys = arrays["keys"][start:].tobytes()
+            pair = 2 * DIGEST_SIZE
+            self._cache = OrderedDict(
+                ((keys[i * pair:i * pair + DIGEST_SIZE], keys[i * pair + DIGEST_SIZE:(i + 1) * pair]), score)
+                for i, score in enumerate(arrays["scores"][start:].tolist())
+            )
+            logger.info(f"Loaded {len(self._cache)} cached rerank scores")
+        except Exception as e:
+            # The cache only saves rerank calls, so a bad snapshot is not fatal
+            logger.error(f"Error loading rerank cache: {str(e)}")
+
+    async def save_cache(self):
+        """Snapshot the score cache if it gained scores since the last save"""
+        if not self._cache_changed or not self.cache_path:
+            return
+        import numpy as np
+        from .snapshot import write_snapshot
+
+        self._cache_changed = False
+        # Copied on the event loop, where score() changes the cache, and written in a thread
+        keys = b"".join(query + passage for query, passage in self._cache)
+        arrays = {
+            "keys": np.frombuffer(keys, dtype=np.uint8).reshape(-1, 2 * DIGEST_SIZE),
+            "scores": np.fromiter(self._cache.values(), dtype=np.float32, count=len(self._cache)),
+        }
+        os.makedirs(self.cache_path, exist_ok=True)
+        await asyncio.to_thread(write_snapshot, os.path.join(self.cache_path, "scores"), {"scorer": self._scorer()}, arrays)
+
+    async def start(self):
+        if self.enabled and self.cache_path and self._save_task is None:
+            self._save_task = asyncio.create_task(self._run_saver())
+
+    async def stop(self):
+        if self._save_task is not None:
+            self._save_task.cancel()
+            try:
+                await self._save_task
+            except asyncio.CancelledError:
+                pass
+            self._save_task = None
+        await self.save_cache()
+
+    async def _run_saver(self):
+        while True:
+            await asyncio.sleep(self.save_interval)
+            try:
+                await self.save_cache()
+            except Exception as e:
+                logger.error(f"Error saving rerank cache: {str(e)}")
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend != "none"
+
+    async def _score_uncached(self, query: str, passages: List[str]) -> List[float]:
+        if self.backend == "cross-encoder":
+            logits = await asyncio.to_thread(self.model.predict, [(query, passage) for passage in passages])
+            return [1 / (1 + math.exp(-float(logit))) for logit in logits]
+        return await openai_service.score_passages(query, passages)
+
+    async def score(self, query: str, matches: List[Any]) -> List[float]:
+        """Relevance of every match to the query, between 0 and 1"""
+        query_key = _digest(query)
+        keys = [(query_key, _digest(match.metadata["text"])) for match in matches]
+        scores = [self._cache.get(key) for key in keys]
+        missing = [i for i, score in enumerate(scores) if score is None]
+        metrics_service.inc("rerank_cache_hits_total", len(matches) - len(missing))
+        metrics_service.inc("rerank_cache_misses_total", len(missing))
+
+        if missing:
+            passages = [matches[i].metadata["text"][:self.passage_chars] for i in missing]
+            with metrics_service.timer("rerank", backend=self.backend):
+                fresh = await self._score_uncached(query, passages)
+            for i, score in zip(missing, fresh):
+                scores[i] = score
+                self._cache[keys[i]] = score
+            self._cache_changed = True
+
+        for key in keys:
+            self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return scores
+
+    def should_widen(self, candidates: List[Any], depth: int, relevant: int) -> bool:
+        """Fetch more candidates only while the shortlist is thin and deeper matches may still be close"""
+        if relevant >= self.max_passages or depth >= self.max_candidates or len(candidates) < depth:
+            return False
+        return candidates[-1].score >= candidates[0].score - self.score_margin
+
+    def select(self, matches: List[Any], scores: List[float]) -> List[Any]:
+        """Best passages above the threshold, most relevant first"""
+        ranked = sorted(zip(matches, scores), key=lambda pair: pair[1], reverse=True)
+        return [match for match, score in ranked if score >= self.threshold][:self.max_passages]
+
+# Create lazily constructed singleton instance
+rerank_service = LazyService(RerankService, "rerank")
@@ -0,0 +1,261 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Deque, Dict, Optional
+from loguru import logger
+
+# HTTP statuses worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# Transport-level errors raised by the OpenAI (httpx) and Pinecone (urllib3) clients
+RETRYABLE_ERROR_NAMES = {
+    "APIConnectionError",
+    "APITimeoutError",
+    "ConnectionError",
+    "TimeoutError",
+    "MaxRetryError",
+    "ProtocolError",
+}
+
+
+class CircuitOpenError(Exception):
+    """Raised when calls to an endpoint are short-circuited by its breaker"""
+
+    def __init__(self, endpoint: str, retry_in: float):
+        super().__init__(f"Circuit for {endpoint} is open, retry in {retry_in:.1f}s")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+def _get_status_code(error: Exception) -> Optional[int]:
+    """Get HTTP status code from an OpenAI or Pinecone exception"""
+    for attr in ("status_code", "status"):
+        value = getattr(error, attr, None)
+        if isinstance(value, int):
+            return value
+    value = getattr(getattr(error, "response", None), "status_code", None)
+    return value if isinstance(value, int) else None
+
+
+def _get_retry_after(error: Exception) -> Optional[float]:
+    """Get the server-requested delay in seconds from Retry-After headers"""
+    headers = getattr(error, "headers", None)
+    if headers is None:
+        headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+
+    headers = {str(key).lower(): value for key, value in headers.items()}
+    if "retry-after-ms" in headers:
+        try:
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+        except (TypeError, ValueError):
+            pass
+
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Check whether an upstream error is transient"""
+    status_code = _get_status_code(error)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__)
+
+
+class RetryPolicy:
+    """Jittered exponential backoff that honours Retry-After"""
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def get_delay(self, attempt: int, error: Exception) -> Optional[float]:
+        """Return delay before the next attempt, or None to give up"""
+        if attempt >= self.max_attempts:
+            return None
+
+        retry_after = _get_retry_after(error)
+        if retry_after is not None:
+            # Waiting less than the server asked for only burns an attempt
+            if retry_after > self.max_delay:
+                return None
+            return retry_after + random.uniform(0, self.base_delay)
+
+        # Full jitter keeps concurrent retries from synchronising
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def record(self, latency: float):
+        self.samples.append(latency)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return ordered[index]
+
+
+class CircuitBreaker:
+    """Per-endpoint breaker: closed -> open after repeated failures -> half-open probe"""
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def before_call(self):
+        """Raise CircuitOpenError if the call must not reach the endpoint"""
+        if self.state == "open":
+            elapsed = time.monotonic() - self.opened_at
+            if elapsed < self.reset_timeout:
+                raise CircuitOpenError(self.name, self.reset_timeout - elapsed)
+            self.state = "half_open"
+            logger.info(f"Circuit for {self.name} is half-open, sending probe request")
+
+        if self.state == "half_open":
+            if self._probe_in_flight:
+                raise CircuitOpenError(self.name, self.reset_timeout)
+            self._probe_in_flight = True
+
+    def record_success(self):
+        if self.state != "closed":
+            logger.info(f"Circuit for {self.name} closed")
+        self.state = "closed"
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def release_probe(self):
+        """Free the probe slot of a call that ended without an answer, e.g. when it was cancelled"""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"Circuit for {self.name} opened after {self.failures} failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+
+class ResilienceService:
+    def __init__(self):
+        self.retry_policy = RetryPolicy(
+            max_attempts=int(os.getenv("RETRY_MAX_ATTEMPTS", "3")),
+            base_delay=float(os.getenv("RETRY_BASE_DELAY", "0.5")),
+            max_delay=float(os.getenv("RETRY_MAX_DELAY", "20")),
+        )
+        self.hedging_enabled = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+        self.hedge_percentile = float(os.getenv("HEDGE_PERCENTILE", "95"))
+        self.failure_threshold = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+        self.reset_timeout = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.latencies: Dict[str, LatencyTracker] = {}
+        logger.info("Resilience service initialized successfully")
+
+    def get_breaker(self, endpoint: str) -> CircuitBreaker:
+        if endpoint not in self.breakers:
+            self.breakers[endpoint] = CircuitBreaker(endpoint, self.failure_threshold, self.reset_timeout)
+        return self.breakers[endpoint]
+
+    def get_latency_tracker(self, endpoint: str) -> LatencyTracker:
+        if endpoint not in self.latencies:
+            self.latencies[endpoint] = LatencyTracker()
+        return self.latencies[endpoint]
+
+    async def call(self, endpoint: str, func: Callable[..., Any], *args, idempotent: bool = False, **kwargs) -> Any:
+        """
+        Call a blocking upstream client method with retries, hedging and circuit breaking
+        endpoint: Name used for the circuit breaker and latency stats, e.g. "openai.embeddings"
+        idempotent: Allow a hedged duplicate request when the first one is slow
+        """
+        breaker = self.get_breaker(endpoint)
+        attempt = 0
+
+        while True:
+            attempt += 1
+            breaker.before_call()
+            started = time.monotonic()
+            try:
+                if idempotent and self.hedging_enabled:
+                    result = await self._call_hedged(endpoint, func, args, kwargs)
+                else:
+                    result = await asyncio.to_thread(func, *args, **kwargs)
+            except Exception as e:
+                if not is_retryable_error(e):
+                    # The endpoint answered, so it is healthy even if the request was bad
+                    breaker.record_success()
+                    raise
+
+                delay = self.retry_policy.get_delay(attempt, e)
+                if delay is None or breaker.state == "half_open":
+                    # The breaker counts failed calls, not attempts; a failed probe reopens it at once
+                    breaker.record_failure()
+                    logger.error(f"{endpoint} failed after {attempt} attempt(s): {str(e)}")
+                    raise
+
+                logger.warning(f"{endpoint} attempt {attempt} failed ({str(e)}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # A cancelled call says nothing about the endpoint, but must not keep the probe slot
+                breaker.release_probe()
+                raise
+
+            breaker.record_success()
+            self.get_latency_tracker(endpoint).record(time.monotonic() - started)
+            return result
+
+    async def _call_hedged(self, endpoint: str, func: Callable[..., Any], args: tuple, kwargs: dict) -> Any:
+        """Send a duplicate request if the first one is slower than the hedge percentile"""
+        hedge_delay = self.get_latency_tracker(endpoint).percentile(self.hedge_percentile)
+        primary = asyncio.ensure_future(asyncio.to_thread(func, *args, **kwargs))
+        if hedge_delay is None:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+        if done:
+            return primary.result()
+
+        logger.info(f"Hedging {endpoint} request after {hedge_delay:.2f}s")
+        pending = {primary, asyncio.ensure_future(asyncio.to_thread(func, *args, **kwargs))}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    return task.result()
+                error = task.exception()
+        raise error
+
+# Create singleton instance
+resilience_service = ResilienceService()
@@ -0,0 +1,137 @@
+import json
+import os
+import re
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+import numpy as np
+from loguru import logger
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: writers of one snapshot are not serialised across processes
+    fcntl = None
+
+# Bumped whenever the layout changes; snapshots of another format are not loaded
+SNAPSHOT_FORMAT = 2
+
+
+def _fsync_replace(tmp_path: str, path: str):
+    with open(tmp_path, "rb+") as file:
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def _array_path(base: str, generation: int, name: str) -> str:
+    return f"{base}.{generation}.{name}.npy"
+
+
+@contextmanager
+def _writer_lock(base: str) -> Iterator[None]:
+    """Serialise writers of one snapshot, e.g. webhook workers sharing a data directory"""
+    if fcntl is None:
+        yield
+        return
+    with open(base + ".lock", "a") as file:
+        fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def read_manifest(base: str) -> Optional[Dict[str, Any]]:
+    """Manifest of the snapshot stored under `base`, or None if there is none"""
+    try:
+        with open(base + ".json", encoding="utf-8") as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def _prefetch(path: str):
+    """Ask the kernel to read a file into the page cache in the background"""
+    if not hasattr(os, "posix_fadvise"):
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+
+def load_snapshot(base: str, manifest: Optional[Dict[str, Any]] = None,
+                  prefetch: Iterable[str] = ()) -> Optional[Tuple[Dict[str, Any], Dict[str, np.ndarray]]]:
+    """
+    Manifest and arrays of a snapshot, or None if there is none.
+    Arrays are memory-mapped copy-on-write: loading only reads the headers, pages are
+    read from disk when first touched, and writes stay in memory.
+    prefetch: Arrays that will be read in full soon; their files are read ahead without blocking
+    """
+    manifest = manifest or read_manifest(base)
+    for attempt in range(3):
+        if manifest is None:
+            return None
+        if manifest.get("format") != SNAPSHOT_FORMAT:
+            # Overwriting a snapshot this version cannot read would lose it, so refuse to load
+            raise ValueError(f"Unsupported snapshot format {manifest.get('format')} in {base}.json")
+        try:
+            arrays = {
+                name: np.load(_array_path(base, manifest["generation"], name), mmap_mode="c")
+                for name in manifest["arrays"]
+            }
+            for name in prefetch:
+                _prefetch(_array_path(base, manifest["generation"], name))
+            return manifest, arrays
+        except FileNotFoundError:
+            # Another process replaced the generation while this one was reading it
+            if attempt == 2:
+                raise
+            manifest = read_manifest(base)
+
+
+def write_snapshot(base: str, manifest: Dict[str, Any], arrays: Dict[str, np.ndarray]):
+    """
+    Write a new generation of a snapshot.
+    Arrays go to files named after the generation and the manifest, which names the
+    generation, is replaced last. A reader therefore sees either the previous snapshot
+    or the new one, even after a crash mid-write. Files of older generations are removed.
+    """
+    with _writer_lock(base):
+        previous = read_manifest(base)
+        generation = (previous or {}).get("generation", 0) + 1
+        for name, array in arrays.items():
+            path = _array_path(base, generation, name)
+            with open(path + ".tmp", "wb") as file:
+                np.save(file, np.ascontiguousarray(array))
+            _fsync_replace(path + ".tmp", path)
+        manifest = dict(manifest, format=SNAPSHOT_FORMAT, generation=generation, arrays=sorted(arrays))
+        with open(base + ".json.tmp", "w", encoding="utf-8") as file:
+            json.dump(manifest, file, ensure_ascii=False)
+        _fsync_replace(base + ".json.tmp", base + ".json")
+        _remove_arrays(base, keep=generation)
+
+
+def remove_snapshot(base: str):
+    """Delete a snapshot, manifest first"""
+    with _writer_lock(base):
+        if read_manifest(base) is not None:
+            os.remove(base + ".json")
+        _remove_arrays(base, keep=None)
+
+
+def _remove_arrays(base: str, keep: Optional[int]):
+    directory, name = os.path.split(base)
+    pattern = re.compile(re.escape(name) + r"\.(\d+)\.[^.]+\.npy(\.tmp)?$")
+    stale = [
+        file_name for file_name in os.listdir(directory or ".")
+        if (match := pattern.match(file_name)) and int(match.group(1)) != keep
+    ]
+    for file_name in stale:
+        try:
+            os.remove(os.path.join(directory, file_name))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            # Windows does not delete files that are still mapped; the next save retries
+            logger.warning(f"Could not remove old snapshot file {file_name}: {str(e)}")
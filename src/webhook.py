@@ -0,0 +1,165 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+from typing import Any, Callable, Dict, List, Optional
+from aiohttp import web
+from loguru import logger
+from telegram import Bot, Update
+
+# Update fields that carry the chat an update belongs to
+CHAT_FIELDS = (
+    "message",
+    "edited_message",
+    "channel_post",
+    "edited_channel_post",
+    "my_chat_member",
+    "chat_member",
+    "chat_join_request",
+)
+
+
+def get_routing_key(update: Dict[str, Any]) -> int:
+    """Chat id of a raw update, falling back to the sender id"""
+    for field in CHAT_FIELDS:
+        if field in update:
+            return update[field]["chat"]["id"]
+    callback_query = update.get("callback_query")
+    if callback_query:
+        if callback_query.get("message"):
+            return callback_query["message"]["chat"]["id"]
+        return callback_query["from"]["id"]
+    for payload in update.values():
+        if isinstance(payload, dict) and "from" in payload:
+            return payload["from"]["id"]
+    return 0
+
+
+def run_worker(index: int, updates: multiprocessing.Queue):
+    """Worker process entry point: run a full Application fed by the dispatcher"""
+    from services.logging_setup import setup_logging
+
+    # Spawned processes start with loguru's defaults
+    setup_logging(worker=index)
+    asyncio.run(_serve_worker(index, updates))
+
+
+async def _serve_worker(index: int, updates: multiprocessing.Queue):
+    from bot import build_application
+    from services.metrics_service import metrics_service
+
+    # Each worker exposes its own metrics on the next port after the base one
+    if metrics_service.port:
+        metrics_service.port += index + 1
+
+    application = build_application(with_updater=False)
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    logger.info(f"Webhook worker {index} started (pid {os.getpid()})")
+
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            data = await loop.run_in_executor(None, updates.get)
+            if data is None:
+                break
+            await application.update_queue.put(Update.de_json(data, application.bot))
+    finally:
+        await application.stop()
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+        logger.info(f"Webhook worker {index} stopped")
+
+
+class WebhookDispatcher:
+    """
+    Receives Telegram webhook calls and hands updates to worker processes.
+    Updates are routed by chat id so a conversation is always handled by the same worker.
+    """
+
+    def __init__(self, workers: int, worker_target: Callable[[int, multiprocessing.Queue], None] = run_worker,
+                 secret_token: Optional[str] = None, queue_size: int = 1000):
+        context = multiprocessing.get_context("spawn")
+        self.secret_token = secret_token
+        self.queues: List[multiprocessing.Queue] = [context.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.processes = [
+            context.Process(target=worker_target, args=(i, self.queues[i]), name=f"bot-worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+        logger.info(f"Started {len(self.processes)} webhook workers")
+
+    def stop(self, timeout: float = 30):
+        for updates in self.queues:
+            updates.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"Worker {process.name} did not stop in time, terminating")
+                process.terminate()
+
+    def dispatch(self, update: Dict[str, Any]) -> bool:
+        """Queue an update for its worker; False means the worker is saturated"""
+        worker = get_routing_key(update) % len(self.queues)
+        try:
+            self.queues[worker].put_nowait(update)
+            return True
+        except queue.Full:
+            return False
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        if self.secret_token and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != self.secret_token:
+            return web.Response(status=403)
+        try:
+            update = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        # A non-2xx answer makes Telegram redeliver the update later
+        if not self.dispatch(update):
+            logger.warning("Worker queue is full, asking Telegram to retry")
+            return web.Response(status=503)
+        return web.Response()
+
+    def create_app(self, path: str) -> web.Application:
+        app = web.Application()
+        app.router.add_post(path, self.handle_update)
+        return app
+
+
+def run_webhook():
+    """Serve the webhook and run updates on WEBHOOK_WORKERS worker processes."""
+    workers = int(os.getenv("WEBHOOK_WORKERS", str(os.cpu_count() or 1)))
+    listen = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+    port = int(os.getenv("WEBHOOK_PORT", "8080"))
+    path = os.getenv("WEBHOOK_PATH", "/telegram")
+    public_url = os.getenv("WEBHOOK_URL")
+    secret_token = os.getenv("WEBHOOK_SECRET") or None
+    if not public_url:
+        raise ValueError("Missing required environment variable: WEBHOOK_URL")
+
+    dispatcher = WebhookDispatcher(workers, secret_token=secret_token)
+    app = dispatcher.create_app(path)
+
+    async def on_startup(app: web.Application):
+        dispatcher.start()
+        async with Bot(os.getenv("TELEGRAM_BOT_TOKEN")) as bot:
+            await bot.set_webhook(
+                url=public_url.rstrip("/") + path,
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=100,
+            )
+        logger.info(f"Webhook set to {public_url.rstrip('/') + path}")
+
+    async def on_cleanup(app: web.Application):
+        await asyncio.to_thread(dispatcher.stop)
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    web.run_app(app, host=listen, port=port, print=None)
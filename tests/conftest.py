@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Services are imported as top-level packages, as bot.py does
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
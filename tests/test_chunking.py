@@ -0,0 +1,22 @@
+import pytest
+
+from services.rag_service import RAGService
+
+
+def test_overlap_of_a_whole_chunk_fails_at_startup(monkeypatch):
+    monkeypatch.setenv("CHUNK_SIZE", "1000")
+    monkeypatch.setenv("CHUNK_OVERLAP", "250")
+
+    with pytest.raises(ValueError, match="CHUNK_OVERLAP"):
+        RAGService()
+
+
+def test_chunks_overlap_and_record_their_block(monkeypatch):
+    monkeypatch.setenv("CHUNK_SIZE", "16")
+    monkeypatch.setenv("CHUNK_OVERLAP", "1")
+    rag = RAGService()
+
+    # An empty block (a page without text) still counts, so block indexes stay page indexes
+    chunks = list(rag._iter_chunks(["a b c", "", "d e f g h"]))
+
+    assert chunks == [("a b c d", 0), ("d e f g", 2), ("g h", 2)]
@@ -0,0 +1,81 @@
+import asyncio
+import sqlite3
+from types import SimpleNamespace
+from typing import Any, Dict, List
+
+import pytest
+
+from services import client_context as client_context_module
+from services import database_service as database_service_module
+from services.client_context import ClientContextCache
+from services.database_service import DatabaseService
+from services.openai_service import OpenAIService
+
+
+class FakeClientDatabase:
+    """Stand-in for the client names the database service returns"""
+
+    def __init__(self, names: List[str]):
+        self.names_version = 1
+        self.clients = [{"id": i + 1, "full_name": name, "name_key": None} for i, name in enumerate(names)]
+
+    async def get_client_names(self) -> List[Dict[str, Any]]:
+        return self.clients
+
+
+@pytest.fixture
+def recognize(monkeypatch):
+    def recognize(names: List[str], text: str):
+        monkeypatch.setattr(client_context_module, "database_service", FakeClientDatabase(names))
+        cache = ClientContextCache()
+        cache.enabled = True
+        return asyncio.run(cache.recognize(text))
+    return recognize
+
+
+def test_inflected_name_is_recognised(recognize):
+    assert recognize(["Іван Петренко"], "Зустріч з Іваном Петренком") == 1
+    assert recognize(["Андрій Бондар"], "Поговорив з Андрієм Бондарем") == 1
+    assert recognize(["Марія Петрівська"], "Дзвінок Марії Петрівській") == 1
+
+
+def test_longer_surname_with_the_same_start_is_not_recognised(recognize):
+    assert recognize(["Іван Коваль"], "Зустріч з Іваном Ковальчуком") is None
+
+
+def test_all_name_words_must_match(recognize):
+    assert recognize(["Іван Коваль"], "Зустріч з Іваном") is None
+
+
+def test_most_recent_client_wins_a_tie(recognize):
+    assert recognize(["Іван Коваль", "Коваль Іван"], "Зустріч з Іваном Ковалем") == 2
+
+
+RESPONSE_WITH_CLIENT = """1. Інформація про клієнта
+Ім'я: Іван Петренко
+Вік: 35 років
+Продукт: страхування життя
+Ціль: накопичення
+"""
+
+
+def test_voice_query_without_confirmation_saves_no_client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    database = DatabaseService()
+    monkeypatch.setattr(database_service_module, "database_service", database)
+    monkeypatch.setattr(client_context_module, "database_service", database)
+    service = OpenAIService()
+
+    def create(**kwargs):
+        message = SimpleNamespace(role="assistant", content=RESPONSE_WITH_CLIENT)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+    service.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    response = asyncio.run(service.generate_response("Зустріч з Іваном Петренком", ""))
+
+    assert response == RESPONSE_WITH_CLIENT
+    assert database.names_version == 0
+    with sqlite3.connect(database.db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM clients").fetchone() == (0,)
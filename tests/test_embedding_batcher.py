@@ -0,0 +1,74 @@
+import asyncio
+from typing import List
+
+import pytest
+
+from services import embedding_batcher as embedding_batcher_module
+from services.embedding_batcher import PRIORITY_BULK, PRIORITY_QUERY, EmbeddingBatcher, estimate_tokens
+
+
+class FakeEmbeddings:
+    """Embeddings endpoint stub that records each call and fails calls containing a poisoned text"""
+
+    def __init__(self):
+        self.calls: List[List[str]] = []
+
+    async def create_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self.calls.append(list(texts))
+        await asyncio.sleep(0.01)
+        if "poison" in texts:
+            raise RuntimeError("400 invalid input")
+        return [[float(len(text))] for text in texts]
+
+
+@pytest.fixture
+def embeddings(monkeypatch) -> FakeEmbeddings:
+    embeddings = FakeEmbeddings()
+    monkeypatch.setattr(embedding_batcher_module, "openai_service", embeddings)
+    return embeddings
+
+
+@pytest.fixture
+def batcher(embeddings) -> EmbeddingBatcher:
+    batcher = EmbeddingBatcher()
+    batcher.enabled = True
+    batcher.window = 0.02
+    return batcher
+
+
+def test_failed_bulk_batch_does_not_fail_queries(batcher, embeddings):
+    async def run():
+        bulk = asyncio.ensure_future(batcher.embed(["chunk", "poison"], priority=PRIORITY_BULK))
+        query = asyncio.ensure_future(batcher.embed(["query"], priority=PRIORITY_QUERY))
+        results = await asyncio.gather(bulk, query, return_exceptions=True)
+        await batcher.stop()
+        return results
+
+    bulk, query = asyncio.run(run())
+
+    assert isinstance(bulk, RuntimeError)
+    assert query == [[5.0]]
+    assert sorted(embeddings.calls) == [["chunk", "poison"], ["query"]]
+
+
+def test_batches_are_capped_by_estimated_tokens(batcher, embeddings):
+    text = "слово " * 100
+    batcher.max_tokens = estimate_tokens(text) * 3
+
+    async def run():
+        results = await asyncio.gather(*(batcher.embed([text], priority=PRIORITY_BULK) for _ in range(7)))
+        await batcher.stop()
+        return results
+
+    results = asyncio.run(run())
+
+    assert len(results) == 7
+    assert [len(call) for call in embeddings.calls] == [3, 3, 1]
+
+
+def test_single_call_leaves_no_slot_for_queries(monkeypatch, embeddings):
+    monkeypatch.setenv("EMBEDDING_COALESCE", "true")
+    monkeypatch.setenv("EMBEDDING_MAX_CONCURRENT_CALLS", "1")
+
+    with pytest.raises(ValueError, match="EMBEDDING_MAX_CONCURRENT_CALLS"):
+        EmbeddingBatcher()
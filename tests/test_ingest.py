@@ -0,0 +1,86 @@
+import asyncio
+from typing import Iterator, List
+
+import pytest
+
+from services import rag_service as rag_service_module
+from services.rag_service import IngestBatch, RAGService
+
+
+class FakeVectorStore:
+    """Index stub holding stored vector ids"""
+
+    def __init__(self):
+        self.ids: List[str] = []
+
+    async def delete_vectors(self, ids: List[str], namespace: str = ""):
+        self.ids = [vector_id for vector_id in self.ids if vector_id not in set(ids)]
+
+    def request_save(self):
+        pass
+
+
+@pytest.fixture
+def store(monkeypatch) -> FakeVectorStore:
+    store = FakeVectorStore()
+    monkeypatch.setattr(rag_service_module, "pinecone_service", store)
+    return store
+
+
+@pytest.fixture
+def rag(monkeypatch, store) -> RAGService:
+    monkeypatch.setenv("CHUNK_SIZE", "16")
+    monkeypatch.setenv("CHUNK_OVERLAP", "1")
+    monkeypatch.setenv("EMBEDDING_BATCH_SIZE", "2")
+    rag = RAGService()
+
+    async def store_chunks(chunks):
+        await asyncio.sleep(0)
+        store.ids.extend(vector_id for _, vector_id, _, _ in chunks)
+
+    monkeypatch.setattr(rag, "_store_chunks", store_chunks)
+    return rag
+
+
+def broken_pdf() -> Iterator[str]:
+    """Pages that parse, then a page the parser chokes on"""
+    for page in range(5):
+        yield f"page {page} words here"
+    raise ValueError("corrupt page")
+
+
+def test_chunks_are_stored_while_the_document_streams(rag, store):
+    seen_while_parsing = []
+
+    def pages() -> Iterator[str]:
+        for page in range(10):
+            seen_while_parsing.append(len(store.ids))
+            yield f"page {page} words here"
+
+    async def run():
+        async with rag.ingest_batch() as batch:
+            return await batch.add(pages(), "doc")
+
+    stored = asyncio.run(run())
+
+    assert max(seen_while_parsing) > 0
+    assert store.ids == [f"doc_chunk_{i}" for i in range(stored)]
+
+
+def test_document_failing_mid_parse_leaves_nothing_stored(rag, store):
+    async def run():
+        batch = IngestBatch(rag)
+        results = await asyncio.gather(
+            batch.add(broken_pdf(), "broken"),
+            batch.add(["good document text " * 5], "good"),
+            return_exceptions=True,
+        )
+        await batch.close()
+        return batch, results
+
+    batch, (broken, good) = asyncio.run(run())
+
+    assert isinstance(broken, ValueError)
+    assert good > 0
+    assert store.ids == [f"good_chunk_{i}" for i in range(good)]
+    assert batch.stored == good
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from services import local_vector_store
+from services.local_vector_store import LocalVectorIndex
+
+
+def vectors(count: int, dimension: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    return [{"id": f"doc_chunk_{i}", "values": rng.standard_normal(dimension), "metadata": {"chunk_index": i}}
+            for i in range(count)]
+
+
+def test_upsert_with_another_dimension_is_rejected_whole(tmp_path):
+    index = LocalVectorIndex(str(tmp_path))
+    index.upsert(vectors(3, 8))
+
+    with pytest.raises(ValueError, match="EMBEDDING_DIMENSIONS"):
+        index.upsert(vectors(2, 8, seed=1)[:1] + vectors(1, 4))
+    assert index.describe_index_stats()["total_vector_count"] == 3
+
+
+def test_mixed_dimensions_in_a_new_namespace_are_rejected(tmp_path):
+    index = LocalVectorIndex(str(tmp_path))
+
+    with pytest.raises(ValueError, match="dimensions"):
+        index.upsert(vectors(1, 8) + vectors(1, 4), namespace="advisor-1")
+    assert "advisor-1" not in index.partitions
+
+
+def test_query_with_another_dimension_is_rejected(tmp_path):
+    index = LocalVectorIndex(str(tmp_path))
+    index.upsert(vectors(3, 8))
+
+    with pytest.raises(ValueError, match="dimensions"):
+        index.query([1.0] * 4)
+
+
+def test_unknown_quantization_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="binary"):
+        LocalVectorIndex(str(tmp_path), quantization="binary")
+
+
+def test_namespace_deleted_while_loading_is_skipped(tmp_path, monkeypatch):
+    index = LocalVectorIndex(str(tmp_path))
+    index.upsert(vectors(3, 8))
+    index.upsert(vectors(2, 8), namespace="advisor-1")
+    index.save()
+
+    # Another process removes the namespace between listing the directory and reading its manifest
+    real_read_manifest = local_vector_store.read_manifest
+    monkeypatch.setattr(local_vector_store, "read_manifest",
+                        lambda base: None if base.endswith("advisor-1") else real_read_manifest(base))
+
+    reloaded = LocalVectorIndex(str(tmp_path))
+    assert set(reloaded.partitions) == {""}
+    assert reloaded.describe_index_stats()["total_vector_count"] == 3
@@ -0,0 +1,103 @@
+import asyncio
+import sqlite3
+import time
+
+import pytest
+from telegram.ext import Application
+
+from services.persistence_service import SQLitePersistence
+
+
+@pytest.fixture
+def persistence(tmp_path, monkeypatch) -> SQLitePersistence:
+    monkeypatch.setenv("PERSISTENCE_CACHE_SIZE", "1")
+    return SQLitePersistence(db_path=str(tmp_path / "state.db"))
+
+
+def build(persistence: SQLitePersistence) -> Application:
+    application = Application.builder().token("123:TEST").persistence(persistence).updater(None).build()
+    persistence.attach_application(application)
+    return application
+
+
+async def handle(application: Application, persistence: SQLitePersistence, user_id: int) -> dict:
+    """Start processing an update from a user, as CallbackContext.refresh_data does"""
+    user_data = application.user_data[user_id]
+    await persistence.refresh_user_data(user_id, user_data)
+    return user_data
+
+
+async def finish(application: Application, user_id: int):
+    """Finish processing: PTB marks the user and hands the data over on its next run"""
+    application.mark_data_for_update_persistence(user_ids=user_id)
+    await application.update_persistence()
+
+
+def test_entry_with_update_in_flight_is_not_evicted(persistence):
+    async def run():
+        application = build(persistence)
+        first = await handle(application, persistence, 1)
+        await handle(application, persistence, 2)
+        await finish(application, 2)
+
+        await persistence._sweep()
+        # User 1 is over capacity but its handler still holds the dict
+        assert application.user_data.get(1) is first
+        first["draft"] = "Іван Коваль"
+        await finish(application, 1)
+
+        await handle(application, persistence, 2)
+        await finish(application, 2)
+        await persistence._sweep()
+        evicted = 1 not in application.user_data
+        # PTB's drop hook for the evicted user must keep the stored row
+        await application.update_persistence()
+        await persistence.flush()
+        return evicted
+
+    assert asyncio.run(run())
+    assert persistence._load_one("user_data", "1") == {"draft": "Іван Коваль"}
+
+
+def test_entry_used_again_before_its_drop_is_written(persistence):
+    async def run():
+        application = build(persistence)
+        first = await handle(application, persistence, 1)
+        first["draft"] = "old"
+        await finish(application, 1)
+        await handle(application, persistence, 2)
+        await finish(application, 2)
+        await persistence._sweep()
+        assert 1 not in application.user_data
+
+        # The user comes back before PTB has run its drop hook
+        again = await handle(application, persistence, 1)
+        assert again == {"draft": "old"}
+        again["draft"] = "new"
+        await finish(application, 1)
+        await persistence.flush()
+
+    asyncio.run(run())
+    assert persistence._load_one("user_data", "1") == {"draft": "new"}
+
+
+def test_sweep_purges_expired_rows_of_every_kind_but_bot_data(persistence):
+    persistence._write_batch({
+        ("user_data", "1"): '{"draft": "stale"}',
+        ("conversation:edit", "[1, 1]"): '1',
+        ("bot_data", "bot_data"): '{"counter": 1}',
+        ("user_data", "2"): '{"draft": "fresh"}',
+    })
+    with sqlite3.connect(persistence.db_path) as conn:
+        conn.execute("UPDATE persistence SET updated_at = ? WHERE key != '2'", (time.time() - 2 * persistence.ttl,))
+
+    async def run():
+        build(persistence)
+        await persistence._sweep(expire=True)
+        await persistence.flush()
+
+    asyncio.run(run())
+    with sqlite3.connect(persistence.db_path) as conn:
+        rows = sorted(conn.execute("SELECT kind, key FROM persistence").fetchall())
+    assert rows == [("bot_data", "bot_data"), ("user_data", "2")]
+    assert persistence._load("bot_data") == {"bot_data": {"counter": 1}}
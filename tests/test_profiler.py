@@ -0,0 +1,25 @@
+import gc
+
+from services.profiler import SamplingProfiler
+
+
+def test_gc_is_paused_while_sampling_and_restored_after():
+    profiler = SamplingProfiler()
+    assert gc.isenabled()
+    with profiler._gc_paused():
+        with profiler._gc_paused():
+            assert not gc.isenabled()
+        # The other sampler is still running
+        assert not gc.isenabled()
+    assert gc.isenabled()
+
+
+def test_gc_disabled_by_the_application_stays_disabled():
+    profiler = SamplingProfiler()
+    gc.disable()
+    try:
+        with profiler._gc_paused():
+            pass
+        assert not gc.isenabled()
+    finally:
+        gc.enable()
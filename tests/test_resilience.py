@@ -0,0 +1,198 @@
+import asyncio
+import threading
+import time
+from typing import List, Optional
+
+import pytest
+
+from services.resilience import CircuitOpenError, ResilienceService, RetryPolicy
+
+
+class UpstreamError(Exception):
+    """HTTP error shaped like the OpenAI and Pinecone client exceptions"""
+
+    def __init__(self, status_code: int, retry_after: Optional[str] = None):
+        super().__init__(f"upstream error {status_code}")
+        self.status_code = status_code
+        self.headers = {"retry-after": retry_after} if retry_after is not None else {}
+
+
+class FaultyUpstream:
+    """Local stub that plays back a script of failures and delays, one step per call"""
+
+    def __init__(self, script: List[object]):
+        self.script = list(script)
+        self.calls = 0
+        self.call_times: List[float] = []
+        self._lock = threading.Lock()
+
+    def __call__(self, value: str = "ok") -> str:
+        with self._lock:
+            self.calls += 1
+            self.call_times.append(time.monotonic())
+            step = self.script.pop(0) if self.script else None
+        if isinstance(step, Exception):
+            raise step
+        if isinstance(step, float):
+            time.sleep(step)
+        return value
+
+
+@pytest.fixture
+def service() -> ResilienceService:
+    service = ResilienceService()
+    service.retry_policy = RetryPolicy(max_attempts=3, base_delay=0.01, max_delay=1.0)
+    service.hedging_enabled = False
+    return service
+
+
+def test_429_waits_for_retry_after(service):
+    upstream = FaultyUpstream([UpstreamError(429, retry_after="0.2")])
+
+    result = asyncio.run(service.call("openai.chat", upstream))
+
+    assert result == "ok"
+    assert upstream.calls == 2
+    assert upstream.call_times[1] - upstream.call_times[0] >= 0.2
+
+
+def test_429_with_retry_after_beyond_max_delay_gives_up(service):
+    upstream = FaultyUpstream([UpstreamError(429, retry_after="60")])
+
+    with pytest.raises(UpstreamError):
+        asyncio.run(service.call("openai.chat", upstream))
+    assert upstream.calls == 1
+
+
+def test_5xx_is_retried_until_success(service):
+    upstream = FaultyUpstream([UpstreamError(503), UpstreamError(500)])
+
+    result = asyncio.run(service.call("pinecone.query", upstream, "matches"))
+
+    assert result == "matches"
+    assert upstream.calls == 3
+    assert service.get_breaker("pinecone.query").state == "closed"
+
+
+def test_4xx_is_not_retried(service):
+    upstream = FaultyUpstream([UpstreamError(400)])
+
+    with pytest.raises(UpstreamError):
+        asyncio.run(service.call("openai.chat", upstream))
+    assert upstream.calls == 1
+
+
+def test_breaker_counts_failed_calls_not_attempts(service):
+    breaker = service.get_breaker("openai.chat")
+    breaker.failure_threshold = 5
+    upstream = FaultyUpstream([UpstreamError(503)] * 6)
+
+    for _ in range(2):
+        with pytest.raises(UpstreamError):
+            asyncio.run(service.call("openai.chat", upstream))
+
+    # Six failed attempts, but only two failed calls
+    assert upstream.calls == 6
+    assert breaker.failures == 2
+    assert breaker.state == "closed"
+
+
+def test_breaker_opens_half_opens_and_closes(service):
+    service.retry_policy = RetryPolicy(max_attempts=1, base_delay=0.01, max_delay=1.0)
+    breaker = service.get_breaker("openai.embeddings")
+    breaker.failure_threshold = 2
+    breaker.reset_timeout = 0.1
+    upstream = FaultyUpstream([UpstreamError(503), UpstreamError(503)])
+
+    for _ in range(2):
+        with pytest.raises(UpstreamError):
+            asyncio.run(service.call("openai.embeddings", upstream))
+    assert breaker.state == "open"
+
+    # Open: calls are short-circuited without reaching the upstream
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(service.call("openai.embeddings", upstream))
+    assert upstream.calls == 2
+
+    time.sleep(0.12)
+    states = []
+
+    def probe():
+        states.append(breaker.state)
+        return upstream()
+
+    assert asyncio.run(service.call("openai.embeddings", probe)) == "ok"
+    assert states == ["half_open"]
+    assert breaker.state == "closed"
+
+
+def test_failed_probe_reopens_breaker(service):
+    breaker = service.get_breaker("openai.embeddings")
+    breaker.failure_threshold = 1
+    breaker.reset_timeout = 0.05
+    upstream = FaultyUpstream([UpstreamError(503)] * 4)
+
+    with pytest.raises(UpstreamError):
+        asyncio.run(service.call("openai.embeddings", upstream))
+    assert breaker.state == "open"
+    time.sleep(0.06)
+
+    with pytest.raises(UpstreamError):
+        asyncio.run(service.call("openai.embeddings", upstream))
+    assert breaker.state == "open"
+
+
+def test_hedge_fires_after_latency_percentile(service):
+    service.hedging_enabled = True
+    tracker = service.get_latency_tracker("openai.embeddings")
+    for _ in range(tracker.min_samples):
+        tracker.record(0.02)
+    # The first request stalls, the hedged duplicate answers at once
+    upstream = FaultyUpstream([0.5, None])
+
+    async def call():
+        started = time.monotonic()
+        result = await service.call("openai.embeddings", upstream, "vector", idempotent=True)
+        return result, time.monotonic() - started
+
+    result, elapsed = asyncio.run(call())
+
+    assert result == "vector"
+    assert upstream.calls == 2
+    assert upstream.call_times[1] - upstream.call_times[0] >= 0.02
+    assert elapsed < 0.4
+
+
+def test_no_hedge_without_latency_history(service):
+    service.hedging_enabled = True
+    upstream = FaultyUpstream([0.1])
+
+    assert asyncio.run(service.call("openai.embeddings", upstream, idempotent=True)) == "ok"
+    assert upstream.calls == 1
+
+
+def test_cancelled_probe_frees_the_breaker(service):
+    service.retry_policy = RetryPolicy(max_attempts=1, base_delay=0.01, max_delay=1.0)
+    breaker = service.get_breaker("openai.chat")
+    breaker.failure_threshold = 1
+    breaker.reset_timeout = 0.05
+    upstream = FaultyUpstream([UpstreamError(503), 0.5])
+
+    with pytest.raises(UpstreamError):
+        asyncio.run(service.call("openai.chat", upstream))
+    time.sleep(0.06)
+
+    async def cancel_probe():
+        probe = asyncio.ensure_future(service.call("openai.chat", upstream))
+        await asyncio.sleep(0.05)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+    asyncio.run(cancel_probe())
+
+    # The cancellation counts neither way, and the next call is let through as a new probe
+    assert breaker.state == "half_open"
+    assert breaker.failures == 1
+    assert asyncio.run(service.call("openai.chat", upstream)) == "ok"
+    assert breaker.state == "closed"
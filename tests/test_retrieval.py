@@ -0,0 +1,56 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+from services import rag_service as rag_service_module
+from services.rag_service import RAGService
+from services.rerank_service import RerankService
+
+
+def _match(i: int, score: float) -> SimpleNamespace:
+    return SimpleNamespace(id=f"doc_chunk_{i}", score=score, metadata={"text": f"passage {i}"})
+
+
+class FakeVectorStore:
+    """Vector store stub returning fixed matches, best first"""
+
+    def __init__(self, matches: List[SimpleNamespace]):
+        self.matches = matches
+
+    async def query_namespaces(self, vector: List[float], namespaces: List[str], top_k: int = 3,
+                               filter: Optional[Dict[str, Any]] = None) -> List[SimpleNamespace]:
+        return self.matches[:top_k]
+
+
+@pytest.fixture
+def retrieve(monkeypatch):
+    def retrieve(matches: List[SimpleNamespace], relevance: Dict[str, float]) -> List[Any]:
+        monkeypatch.setenv("RERANK_CACHE_PATH", "")
+        rerank = RerankService()
+
+        async def score(query: str, candidates: List[Any]) -> List[float]:
+            return [relevance.get(match.id, 0.0) for match in candidates]
+
+        monkeypatch.setattr(rerank, "score", score)
+        monkeypatch.setattr(rag_service_module, "rerank_service", rerank)
+        monkeypatch.setattr(rag_service_module, "pinecone_service", FakeVectorStore(matches))
+        return asyncio.run(RAGService()._retrieve("питання", [0.0], [""], None))
+    return retrieve
+
+
+def test_passages_below_the_threshold_are_dropped(retrieve):
+    matches = [_match(i, 0.9 - i * 0.01) for i in range(8)]
+
+    selected = retrieve(matches, {"doc_chunk_3": 0.9, "doc_chunk_1": 0.2})
+
+    assert [match.id for match in selected] == ["doc_chunk_3"]
+
+
+def test_best_vector_match_is_used_when_none_passes_the_threshold(retrieve):
+    matches = [_match(i, 0.9 - i * 0.01) for i in range(8)]
+
+    selected = retrieve(matches, {"doc_chunk_3": 0.2})
+
+    assert [match.id for match in selected] == ["doc_chunk_0"]